@@ -1,8 +1,10 @@
+import asyncio
 import os
+import time
 from datetime import datetime, timedelta
 from telegram.ext import ChatJoinRequestHandler
 
-from telegram import Update, ChatPermissions
+from telegram import Update, ChatPermissions, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -11,7 +13,8 @@ from telegram.ext import (
     filters,
     ConversationHandler,
     CallbackQueryHandler,
-    ChatMemberHandler
+    ChatMemberHandler,
+    TypeHandler
 )
 
 # Force Sub System
@@ -35,18 +38,60 @@ from force_sub import (
 from database import (
     groups_col,
     users_col,
+    users_counter_col,
+    users_config_col,
+    users_fresh_col,
     admins_col,
     force_config_col,
     force_channels_col,
     force_verified_col
 )
+
+import capture
+import counter_buffer
+import config_cache
+import cache_bus
+import log_digest
+import memory
+import reverify
+import rollups
+import startup
+import governor
+import metrics
+import mongo_breaker
+import mute_ledger
+import mongo_profiler
+import tenants
+from capacity import capacity
+from bulk_limits import import_limits, export_limits
+from compaction import compact_cmd, compaction_job, COMPACT_INTERVAL
+from mongo_profiler import slow_queries, explain_job, EXPLAIN_INTERVAL
+from bot_request import build_requests
+from lanes import PriorityUpdateProcessor
+from flood import flood_guard, flood_flush_job, FLOOD_DELETE_INTERVAL
+from rolling import TimestampRing, LIMIT_MODES, DEFAULT_WINDOW, format_wait
 # ---------------- ENV ----------------
 
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-OWNER_ID = int(os.getenv("OWNER_ID"))
 PORT = int(os.environ.get("PORT", 10000))
 RENDER_EXTERNAL_URL = os.getenv("RENDER_EXTERNAL_URL")
-LOG_CHAT_ID = int(os.getenv("LOG_CHAT_ID"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 1))
+BOT_API_URL = os.getenv("BOT_API_URL")
+
+# An unfinished /Sub_force conversation is dropped after this many seconds
+CONVERSATION_TIMEOUT = float(os.getenv("CONVERSATION_TIMEOUT", 600))
+
+# ---------------- MEMORY REPORT ----------------
+# Structures that bound themselves (or are flushed often), listed in /mem
+
+memory.register("breaker_user_flags", mongo_breaker.user_flags)
+memory.register("breaker_local_counts", mongo_breaker.local_counts)
+memory.register("mute_ledgers", mute_ledger.ledgers)
+memory.register("rollups_pending", rollups.pending)
+memory.register("log_digest", log_digest.events)
+memory.register("query_shapes", mongo_profiler.shapes)
+for kind, cache in config_cache.caches.items():
+    memory.register(f"cache_{kind}", cache)
 
 # ---------------- DATABASE ----------------
 # ---------------- DATABASE (MongoDB) ----------------
@@ -54,11 +99,15 @@ LOG_CHAT_ID = int(os.getenv("LOG_CHAT_ID"))
 
 # ---------------- LOGGING ----------------
 
-async def send_log(context: ContextTypes.DEFAULT_TYPE, text: str):
-    try:
-        await context.bot.send_message(chat_id=LOG_CHAT_ID, text=text)
-    except:
-        pass
+async def send_log(context: ContextTypes.DEFAULT_TYPE, text: str, kind=None, sample=None, urgent=False):
+    # Urgent events skip the digest, everything else is collapsed and
+    # sent in batches by log_digest
+    if urgent:
+        await log_digest.send_now(context.bot, text)
+        return
+
+    if log_digest.add(kind, text, sample):
+        await log_digest.flush(context.bot)
 
 # ---------------- HELPERS ----------------
 
@@ -78,6 +127,19 @@ def parse_time(time_str):
         return timedelta(days=num)
     return timedelta(minutes=5)
 
+def parse_window(window):
+    # Strict parse_time for rolling windows: no 5m fallback for unknown
+    # units and no zero/negative windows; None when invalid
+    if len(window) < 2 or window[-1] not in "smhd":
+        return None
+
+    try:
+        span = parse_time(window)
+    except ValueError:
+        return None
+
+    return span if span > timedelta(0) else None
+
 def reset_if_new_day(user_id, group_id):
     today = now().date().isoformat()
 
@@ -87,20 +149,22 @@ def reset_if_new_day(user_id, group_id):
     })
 
     if user and user.get("last_reset") != today:
-        users_col.update_one(
+        users_counter_col.update_one(
             {"user_id": user_id, "group_id": group_id},
             {"$set": {
                 "message_count": 0,
                 "last_reset": today
             }}
         )
+        return True
+
+    return False
 
 def is_up_admin(user_id):
-    if user_id == OWNER_ID:
+    if user_id == tenants.owner_id():
         return True
 
-    admin = admins_col.find_one({"user_id": user_id})
-    return admin is not None
+    return config_cache.is_admin(user_id)
 
 async def ext_up(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not is_up_admin(update.effective_user.id):
@@ -166,7 +230,7 @@ async def ext_up(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # ---- Ensure user exists in DB ----
-    users_col.update_one(
+    users_config_col.update_one(
         {"user_id": target_id, "group_id": group_id},
         {"$setOnInsert": {
             "user_id": target_id,
@@ -181,10 +245,11 @@ async def ext_up(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
     # ---- Apply Extended Limit ----
-    users_col.update_one(
+    users_config_col.update_one(
         {"user_id": target_id, "group_id": group_id},
         {"$set": {"extended_limit": new_limit}}
     )
+    mute_ledger.clear(group_id, target_id)
 
     await message.reply_text(
         f"✅ {target_name} এর নতুন limit set করা হয়েছে: {new_limit}"
@@ -192,7 +257,7 @@ async def ext_up(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 def get_limit(user_id, group_id):
     # Get group base limit
-    group = groups_col.find_one({"group_id": group_id})
+    group = config_cache.get_group(group_id)
     base_limit = group["message_limit"] if group and "message_limit" in group else 3
 
     # Get user extended limit
@@ -206,71 +271,185 @@ def get_limit(user_id, group_id):
 
     return base_limit
 
-# ---------------- MESSAGE TRACKER ----------------
+def rolling_window(group):
+    # Window length in seconds for rolling-mode groups, None for daily mode
+    if not group or group.get("limit_mode", "daily") != "rolling":
+        return None
 
-async def track_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_chat.type not in ["group", "supergroup"]:
-        return
+    return int(parse_time(group.get("window", DEFAULT_WINDOW)).total_seconds())
 
-    group_id = update.effective_chat.id
-    user = update.effective_user
-    user_id = user.id
+# ---------------- MESSAGE TRACKER ----------------
 
-    # ---- Check if group authorized ----
-    group = groups_col.find_one({"group_id": group_id})
-    if not group:
-        return
+def count_message(user_id, group_id, today, window):
+    # Counts one request in Mongo. Returns (count, limit, wait), or None
+    # for users that bypass the limit.
 
-    today = now().date().isoformat()
+    # ---- Write-behind counter already knows this user today? ----
+    buffered = counter_buffer.enabled() and not window
+    known = buffered and counter_buffer.get_count(user_id, group_id, today) is not None
 
-    # ---- Ensure user exists ----
-    users_col.update_one(
-        {"user_id": user_id, "group_id": group_id},
-        {"$setOnInsert": {
-            "user_id": user_id,
-            "group_id": group_id,
-            "message_count": 0,
-            "extended_limit": None,
-            "is_special": False,
-            "rem_until": None,
-            "last_reset": today
-        }},
-        upsert=True
-    )
+    # First message of the day for this user (feeds the unique-user rollup)
+    new_today = False
+
+    if not known:
+        # ---- Ensure user exists ----
+        result = users_col.update_one(
+            {"user_id": user_id, "group_id": group_id},
+            {"$setOnInsert": {
+                "user_id": user_id,
+                "group_id": group_id,
+                "message_count": 0,
+                "extended_limit": None,
+                "is_special": False,
+                "rem_until": None,
+                "last_reset": today
+            }},
+            upsert=True
+        )
 
-    # ---- Daily reset check ----
-    reset_if_new_day(user_id, group_id)
+        # ---- Daily reset check ----
+        reset = reset_if_new_day(user_id, group_id)
+        new_today = result.upserted_id is not None or reset
 
     user_data = users_col.find_one({
         "user_id": user_id,
         "group_id": group_id
     })
 
-    count = user_data.get("message_count", 0)
+    if buffered:
+        if not known:
+            counter_buffer.load(user_id, group_id, today, user_data.get("message_count", 0))
+        count = counter_buffer.get_count(user_id, group_id, today)
+    else:
+        count = user_data.get("message_count", 0)
     is_special = user_data.get("is_special", False)
     rem_until = user_data.get("rem_until")
 
+    # Enough to keep enforcing if Mongo goes away
+    flags = {
+        "day": today,
+        "count": count,
+        "is_special": is_special,
+        "rem_until": rem_until,
+        "extended_limit": user_data.get("extended_limit")
+    }
+    mongo_breaker.remember(user_id, group_id, flags)
+
     # ---- Temporary unlimited check ----
     if rem_until:
         if now() < datetime.fromisoformat(rem_until):
-            return
+            return None
 
     # ---- Special member bypass ----
     if is_special:
-        return
+        return None
+
+    limit = get_limit(user_id, group_id)
+    wait = 0
+
+    rollups.record(group_id, "requests")
+    if new_today:
+        rollups.record(group_id, "unique_users")
 
     # ---- Increase message count ----
-    count += 1
+    if window:
+        # Rolling mode: only the ring decides, message_count just keeps
+        # today's accepted requests for /top
+        ring = TimestampRing.load(user_data.get("ring"), limit)
+        ts = int(time.time())
+        state = ring.hit(ts, window)
+
+        if state != "over":
+            users_counter_col.update_one(
+                {"user_id": user_id, "group_id": group_id},
+                {"$set": {"ring": ring.dump()}, "$inc": {"message_count": 1}}
+            )
 
-    users_col.update_one(
-        {"user_id": user_id, "group_id": group_id},
-        {"$set": {"message_count": count}}
-    )
+        count = {"ok": 0, "last": limit, "over": limit + 1}[state]
+        wait = ring.next_free(ts, window)
+        flags["count"] = ring.count(ts, window)
+    elif buffered:
+        count = counter_buffer.increment(user_id, group_id)
+        flags["count"] = count
 
-    limit = get_limit(user_id, group_id)
+        if counter_buffer.should_flush():
+            counter_buffer.flush()
+    else:
+        count += 1
+        flags["count"] = count
 
-    # ---- Warning before max ----
-    if count == limit:
+        users_counter_col.update_one(
+            {"user_id": user_id, "group_id": group_id},
+            {"$set": {"message_count": count}}
+        )
+
+    return count, limit, wait
+
+def count_offline(user_id, group_id, group, today, window):
+    # Mongo is down: decide from the last seen user flags and local
+    # counters, the increments are replayed by mongo_breaker later
+    flags = mongo_breaker.flags_for(user_id, group_id)
+    rem_until = flags.get("rem_until")
+
+    if rem_until and now() < datetime.fromisoformat(rem_until):
+        return None
+
+    if flags.get("is_special"):
+        return None
+
+    limit = flags.get("extended_limit") or group.get("message_limit", 3)
+
+    rollups.record(group_id, "requests")
+    metrics.inc("mongo_offline_decisions")
+
+    if not window and counter_buffer.enabled() and counter_buffer.get_count(user_id, group_id, today) is not None:
+        # The write-behind counter keeps (and later flushes) the increment
+        count = counter_buffer.increment(user_id, group_id)
+    else:
+        count = mongo_breaker.count_local(user_id, group_id, today)
+
+    # Rolling groups: counted from the last ring seen, a user over the
+    # limit is told to wait a full window
+    return count, limit, window or 0
+
+async def track_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_chat.type not in ["group", "supergroup"]:
+        return
+
+    group_id = update.effective_chat.id
+    user = update.effective_user
+    user_id = user.id
+
+    # ---- Check if group authorized ----
+    group = config_cache.get_group(group_id)
+    if not group:
+        return
+
+    today = now().date().isoformat()
+
+    window = rolling_window(group)
+
+    # ---- Count in Mongo, or in memory while it is unreachable ----
+    online = mongo_breaker.available()
+
+    if online:
+        try:
+            result = count_message(user_id, group_id, today, window)
+            mongo_breaker.success()
+        except mongo_breaker.MONGO_DOWN_ERRORS as e:
+            mongo_breaker.failure(e)
+            online = False
+
+    if not online:
+        result = count_offline(user_id, group_id, group, today, window)
+
+    if result is None:
+        return
+
+    count, limit, wait = result
+
+    # ---- Warning before max (skipped under load) ----
+    if count == limit and governor.allows("warning"):
         await update.message.reply_html(
             f"⚠️ <b>প্রিয় {user.mention_html()},\nআপনি কেবলমাত্র আর ১টি মুভি/সিরিজ রিকোয়েস্ট করতে পারবেন!\n\nধন্যবাদ🙏</b>"
         )
@@ -280,12 +459,30 @@ async def track_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
         mute_enabled = group.get("mute_enabled", 1)
         mute_time = group.get("mute_time", "5m")
 
-        await update.message.reply_html(
-            f"🚫 প্রিয় {user.mention_html()}\nআপনি আজকের সর্বোচ্চ Movie Request limit এ পৌঁছে গেছেন। আবার আগামীকাল Request করবেন!\n\nধন্যবাদ"
-        )
+        rollups.record(group_id, "limit_hits")
+
+        # Already told (and muted): no new notice or restrict call until
+        # the mute ends or the day rolls over
+        if mute_ledger.active(group_id, user_id):
+            return
+
+        until = now() + parse_time(mute_time) if mute_enabled else None
+
+        # Recorded before any await so concurrent messages of the same
+        # user already see it
+        mute_ledger.record(group_id, user_id, until=until, wait=wait)
+
+        if window:
+            await update.message.reply_html(
+                f"🚫 প্রিয় {user.mention_html()}\nআপনি সর্বোচ্চ Movie Request limit এ পৌঁছে গেছেন। আবার {format_wait(wait)} পরে Request করবেন!\n\nধন্যবাদ"
+            )
+        else:
+            await update.message.reply_html(
+                f"🚫 প্রিয় {user.mention_html()}\nআপনি আজকের সর্বোচ্চ Movie Request limit এ পৌঁছে গেছেন। আবার আগামীকাল Request করবেন!\n\nধন্যবাদ"
+            )
 
         if mute_enabled:
-            until = now() + parse_time(mute_time)
+            rollups.record(group_id, "mutes")
 
             await context.bot.restrict_chat_member(
                 group_id,
@@ -302,7 +499,9 @@ async def bot_added(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Log
         await send_log(
             context,
-            f"➕ Bot added to group\nName: {chat.title}\nID: {chat.id}"
+            f"➕ Bot added to group\nName: {chat.title}\nID: {chat.id}",
+            kind="bot_added",
+            sample=f"{chat.title} ({chat.id})"
         )
 
         # Group message
@@ -312,7 +511,7 @@ async def bot_added(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 async def add_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != OWNER_ID:
+    if update.effective_user.id != tenants.owner_id():
         return
 
     if not context.args:
@@ -337,12 +536,15 @@ async def add_group(update: Update, context: ContextTypes.DEFAULT_TYPE):
         upsert=True
     )
 
+    cache_bus.publish("group", group_id)
+
     await update.message.reply_text("Group authorized successfully.")
 
     # ---- LOG ----
     await send_log(
         context,
-        f"✅ New Group Authorized\nGroup ID: {group_id}\nAuthorized By: {update.effective_user.full_name}\nUser ID: {update.effective_user.id}"
+        f"✅ New Group Authorized\nGroup ID: {group_id}\nAuthorized By: {update.effective_user.full_name}\nUser ID: {update.effective_user.id}",
+        urgent=True
     )
 
 async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -352,6 +554,28 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     group_id = update.effective_chat.id
     message = update.message
 
+    # ---- Bulk mode: /stats id1 id2 ... ----
+    if context.args and len(context.args) >= 2:
+        try:
+            ids = sorted({int(a) for a in context.args})
+        except:
+            await message.reply_text("Usage: /stats id1 id2 ...")
+            return
+
+        counter_buffer.flush()
+
+        text, keyboard = bulk_stats_page(group_id, ids)
+        sent = await message.reply_html(text, reply_markup=keyboard)
+
+        # Keyed by the reply, so several admins can page their own lists
+        if keyboard:
+            lists = context.chat_data.setdefault("bulk_stats", {})
+            # str keys: chat_data is spilled to Mongo as BSON (memory.py)
+            lists[str(sent.message_id)] = ids
+            while len(lists) > BULK_STATS_KEEP:
+                del lists[next(iter(lists))]
+        return
+
     user_id = None
     username = None
 
@@ -385,7 +609,9 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         username = target.full_name
 
     # ---- Fetch Data ----
-    user_data = users_col.find_one({
+    counter_buffer.flush()
+
+    user_data = users_fresh_col.find_one({
         "user_id": user_id,
         "group_id": group_id
     })
@@ -399,6 +625,20 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     is_special = user_data.get("is_special", False)
 
     limit = get_limit(user_id, group_id)
+    window = rolling_window(config_cache.get_group(group_id))
+    mode_text = "Daily"
+
+    # ---- Rolling mode counts the ring, not message_count ----
+    if window:
+        ring = TimestampRing.load(user_data.get("ring"), limit)
+        ts = int(time.time())
+        message_count = ring.count(ts, window)
+        mode_text = f"Rolling {format_wait(window)}"
+
+        wait = ring.next_free(ts, window)
+        if wait:
+            mode_text += f" (next slot in {format_wait(wait)})"
+
     remaining = max(limit - message_count, 0)
 
     special_status = "Yes" if is_special else "No"
@@ -408,6 +648,7 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"📊 User Stats\n\n"
         f"Name: {username}\n"
         f"User ID: {user_id}\n\n"
+        f"Mode: {mode_text}\n"
         f"Used: {message_count}/{limit}\n"
         f"Remaining: {remaining}\n\n"
         f"Extended Limit: {ext_text}\n"
@@ -415,8 +656,147 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     
 
+# ---------------- LEADERBOARD & BULK STATS ----------------
+
+PAGE_SIZE = 10
+
+# Bulk /stats id lists kept per chat for the Next button
+BULK_STATS_KEEP = 20
+
+def user_link(user_id):
+    return f'<a href="tg://user?id={user_id}">{user_id}</a>'
+
+def top_query(group_id, cursor=None, backwards=False):
+    # Keyset pagination on (group_id, last_reset, message_count, user_id),
+    # each page is one index range scan no matter how big the group is
+    today = now().date().isoformat()
+    query = {"group_id": group_id, "last_reset": today, "message_count": {"$gt": 0}}
+    sort = [("message_count", -1), ("user_id", 1)]
+
+    if cursor:
+        count, user_id = cursor
+
+        if backwards:
+            query["$or"] = [
+                {"message_count": {"$gt": count}},
+                {"message_count": count, "user_id": {"$lt": user_id}}
+            ]
+            sort = [("message_count", 1), ("user_id", -1)]
+        else:
+            query["$or"] = [
+                {"message_count": {"$lt": count}},
+                {"message_count": count, "user_id": {"$gt": user_id}}
+            ]
+
+    docs = list(
+        users_fresh_col.find(query, {"_id": 0, "user_id": 1, "message_count": 1})
+        .sort(sort)
+        .limit(PAGE_SIZE + 1)
+    )
+
+    more = len(docs) > PAGE_SIZE
+    docs = docs[:PAGE_SIZE]
+
+    if backwards:
+        docs.reverse()
+
+    return docs, more
+
+def top_page(group_id, cursor=None, backwards=False):
+    docs, more = top_query(group_id, cursor, backwards)
+
+    if not docs:
+        return "No requests today.", None
+
+    lines = ["🏆 <b>Top requesters today</b>\n"]
+    for doc in docs:
+        lines.append(f"{user_link(doc['user_id'])} — {doc['message_count']}")
+
+    has_prev = bool(cursor) and (more or not backwards)
+    has_next = more if not backwards else bool(cursor)
+
+    first, last = docs[0], docs[-1]
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton(
+            "⬅️ Prev", callback_data=f"top:p:{first['message_count']}:{first['user_id']}"
+        ))
+    if has_next:
+        buttons.append(InlineKeyboardButton(
+            "Next ➡️", callback_data=f"top:n:{last['message_count']}:{last['user_id']}"
+        ))
+
+    return "\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
+
+def bulk_stats_page(group_id, ids, after=None):
+    # ids are sorted: PAGE_SIZE requested ids per page (found or not), one
+    # $in query each, keyset on the last requested id of the page
+    remaining = [i for i in ids if after is None or i > after]
+    page_ids = remaining[:PAGE_SIZE]
+    more = len(remaining) > PAGE_SIZE
+
+    docs = users_fresh_col.find({"group_id": group_id, "user_id": {"$in": page_ids}})
+    found = {doc["user_id"]: doc for doc in docs}
+
+    group = config_cache.get_group(group_id)
+    base_limit = group["message_limit"] if group and "message_limit" in group else 3
+    today = now().date().isoformat()
+
+    lines = ["📊 <b>Bulk Stats</b>\n"]
+    for user_id in page_ids:
+        doc = found.get(user_id)
+        if not doc:
+            lines.append(f"{user_link(user_id)} — no data")
+            continue
+
+        used = doc.get("message_count", 0) if doc.get("last_reset") == today else 0
+        limit = doc.get("extended_limit") or base_limit
+        flags = " ⭐" if doc.get("is_special") else ""
+        lines.append(f"{user_link(user_id)} — {used}/{limit}{flags}")
+
+    keyboard = None
+    if more:
+        keyboard = InlineKeyboardMarkup([[InlineKeyboardButton(
+            "Next ➡️", callback_data=f"bst:{page_ids[-1]}"
+        )]])
+
+    return "\n".join(lines), keyboard
+
+async def top(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_up_admin(update.effective_user.id):
+        return
+
+    counter_buffer.flush()
+
+    text, keyboard = top_page(update.effective_chat.id)
+    await update.message.reply_html(text, reply_markup=keyboard)
+
+async def page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+
+    if not is_up_admin(query.from_user.id):
+        return
+
+    group_id = query.message.chat.id
+    parts = query.data.split(":")
+
+    if parts[0] == "top":
+        text, keyboard = top_page(
+            group_id,
+            cursor=(int(parts[2]), int(parts[3])),
+            backwards=parts[1] == "p"
+        )
+    else:
+        ids = context.chat_data.get("bulk_stats", {}).get(str(query.message.message_id))
+        if not ids:
+            return
+        text, keyboard = bulk_stats_page(group_id, ids, after=int(parts[1]))
+
+    await query.edit_message_text(text, reply_markup=keyboard, parse_mode="HTML")
+
 async def up_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != OWNER_ID:
+    if update.effective_user.id != tenants.owner_id():
         return
 
     if not context.args:
@@ -434,11 +814,12 @@ async def up_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
         {"$set": {"user_id": user_id}},
         upsert=True
     )
+    cache_bus.publish("admins")
 
     await update.message.reply_text("User promoted to Stats Admin.")
 
 async def sp_mem(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != OWNER_ID:
+    if update.effective_user.id != tenants.owner_id():
         return
 
     if not context.args:
@@ -454,7 +835,7 @@ async def sp_mem(update: Update, context: ContextTypes.DEFAULT_TYPE):
     group_id = update.effective_chat.id
 
     # Ensure user document exists
-    users_col.update_one(
+    users_config_col.update_one(
         {"user_id": user_id, "group_id": group_id},
         {"$setOnInsert": {
             "user_id": user_id,
@@ -469,15 +850,16 @@ async def sp_mem(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
     # Set special member
-    users_col.update_one(
+    users_config_col.update_one(
         {"user_id": user_id, "group_id": group_id},
         {"$set": {"is_special": True}}
     )
+    mute_ledger.clear(group_id, user_id)
 
     await update.message.reply_text("Special member added.")
 
 async def ext_lim(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != OWNER_ID:
+    if update.effective_user.id != tenants.owner_id():
         return
 
     if not context.args or len(context.args) < 2:
@@ -494,7 +876,7 @@ async def ext_lim(update: Update, context: ContextTypes.DEFAULT_TYPE):
     group_id = update.effective_chat.id
 
     # Ensure user document exists
-    users_col.update_one(
+    users_config_col.update_one(
         {"user_id": user_id, "group_id": group_id},
         {"$setOnInsert": {
             "user_id": user_id,
@@ -509,15 +891,16 @@ async def ext_lim(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
     # Update extended limit
-    users_col.update_one(
+    users_config_col.update_one(
         {"user_id": user_id, "group_id": group_id},
         {"$set": {"extended_limit": limit}}
     )
+    mute_ledger.clear(group_id, user_id)
 
     await update.message.reply_text("Extended limit updated.")
 
 async def mute_toggle(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != OWNER_ID:
+    if update.effective_user.id != tenants.owner_id():
         return
 
     if not context.args:
@@ -550,13 +933,15 @@ async def mute_toggle(update: Update, context: ContextTypes.DEFAULT_TYPE):
         {"group_id": group_id},
         {"$set": {"mute_enabled": value}}
     )
+    cache_bus.publish("group", group_id)
+    mute_ledger.clear(group_id)
 
     await update.message.reply_text(
         f"Mute {'enabled' if value else 'disabled'}."
     )
 
 async def set_mute(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != OWNER_ID:
+    if update.effective_user.id != tenants.owner_id():
         return
 
     if not context.args:
@@ -583,11 +968,13 @@ async def set_mute(update: Update, context: ContextTypes.DEFAULT_TYPE):
         {"group_id": group_id},
         {"$set": {"mute_time": mute_value}}
     )
+    cache_bus.publish("group", group_id)
+    mute_ledger.clear(group_id)
 
     await update.message.reply_text("Mute duration updated.")
 
 async def rem_limit(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != OWNER_ID:
+    if update.effective_user.id != tenants.owner_id():
         return
 
     if not context.args or len(context.args) < 2:
@@ -605,7 +992,7 @@ async def rem_limit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     until = now() + duration
 
     # Ensure user document exists
-    users_col.update_one(
+    users_config_col.update_one(
         {"user_id": user_id, "group_id": group_id},
         {"$setOnInsert": {
             "user_id": user_id,
@@ -620,10 +1007,11 @@ async def rem_limit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
     # Set temporary removal
-    users_col.update_one(
+    users_config_col.update_one(
         {"user_id": user_id, "group_id": group_id},
         {"$set": {"rem_until": until.isoformat()}}
     )
+    mute_ledger.clear(group_id, user_id)
 
     await update.message.reply_text("Temporary limit removed.")
 
@@ -634,15 +1022,20 @@ async def renew(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Usage: /renew [id/all]")
         return
 
+    # Pending increments must land before the counters are zeroed
+    counter_buffer.flush()
+
     # ---- Renew All ----
     if context.args[0].lower() == "all":
-        if update.effective_user.id != OWNER_ID:
+        if update.effective_user.id != tenants.owner_id():
             return
 
-        users_col.update_many(
+        users_config_col.update_many(
             {"group_id": group_id},
-            {"$set": {"message_count": 0}}
+            {"$set": {"message_count": 0}, "$unset": {"ring": ""}}
         )
+        counter_buffer.reset(group_id)
+        mute_ledger.clear(group_id)
 
         await update.message.reply_text("All users renewed.")
         return
@@ -654,19 +1047,21 @@ async def renew(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Invalid user ID.")
         return
 
-    users_col.update_one(
+    users_config_col.update_one(
         {"user_id": user_id, "group_id": group_id},
-        {"$set": {"message_count": 0}}
+        {"$set": {"message_count": 0}, "$unset": {"ring": ""}}
     )
+    counter_buffer.reset(group_id, user_id)
+    mute_ledger.clear(group_id, user_id)
 
     await update.message.reply_text("User renewed.")
 
 async def grp_setting(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != OWNER_ID:
+    if update.effective_user.id != tenants.owner_id():
         return
 
     if not context.args:
-        await update.message.reply_text("Usage: /grp_setting [limit]")
+        await update.message.reply_text("Usage: /grp_setting [limit] [daily/rolling] [24h]")
         return
 
     try:
@@ -675,6 +1070,29 @@ async def grp_setting(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Invalid limit value.")
         return
 
+    settings = {"message_limit": new_limit}
+
+    # ---- Optional quota mode ----
+    if len(context.args) >= 2:
+        mode = context.args[1].lower()
+
+        if mode not in LIMIT_MODES:
+            await update.message.reply_text("Mode must be daily or rolling.")
+            return
+
+        settings["limit_mode"] = mode
+
+        if mode == "rolling":
+            window = context.args[2].lower() if len(context.args) >= 3 else DEFAULT_WINDOW
+
+            if parse_window(window) is None:
+                await update.message.reply_text(
+                    "Invalid window. Use a positive number with s, m, h or d. Example: 24h"
+                )
+                return
+
+            settings["window"] = window
+
     group_id = update.effective_chat.id
 
     # Ensure group exists
@@ -692,14 +1110,24 @@ async def grp_setting(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Update limit
     groups_col.update_one(
         {"group_id": group_id},
-        {"$set": {"message_limit": new_limit}}
+        {"$set": settings}
     )
+    cache_bus.publish("group", group_id)
+    mute_ledger.clear(group_id)
 
-    await update.message.reply_text(f"Group limit set to {new_limit}.")
+    if settings.get("limit_mode") == "rolling":
+        await update.message.reply_text(
+            f"Group limit set to {new_limit} per {settings['window']} (rolling)."
+        )
+    elif settings.get("limit_mode") == "daily":
+        await update.message.reply_text(f"Group limit set to {new_limit} per day.")
+    else:
+        await update.message.reply_text(f"Group limit set to {new_limit}.")
 
 async def cmd_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "/stats\n"
+        "/top\n"
         "/up_admin\n"
         "/ext_up\n"
         "/Sp_mem\n"
@@ -710,35 +1138,98 @@ async def cmd_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/renew\n"
         "/grp_setting\n"
         "/Add_grp\n"
+        "/metrics\n"
+        "/slow_q\n"
+        "/capacity\n"
+        "/compact\n"
+        "/usage\n"
+        "/import_lim\n"
+        "/export_lim\n"
+        "/mem\n"
+        "/reverify\n"
         "/cmd"
     )
 
+async def metrics_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != tenants.owner_id():
+        return
+
+    prefix = context.args[0] if context.args else None
+    text = metrics.render(prefix) or "No metrics yet."
+
+    await update.message.reply_text(text[:4000])
+
 async def post_init(application):
-    await application.bot.send_message(
-        chat_id=LOG_CHAT_ID,
-        text="🚀 Bot restarted successfully."
-    )
+    # Multi-tenant and router modes; single-process mode runs the same
+    # steps overlapped with webhook setup (startup.serve)
+    if await startup.prepare_mongo():
+        await startup.warm_up(application.bot)
+    else:
+        startup.retry_mongo(application)
+
+    await startup.announce(application.bot)
+
+async def post_stop(application):
+    # Last digest goes out while the bot can still send
+    await log_digest.flush(application.bot, force=True)
+
+async def post_shutdown(application):
+    cache_bus.stop()
+
+    # Final write-behind flush so no counted message is lost
+    counter_buffer.flush()
+    mute_ledger.flush()
+    rollups.flush()
+    capture.close()
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await send_log(
         context,
-        f"👤 User started bot\nName: {update.effective_user.full_name}\nID: {update.effective_user.id}"
+        f"👤 User started bot\nName: {update.effective_user.full_name}\nID: {update.effective_user.id}",
+        kind="start",
+        sample=f"{update.effective_user.full_name} ({update.effective_user.id})"
     )
     await update.message.reply_text("Bot active.")
 
 # ---------------- MAIN ----------------
 
-def main():
-    application = Application.builder().token(BOT_TOKEN).post_init(post_init).build()
+def build_application(global_jobs=True, process_jobs=True, requests=None, job_queue=None):
+    # global_jobs=False for extra webhook workers: jobs that sweep every
+    # group (unmute guard, compaction) must only run in one process.
+    # process_jobs=False for extra tenants: breaker, governor and explain
+    # sampling watch the whole process. requests / job_queue are shared
+    # between tenants (multi_tenant.py).
+    request, get_updates_request = requests or build_requests()
+
+    builder = (
+        Application.builder()
+        .token(tenants.current().bot_token)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        .request(request)
+        .get_updates_request(get_updates_request)
+        .concurrent_updates(PriorityUpdateProcessor(is_up_admin))
+    )
+
+    if job_queue is not None:
+        builder = builder.job_queue(job_queue)
+
+    # Local Bot API server / emulator
+    if BOT_API_URL:
+        builder = builder.base_url(BOT_API_URL)
+
+    application = builder.build()
 
     # -------- Force Sub Conversation --------
     conv = ConversationHandler(
         entry_points=[CommandHandler("Sub_force", sub_force)],
         states={
-            CHOOSING_TYPE: [CallbackQueryHandler(choose_type)],
+            CHOOSING_TYPE: [CallbackQueryHandler(choose_type, pattern="^(req|direct)$")],
             WAITING_CHANNEL_ID: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_channel)],
         },
-        fallbacks=[]
+        fallbacks=[],
+        conversation_timeout=CONVERSATION_TIMEOUT
     )
 
     application.add_handler(conv)
@@ -746,9 +1237,19 @@ def main():
     application.add_handler(CommandHandler("remove_chnl", remove_channel))
     application.add_handler(CommandHandler("force_remove", force_remove))
     application.add_handler(CommandHandler("clear_req", clear_req))
+    application.add_handler(CommandHandler("reverify", reverify.reverify_cmd))
     application.add_handler(ChatJoinRequestHandler(handle_join_request))
     application.add_handler(ChatMemberHandler(handle_member_update, ChatMemberHandler.CHAT_MEMBER))
     
+    # -------- Last-seen tracking for user_data / chat_data --------
+    application.add_handler(TypeHandler(Update, memory.touch), group=-2)
+
+    # -------- Flood Pre-filter (runs before everything) --------
+    application.add_handler(
+        MessageHandler(filters.TEXT & ~filters.COMMAND, flood_guard),
+        group=-1
+    )
+
     # -------- IMPORTANT FIX --------
     # -------- Force Sub First (priority 0) --------
     application.add_handler(
@@ -764,6 +1265,8 @@ def main():
 
     # -------- Commands --------
     application.add_handler(CommandHandler("stats", stats))
+    application.add_handler(CommandHandler("top", top))
+    application.add_handler(CallbackQueryHandler(page_callback, pattern="^(top|bst):"))
     application.add_handler(CommandHandler("ext_up", ext_up))
     application.add_handler(CommandHandler("Sp_mem", sp_mem))
     application.add_handler(CommandHandler("Ext_lim", ext_lim))
@@ -776,23 +1279,119 @@ def main():
     application.add_handler(CommandHandler("cmd", cmd_list))
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("up_admin", up_admin))
+    application.add_handler(CommandHandler("metrics", metrics_cmd))
+    application.add_handler(CommandHandler("slow_q", slow_queries))
+    application.add_handler(CommandHandler("capacity", capacity))
+    application.add_handler(CommandHandler("mem", memory.mem))
+    application.add_handler(CommandHandler("compact", compact_cmd))
+    application.add_handler(CommandHandler("usage", rollups.usage))
+    application.add_handler(CommandHandler("import_lim", import_limits))
+    application.add_handler(CommandHandler("export_lim", export_limits))
     application.add_handler(CommandHandler("force_unmute_all", force_unmute_all))
     application.add_handler(
         ChatMemberHandler(bot_added, ChatMemberHandler.MY_CHAT_MEMBER)
     )
 
+    if global_jobs:
+        application.job_queue.run_repeating(
+            force_unmute_guard,
+            interval=30,
+            first=10
+            )
+
+        application.job_queue.run_repeating(
+            compaction_job,
+            interval=COMPACT_INTERVAL,
+            first=600
+        )
+
+        if reverify.enabled():
+            application.job_queue.run_repeating(
+                reverify.reverify_job,
+                interval=reverify.REVERIFY_RESUME_INTERVAL,
+                first=30
+            )
+
+    if process_jobs:
+        application.job_queue.run_repeating(
+            mongo_breaker.breaker_job,
+            interval=mongo_breaker.BREAKER_INTERVAL,
+            first=mongo_breaker.BREAKER_INTERVAL
+        )
+
+        application.job_queue.run_repeating(
+            governor.governor_job,
+            interval=governor.INTERVAL,
+            first=governor.INTERVAL
+        )
+
+        application.job_queue.run_repeating(
+            explain_job,
+            interval=EXPLAIN_INTERVAL,
+            first=EXPLAIN_INTERVAL
+        )
+
+    application.job_queue.run_repeating(
+        log_digest.log_digest_job,
+        interval=log_digest.LOG_DIGEST_INTERVAL,
+        first=log_digest.LOG_DIGEST_INTERVAL
+    )
+
     application.job_queue.run_repeating(
-        force_unmute_guard,
-        interval=30,
-        first=10
+        rollups.rollup_flush_job,
+        interval=rollups.ROLLUP_FLUSH_INTERVAL,
+        first=rollups.ROLLUP_FLUSH_INTERVAL
+    )
+
+    application.job_queue.run_repeating(
+        mute_ledger.mute_ledger_job,
+        interval=mute_ledger.MUTE_LEDGER_FLUSH,
+        first=mute_ledger.MUTE_LEDGER_FLUSH
+    )
+
+    application.job_queue.run_repeating(
+        memory.memory_job,
+        interval=memory.MEM_SWEEP_INTERVAL,
+        first=memory.MEM_SWEEP_INTERVAL
+    )
+
+    application.job_queue.run_repeating(
+        flood_flush_job,
+        interval=FLOOD_DELETE_INTERVAL,
+        first=FLOOD_DELETE_INTERVAL
+    )
+
+    if counter_buffer.enabled():
+        application.job_queue.run_repeating(
+            counter_buffer.flush_counters_job,
+            interval=counter_buffer.COUNTER_FLUSH_MS / 1000,
+            first=counter_buffer.COUNTER_FLUSH_MS / 1000
         )
-    application.run_webhook(
-        listen="0.0.0.0",
+
+    return application
+
+def main():
+    # -------- Multi-tenant mode: N bots in this process --------
+    if tenants.multi():
+        import multi_tenant
+        multi_tenant.run()
+        return
+
+    # -------- Multi-process mode: router + N workers --------
+    if WEBHOOK_WORKERS > 1:
+        import webhook_router
+        webhook_router.run(WEBHOOK_WORKERS)
+        return
+
+    application = build_application()
+
+    asyncio.run(startup.serve(
+        application,
         port=PORT,
         url_path="webhook",
         webhook_url=f"{RENDER_EXTERNAL_URL}/webhook",
-        drop_pending_updates=True,
-    )
+        secret_token=WEBHOOK_SECRET
+    ))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+# ---------------- COLD START BENCHMARK ----------------
+#
+# Starts the fake Bot API, then launches the bot several times and measures
+# how long until the webhook port accepts connections and until a /start
+# posted right away gets its reply. The bot's own phase timings (the
+# "Startup <phase>: N ms" lines from startup.py) are collected per run.
+# Needs a local mongod.
+#
+#   MONGO_URI=mongodb://127.0.0.1:27017 python bench_cold_start.py --runs 5
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PHASE_LINE = re.compile(r"^Startup (\w+): (\d+) ms")
+USER_ID = 777
+
+
+def start_update(update_id):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": USER_ID, "type": "private", "first_name": "Bench"},
+            "from": {"id": USER_ID, "is_bot": False, "first_name": "Bench"},
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}]
+        }
+    }
+
+
+def port_open(port):
+    try:
+        socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+        return True
+    except OSError:
+        return False
+
+
+def wait_for_port(port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if port_open(port):
+            return
+        time.sleep(0.01)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+def read_phases(stream, phases):
+    for line in stream:
+        match = PHASE_LINE.match(line)
+        if match:
+            phases[match.group(1)] = int(match.group(2))
+
+
+def replied(client, api_port):
+    events = client.get(f"http://127.0.0.1:{api_port}/_events").json()["events"]
+    return any(e["method"] == "sendMessage" and str(e["chat_id"]) == str(USER_ID) for e in events)
+
+
+def run_once(args, run):
+    env = dict(
+        os.environ,
+        BOT_TOKEN="123:fake",
+        OWNER_ID=os.environ.get("OWNER_ID", "1"),
+        LOG_CHAT_ID=os.environ.get("LOG_CHAT_ID", "1"),
+        PORT=str(args.bot_port),
+        RENDER_EXTERNAL_URL=f"http://127.0.0.1:{args.bot_port}",
+        BOT_API_URL=f"http://127.0.0.1:{args.api_port}/bot",
+        WEBHOOK_SECRET="bench",
+        WEBHOOK_WORKERS="1",
+        PYTHONUNBUFFERED="1"
+    )
+    url = f"http://127.0.0.1:{args.bot_port}/webhook"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": "bench", "Content-Type": "application/json"}
+
+    with httpx.Client() as client:
+        client.delete(f"http://127.0.0.1:{args.api_port}/_events")
+
+        phases = {}
+        started = time.monotonic()
+        bot = subprocess.Popen(
+            [sys.executable, os.path.join(HERE, "app.py")],
+            env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+        )
+        reader = threading.Thread(target=read_phases, args=(bot.stdout, phases), daemon=True)
+        reader.start()
+
+        try:
+            wait_for_port(args.bot_port, args.timeout)
+            listening = time.monotonic() - started
+
+            # Posted as soon as the port opens, answered once warm-up is done
+            body = json.dumps(start_update(run + 1))
+            while client.post(url, content=body, headers=headers).status_code != 200:
+                time.sleep(0.01)
+            accepted = time.monotonic() - started
+
+            while not replied(client, args.api_port):
+                if time.monotonic() - started > args.timeout:
+                    raise RuntimeError("No reply to /start")
+                time.sleep(0.02)
+            first_reply = time.monotonic() - started
+        finally:
+            bot.terminate()
+            bot.wait(timeout=30)
+            reader.join(timeout=1)
+
+    return listening, accepted, first_reply, phases
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--bot-port", type=int, default=8443)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    api = subprocess.Popen([
+        sys.executable, os.path.join(HERE, "fake_bot_api.py"),
+        "--port", str(args.api_port),
+        "--latency-ms", str(args.latency_ms)
+    ])
+
+    results = []
+    try:
+        wait_for_port(args.api_port, 10)
+        print(f"{'run':>4} {'listen s':>9} {'ack s':>7} {'reply s':>8}")
+
+        for run in range(args.runs):
+            listening, accepted, first_reply, phases = run_once(args, run)
+            results.append(phases)
+            print(f"{run + 1:>4} {listening:>9.2f} {accepted:>7.2f} {first_reply:>8.2f}")
+    finally:
+        api.terminate()
+
+    names = sorted({name for phases in results for name in phases})
+    if names:
+        print("\nMedian phase times (ms):")
+        for name in names:
+            values = [phases[name] for phases in results if name in phases]
+            print(f"  {name:<20} {statistics.median(values):>7.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+os.environ.setdefault("LOG_CHAT_ID", "0")
+
+from telegram import Bot
+
+import metrics
+from bot_request import TrackedRequest
+
+# ---------------- BOT API POOL BENCHMARK ----------------
+#
+# Fires concurrent getChatMember calls at a local fake Bot API and reports
+# throughput and pool wait time for each connection pool size.
+#
+#   python bench_pool.py --sizes 1,4,16,64,256 --requests 2000 --latency-ms 40
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Fake Bot API did not start on port {port}")
+
+
+async def run_size(port, size, total, concurrency):
+    name = f"pool{size}"
+    request = TrackedRequest(name=name, connection_pool_size=size)
+    bot = Bot("123:fake", base_url=f"http://127.0.0.1:{port}/bot", request=request)
+    await bot.initialize()
+
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with gate:
+            await bot.get_chat_member(-100, i)
+
+    started = time.monotonic()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.monotonic() - started
+
+    await bot.shutdown()
+
+    wait = metrics.get_summary("bot_pool_wait_seconds", pool=name)
+    return total / elapsed, wait["sum"] / max(wait["count"], 1), wait["max"]
+
+
+async def run(args):
+    print(f"{'pool':>6} {'req/s':>10} {'avg wait ms':>12} {'max wait ms':>12}")
+
+    for size in [int(s) for s in args.sizes.split(",")]:
+        rps, avg_wait, max_wait = await run_size(args.port, size, args.requests, args.concurrency)
+        print(f"{size:>6} {rps:>10.0f} {avg_wait * 1000:>12.1f} {max_wait * 1000:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bot API connection pool benchmark")
+    parser.add_argument("--sizes", default="1,4,16,64,256")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--latency-ms", type=float, default=40)
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+
+    server = subprocess.Popen([
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_bot_api.py"),
+        "--port", str(args.port),
+        "--latency-ms", str(args.latency_ms)
+    ])
+
+    try:
+        wait_for_port(args.port)
+        asyncio.run(run(args))
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
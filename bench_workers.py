@@ -0,0 +1,134 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+# ---------------- WEBHOOK WORKER BENCHMARK ----------------
+#
+# Starts the fake Bot API, then the bot with 1, 2 and 4 webhook workers, and
+# pushes /start updates (one reply each) through /webhook. Throughput is the
+# rate at which replies reach the fake Bot API. Needs a local mongod.
+#
+#   MONGO_URI=mongodb://127.0.0.1:27017 python bench_workers.py --updates 5000
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+def start_update(update_id, user_id):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": "Load"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Load"},
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}]
+        }
+    }
+
+
+async def replies(client, api_port):
+    response = await client.get(f"http://127.0.0.1:{api_port}/_stats")
+    return response.json()["calls"].get("sendMessage", 0)
+
+
+async def load(args, bot_port):
+    url = f"http://127.0.0.1:{bot_port}/webhook"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": "bench"}
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=args.concurrency)) as client:
+        before = await replies(client, args.api_port)
+
+        async def post(i):
+            async with gate:
+                # Many distinct chats so the router can spread them
+                body = json.dumps(start_update(i, 10_000 + i))
+                await client.post(url, content=body, headers=headers)
+
+        started = time.monotonic()
+        await asyncio.gather(*(post(i) for i in range(args.updates)))
+        posted = time.monotonic() - started
+
+        done = before
+        while done - before < args.updates and time.monotonic() - started < args.timeout:
+            await asyncio.sleep(0.2)
+            done = await replies(client, args.api_port)
+
+        elapsed = time.monotonic() - started
+        return posted, elapsed, done - before
+
+
+def run_workers(args, workers):
+    env = dict(
+        os.environ,
+        BOT_TOKEN="123:fake",
+        OWNER_ID=os.environ.get("OWNER_ID", "1"),
+        LOG_CHAT_ID=os.environ.get("LOG_CHAT_ID", "1"),
+        PORT=str(args.bot_port),
+        RENDER_EXTERNAL_URL=f"http://127.0.0.1:{args.bot_port}",
+        BOT_API_URL=f"http://127.0.0.1:{args.api_port}/bot",
+        WEBHOOK_SECRET="bench",
+        WEBHOOK_WORKERS=str(workers)
+    )
+    bot = subprocess.Popen([sys.executable, os.path.join(HERE, "app.py")], env=env)
+
+    try:
+        wait_for_port(args.bot_port)
+        # Give spawned workers time to connect
+        time.sleep(args.warmup)
+        return asyncio.run(load(args, args.bot_port))
+    finally:
+        bot.terminate()
+        bot.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-process webhook benchmark")
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--bot-port", type=int, default=8443)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    api = subprocess.Popen([
+        sys.executable, os.path.join(HERE, "fake_bot_api.py"),
+        "--port", str(args.api_port),
+        "--latency-ms", str(args.latency_ms)
+    ])
+
+    try:
+        wait_for_port(args.api_port)
+        print(f"{'workers':>8} {'ack s':>8} {'total s':>8} {'done':>7} {'upd/s':>8}")
+
+        for workers in [int(w) for w in args.workers.split(",")]:
+            posted, elapsed, done = run_workers(args, workers)
+            print(f"{workers:>8} {posted:>8.2f} {elapsed:>8.2f} {done:>7} {done / elapsed:>8.0f}")
+    finally:
+        api.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import asyncio
+import os
+import time
+
+import httpx
+from telegram.request import BaseRequest, HTTPXRequest
+
+import governor
+import metrics
+
+# ---------------- CONFIG ----------------
+
+BOT_POOL_SIZE = int(os.getenv("BOT_POOL_SIZE", 256))
+BOT_LONG_POOL_SIZE = int(os.getenv("BOT_LONG_POOL_SIZE", 2))
+BOT_KEEPALIVE = float(os.getenv("BOT_KEEPALIVE", 30))
+BOT_HTTP2 = os.getenv("BOT_HTTP2", "0") == "1"
+
+BOT_CONNECT_TIMEOUT = float(os.getenv("BOT_CONNECT_TIMEOUT", 5))
+BOT_READ_TIMEOUT = float(os.getenv("BOT_READ_TIMEOUT", 5))
+BOT_WRITE_TIMEOUT = float(os.getenv("BOT_WRITE_TIMEOUT", 5))
+BOT_POOL_TIMEOUT = float(os.getenv("BOT_POOL_TIMEOUT", 3))
+
+# Read timeouts per Bot API method, e.g. "getChatMember=3,sendMessage=8"
+METHOD_TIMEOUTS = {
+    method: float(seconds)
+    for method, seconds in (
+        item.split("=") for item in os.getenv(
+            "BOT_METHOD_TIMEOUTS",
+            "getChatMember=3,restrictChatMember=5,deleteMessage=5,deleteMessages=5,sendMessage=8"
+        ).split(",") if item
+    )
+}
+
+# Long-lived calls get their own pool so they never hold a hot connection
+LONG_METHODS = {"getUpdates", "setWebhook", "deleteWebhook", "getWebhookInfo"}
+LONG_READ_TIMEOUT = float(os.getenv("BOT_LONG_READ_TIMEOUT", 30))
+
+
+# ---------------- BOT API REQUEST ----------------
+
+class TrackedRequest(HTTPXRequest):
+    # HTTPXRequest with its own gate in front of the httpx pool so we can
+    # measure how long calls wait for a connection and how many are in use.
+    # Also feeds the load governor with the number of in-flight calls.
+
+    def __init__(self, name="main", connection_pool_size=BOT_POOL_SIZE, long_request=None, shared=False, **kwargs):
+        kwargs.setdefault("connect_timeout", BOT_CONNECT_TIMEOUT)
+        kwargs.setdefault("read_timeout", BOT_READ_TIMEOUT)
+        kwargs.setdefault("write_timeout", BOT_WRITE_TIMEOUT)
+        kwargs.setdefault("pool_timeout", BOT_POOL_TIMEOUT)
+
+        if BOT_HTTP2:
+            kwargs.setdefault("http_version", "2")
+
+        kwargs.setdefault("httpx_kwargs", {
+            "limits": httpx.Limits(
+                max_connections=connection_pool_size,
+                max_keepalive_connections=connection_pool_size,
+                keepalive_expiry=BOT_KEEPALIVE
+            )
+        })
+
+        super().__init__(connection_pool_size=connection_pool_size, **kwargs)
+
+        self.name = name
+        self.pool_size = connection_pool_size
+        self.long_request = long_request
+        self.shared = shared
+        self.in_use = 0
+        self.gate = None
+
+    async def initialize(self):
+        await super().initialize()
+        if self.long_request:
+            await self.long_request.initialize()
+
+    async def shutdown(self):
+        # Shared by several Applications (multi_tenant.py): each of them
+        # shuts it down, the owner closes it once with close()
+        if not self.shared:
+            await self.close()
+
+    async def close(self):
+        await super().shutdown()
+        if self.long_request:
+            await self.long_request.close()
+
+    async def do_request(self, url, method, request_data=None, read_timeout=BaseRequest.DEFAULT_NONE, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+
+        # ---- Webhook setup goes through the long-lived pool ----
+        if self.long_request and api_method in LONG_METHODS:
+            return await self.long_request.do_request(
+                url, method, request_data, read_timeout=read_timeout, **kwargs
+            )
+
+        # ---- Per-method timeout unless the caller set one ----
+        if read_timeout is BaseRequest.DEFAULT_NONE and api_method in METHOD_TIMEOUTS:
+            read_timeout = METHOD_TIMEOUTS[api_method]
+
+        if self.gate is None:
+            self.gate = asyncio.Semaphore(self.pool_size)
+
+        governor.outbound_started()
+        waited = time.monotonic()
+
+        try:
+            async with self.gate:
+                wait = time.monotonic() - waited
+                self.in_use += 1
+                metrics.observe("bot_pool_wait_seconds", wait, pool=self.name)
+                metrics.set_gauge("bot_pool_in_use", self.in_use, pool=self.name)
+
+                started = time.monotonic()
+                try:
+                    return await super().do_request(
+                        url, method, request_data, read_timeout=read_timeout, **kwargs
+                    )
+                finally:
+                    self.in_use -= 1
+                    metrics.observe(
+                        "bot_api_seconds", time.monotonic() - started, method=api_method
+                    )
+        finally:
+            governor.outbound_finished()
+
+
+def build_requests(shared=False):
+    # (request, get_updates_request) for Application.builder()
+    long_request = TrackedRequest(
+        name="long",
+        connection_pool_size=BOT_LONG_POOL_SIZE,
+        read_timeout=LONG_READ_TIMEOUT,
+        shared=shared
+    )
+    request = TrackedRequest(name="main", long_request=long_request, shared=shared)
+
+    return request, long_request
@@ -0,0 +1,218 @@
+import asyncio
+import csv
+import io
+import json
+import tempfile
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from telegram import Update
+from telegram.ext import ContextTypes
+
+import counter_buffer
+import mute_ledger
+import tenants
+from database import users_config_col, users_fresh_col
+
+# ---------------- CONFIG ----------------
+
+MAX_IMPORT_BYTES = 5 * 1024 * 1024
+EXPORT_FIELDS = ["user_id", "message_count", "last_reset", "extended_limit", "is_special", "rem_until"]
+IMPORT_FIELDS = ["extended_limit", "is_special", "rem_until"]
+
+# Reported row errors per summary message
+MAX_ERRORS_SHOWN = 20
+
+
+# ---------------- PARSING ----------------
+
+def new_user_doc(user_id, group_id):
+    return {
+        "user_id": user_id,
+        "group_id": group_id,
+        "message_count": 0,
+        "extended_limit": None,
+        "is_special": False,
+        "rem_until": None,
+        "last_reset": datetime.utcnow().date().isoformat()
+    }
+
+
+def read_rows(data, filename):
+    # Returns (list of dicts, number of the first row in error messages):
+    # 1 for JSON list items, 2 for CSV lines after the header row
+    text = data.decode("utf-8-sig")
+
+    if filename.lower().endswith(".json"):
+        rows = json.loads(text)
+        if not isinstance(rows, list):
+            raise ValueError("JSON must be a list of objects")
+        return rows, 1
+
+    return list(csv.DictReader(io.StringIO(text))), 2
+
+
+def parse_row(row):
+    # Empty cell = leave unchanged, "none" = clear the field
+    user_id = int(str(row.get("user_id", "")).strip())
+    fields = {}
+
+    for field in IMPORT_FIELDS:
+        value = row.get(field)
+        if value is None or str(value).strip() == "":
+            continue
+
+        value = str(value).strip()
+
+        if value.lower() == "none":
+            fields[field] = False if field == "is_special" else None
+        elif field == "extended_limit":
+            limit = int(value)
+            if limit <= 0:
+                raise ValueError(f"extended_limit must be positive, got {value}")
+            fields[field] = limit
+        elif field == "is_special":
+            if value.lower() not in ("1", "0", "true", "false", "yes", "no"):
+                raise ValueError(f"is_special must be true/false, got {value}")
+            fields[field] = value.lower() in ("1", "true", "yes")
+        else:
+            # Stored naive UTC, it is compared with datetime.utcnow()
+            until = datetime.fromisoformat(value)
+            if until.tzinfo is not None:
+                until = until.astimezone(timezone.utc).replace(tzinfo=None)
+            fields[field] = until.isoformat()
+
+    if not fields:
+        raise ValueError("nothing to set")
+
+    return user_id, fields
+
+
+def build_ops(rows, group_id, first=2):
+    ops = []
+    op_rows = []
+    errors = []
+
+    for number, row in enumerate(rows, start=first):
+        try:
+            user_id, fields = parse_row(row)
+        except Exception as e:
+            errors.append(f"row {number}: {e}")
+            continue
+
+        # One upsert per row instead of the usual ensure + $set pair
+        defaults = {k: v for k, v in new_user_doc(user_id, group_id).items() if k not in fields}
+        ops.append(UpdateOne(
+            {"user_id": user_id, "group_id": group_id},
+            {"$setOnInsert": defaults, "$set": fields},
+            upsert=True
+        ))
+        op_rows.append(number)
+
+    return ops, op_rows, errors
+
+
+def apply_ops(ops, op_rows, errors):
+    if not ops:
+        return 0, 0
+
+    try:
+        result = users_config_col.bulk_write(ops, ordered=False)
+        return result.upserted_count, result.modified_count
+    except BulkWriteError as e:
+        details = e.details
+        for err in details.get("writeErrors", []):
+            errors.append(f"row {op_rows[err['index']]}: {err.get('errmsg', 'write error')}")
+        return details.get("nUpserted", 0), details.get("nModified", 0)
+
+
+# ---------------- IMPORT ----------------
+
+async def import_limits(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != tenants.owner_id():
+        return
+
+    message = update.message
+    reply = message.reply_to_message
+    document = reply.document if reply else None
+
+    if not document:
+        await message.reply_text(
+            "Reply to a CSV/JSON file with /import_lim\n"
+            "Columns: user_id, extended_limit, is_special, rem_until"
+        )
+        return
+
+    if document.file_size and document.file_size > MAX_IMPORT_BYTES:
+        await message.reply_text("File too large (max 5 MB).")
+        return
+
+    group_id = update.effective_chat.id
+
+    try:
+        file = await document.get_file()
+        data = bytes(await file.download_as_bytearray())
+        rows, first = read_rows(data, document.file_name or "")
+    except Exception as e:
+        await message.reply_text(f"Could not read file: {e}")
+        return
+
+    ops, op_rows, errors = build_ops(rows, group_id, first)
+    upserted, modified = await asyncio.to_thread(apply_ops, ops, op_rows, errors)
+    mute_ledger.clear(group_id)
+
+    lines = [
+        "📥 Import finished\n",
+        f"Rows: {len(rows)}",
+        f"New users: {upserted}",
+        f"Updated users: {modified}",
+        f"Errors: {len(errors)}"
+    ]
+    lines += errors[:MAX_ERRORS_SHOWN]
+    if len(errors) > MAX_ERRORS_SHOWN:
+        lines.append(f"… and {len(errors) - MAX_ERRORS_SHOWN} more")
+
+    await message.reply_text("\n".join(lines))
+
+
+# ---------------- EXPORT ----------------
+
+def write_export(group_id, out):
+    # Streams the cursor straight into the file, never holds the table
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+    writer = csv.DictWriter(text, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+
+    rows = 0
+    cursor = users_fresh_col.find(
+        {"group_id": group_id},
+        {"_id": 0, **{f: 1 for f in EXPORT_FIELDS}}
+    ).sort("user_id", 1).batch_size(1000)
+
+    for doc in cursor:
+        writer.writerow(doc)
+        rows += 1
+
+    text.flush()
+    text.detach()
+    out.seek(0)
+    return rows
+
+
+async def export_limits(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != tenants.owner_id():
+        return
+
+    group_id = update.effective_chat.id
+    counter_buffer.flush()
+
+    # Spills to disk once the export grows past 1 MB
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as out:
+        rows = await asyncio.to_thread(write_export, group_id, out)
+
+        await update.message.reply_document(
+            document=out,
+            filename=f"limits_{group_id}.csv",
+            caption=f"📤 {rows} users exported."
+        )
@@ -0,0 +1,148 @@
+import contextvars
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+import config_cache
+import metrics
+import tenants
+from database import db
+
+# ---------------- INVALIDATION BUS ----------------
+#
+# Every instance tails a small capped collection. Writers insert
+# {"kind", "key"} events; all other instances drop that cache entry as soon
+# as the tailable cursor returns it (max_await_time bounds the delay).
+# Works on a standalone mongod, no replica set / change streams needed.
+#
+#   python cache_bus.py listen
+#   python cache_bus.py publish group -1001234567890
+
+BUS_COLLECTION = "cache_events"
+BUS_SIZE_BYTES = 1024 * 1024
+BUS_AWAIT_MS = int(os.getenv("CACHE_BUS_AWAIT_MS", 500))
+
+INSTANCE_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+# tenant name -> listener thread, each tails its tenant's own bus
+listeners = {}
+stopping = threading.Event()
+
+
+def bus_col():
+    return db[BUS_COLLECTION]
+
+
+def ensure_bus():
+    try:
+        db.create_collection(BUS_COLLECTION, capped=True, size=BUS_SIZE_BYTES, max=10000)
+    except CollectionInvalid:
+        pass
+
+
+# ---------------- PUBLISH ----------------
+
+def publish(kind, key=None):
+    # Drop locally right away, then tell the other instances
+    config_cache.invalidate(kind, key)
+
+    try:
+        bus_col().insert_one({
+            "kind": kind,
+            "key": key,
+            "origin": INSTANCE_ID,
+            "ts": datetime.utcnow()
+        })
+        metrics.inc("cache_bus_published", kind=kind)
+    except PyMongoError as e:
+        # Other instances still recover through the cache TTL
+        print(f"Cache bus publish error: {e}")
+
+
+# ---------------- LISTEN ----------------
+
+def apply_event(event):
+    if event.get("origin") == INSTANCE_ID or event.get("kind") not in config_cache.caches:
+        return
+
+    config_cache.invalidate(event["kind"], event.get("key"))
+    metrics.inc("cache_bus_received", kind=event["kind"])
+
+
+def _listen(on_event):
+    col = bus_col()
+    last = None
+
+    while not stopping.is_set():
+        try:
+            # A tailable cursor dies on an empty capped collection
+            if last is None:
+                col.insert_one({"kind": "hello", "origin": INSTANCE_ID, "ts": datetime.utcnow()})
+                last = col.find_one(sort=[("$natural", -1)])["_id"]
+
+            cursor = col.find(
+                {"_id": {"$gt": last}},
+                cursor_type=CursorType.TAILABLE_AWAIT
+            ).max_await_time_ms(BUS_AWAIT_MS)
+
+            while cursor.alive and not stopping.is_set():
+                for event in cursor:
+                    last = event["_id"]
+                    on_event(event)
+        except PyMongoError as e:
+            print(f"Cache bus listen error: {e}")
+            time.sleep(1)
+
+        time.sleep(0.1)
+
+
+def start(on_event=apply_event):
+    name = tenants.current().name
+    thread = listeners.get(name)
+
+    if thread and thread.is_alive():
+        return
+
+    ensure_bus()
+    stopping.clear()
+
+    # Threads don't inherit contextvars, run the loop in the caller's context
+    thread = listeners[name] = threading.Thread(
+        target=contextvars.copy_context().run,
+        args=(_listen, on_event),
+        name=f"cache-bus-{name}",
+        daemon=True
+    )
+    thread.start()
+
+
+def stop():
+    stopping.set()
+
+
+# ---------------- MANUAL CHECK ----------------
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "listen":
+        def show(event):
+            print(f"{datetime.utcnow().isoformat()} {event.get('origin')} -> {event.get('kind')} {event.get('key')}")
+
+        start(show)
+        print(f"Listening as {INSTANCE_ID}")
+        listeners[tenants.current().name].join()
+
+    elif len(sys.argv) >= 3 and sys.argv[1] == "publish":
+        ensure_bus()
+        key = int(sys.argv[3]) if len(sys.argv) >= 4 else None
+        publish(sys.argv[2], key)
+        print(f"Published {sys.argv[2]} {key} from {INSTANCE_ID}")
+
+    else:
+        print("Usage: python cache_bus.py listen | publish <kind> [key]")
@@ -0,0 +1,154 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+import metrics
+import tenants
+from database import db, users_report_col, capacity_col
+
+# Look back this many days for the growth rate
+GROWTH_DAYS = 30
+
+
+# ---------------- HELPERS ----------------
+
+def human_bytes(value):
+    value = float(value or 0)
+    for unit in ["B", "KB", "MB", "GB"]:
+        if value < 1024:
+            return f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} TB"
+
+
+def cache_hit_rates():
+    # Caches report metrics.inc("cache_hits"/"cache_misses", cache=name)
+    rates = {}
+
+    for (name, labels), value in metrics.counters.items():
+        if name not in ("cache_hits", "cache_misses") or not metrics.visible(labels):
+            continue
+
+        cache = dict(labels).get("cache", "?")
+        hits, misses = rates.get(cache, (0, 0))
+        if name == "cache_hits":
+            hits += value
+        else:
+            misses += value
+        rates[cache] = (hits, misses)
+
+    return rates
+
+
+# ---------------- COLLECT ----------------
+
+def collect():
+    # Only $collStats / $indexStats metadata and index-backed counts,
+    # never a scan of the data itself
+    today = datetime.utcnow().date()
+    report = {"collections": {}, "total_index": 0}
+
+    for name in sorted(db.list_collection_names()):
+        if name.startswith("system."):
+            continue
+
+        col = db[name]
+        stats = next(col.aggregate([{"$collStats": {"storageStats": {}}}]), {})
+        storage = stats.get("storageStats", {})
+
+        usage = {
+            index["name"]: index["accesses"]["ops"]
+            for index in col.aggregate([{"$indexStats": {}}])
+        }
+
+        report["collections"][name] = {
+            "count": storage.get("count", 0),
+            "size": storage.get("size", 0),
+            "storage": storage.get("storageSize", 0),
+            "avg_obj": storage.get("avgObjSize", 0),
+            "index_size": storage.get("totalIndexSize", 0),
+            "indexes": usage
+        }
+        report["total_index"] += storage.get("totalIndexSize", 0)
+
+    # ---- Growth rate from daily snapshots ----
+    counts = {name: c["count"] for name, c in report["collections"].items()}
+    capacity_col.update_one(
+        {"day": today.isoformat()},
+        {"$set": {"counts": counts}},
+        upsert=True
+    )
+
+    oldest = capacity_col.find_one(
+        {"day": {"$gte": (today - timedelta(days=GROWTH_DAYS)).isoformat()}},
+        sort=[("day", 1)]
+    )
+
+    report["growth"] = {}
+    if oldest and oldest["day"] != today.isoformat():
+        days = (today - datetime.fromisoformat(oldest["day"]).date()).days
+        for name, count in counts.items():
+            before = oldest["counts"].get(name, 0)
+            report["growth"][name] = (count - before) / days
+
+    # ---- Working set: all indexes + documents touched today ----
+    active = users_report_col.count_documents({"last_reset": today.isoformat()})
+    avg_user = report["collections"].get("users", {}).get("avg_obj", 0)
+    report["active_users"] = active
+    report["working_set"] = report["total_index"] + active * avg_user
+
+    # ---- WiredTiger cache ----
+    cache = db.command("serverStatus").get("wiredTiger", {}).get("cache", {})
+    report["wt_cache"] = (
+        cache.get("bytes currently in the cache", 0),
+        cache.get("maximum bytes configured", 0)
+    )
+
+    return report
+
+
+# ---------------- COMMAND ----------------
+
+async def capacity(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != tenants.owner_id():
+        return
+
+    try:
+        report = await asyncio.to_thread(collect)
+    except Exception as e:
+        await update.message.reply_text(f"Capacity report failed: {e}")
+        return
+
+    lines = ["📦 Capacity Report\n"]
+
+    for name, c in report["collections"].items():
+        growth = report["growth"].get(name)
+        growth_text = f" | {growth:+.0f}/day" if growth is not None else ""
+
+        lines.append(
+            f"{name}: {c['count']} docs{growth_text}\n"
+            f"  data {human_bytes(c['size'])}, disk {human_bytes(c['storage'])}, "
+            f"indexes {human_bytes(c['index_size'])}"
+        )
+
+        unused = [i for i, ops in c["indexes"].items() if not ops and i != "_id_"]
+        if unused:
+            lines.append(f"  unused indexes: {', '.join(unused)}")
+
+    in_cache, max_cache = report["wt_cache"]
+    lines.append(
+        f"\nActive users today: {report['active_users']}\n"
+        f"Estimated working set: {human_bytes(report['working_set'])}\n"
+        f"WiredTiger cache: {human_bytes(in_cache)} / {human_bytes(max_cache)}"
+    )
+
+    rates = cache_hit_rates()
+    if rates:
+        lines.append("\nIn-process caches:")
+        for cache, (hits, misses) in sorted(rates.items()):
+            total = hits + misses
+            lines.append(f"  {cache}: {hits / total:.1%} hit ({total} lookups)" if total else f"  {cache}: no lookups")
+
+    await update.message.reply_text("\n".join(lines)[:4000])
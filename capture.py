@@ -0,0 +1,132 @@
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import time
+
+import tenants
+
+# ---------------- TRAFFIC CAPTURE ----------------
+#
+# CAPTURE_FILE=traffic.jsonl.gz records every incoming update, anonymized,
+# with its arrival time. The first line of each run is a meta record. Feed
+# the file to replay.py to benchmark against real traffic shapes.
+
+CAPTURE_FILE = os.getenv("CAPTURE_FILE")
+CAPTURE_SALT = os.getenv("CAPTURE_SALT") or os.urandom(16).hex()
+
+ID_FIELDS = {"id", "user_id", "chat_id", "sender_chat_id"}
+NAME_FIELDS = {"first_name", "last_name", "title", "name", "bio"}
+# Free text a user typed: same length filler, commands kept
+TEXT_FIELDS = {"text", "caption", "query", "question", "explanation", "description"}
+# Contacts, links (text_link entities), venues, files: replaced outright
+SECRET_FIELDS = {
+    "phone_number", "vcard", "email", "url", "address",
+    "foursquare_id", "google_place_id", "file_id", "file_unique_id"
+}
+COORDINATE_FIELDS = {"latitude", "longitude", "horizontal_accuracy"}
+
+capture_file = None
+active = bool(CAPTURE_FILE)
+
+
+def enabled():
+    return active
+
+
+def disable():
+    global active
+    active = False
+
+
+# ---------------- ANONYMIZE ----------------
+
+def fake_id(value):
+    # Same input -> same output for the whole run, sign and the -100
+    # supergroup/channel prefix are kept so chat types still make sense
+    digest = hmac.new(CAPTURE_SALT.encode(), str(abs(value)).encode(), hashlib.sha256).digest()
+    number = int.from_bytes(digest[:5], "big") % 10**10 + 1
+
+    if value <= -10**12:
+        return -(10**12 + number)
+    return -number if value < 0 else number
+
+
+def _fake_arg(arg):
+    try:
+        return str(fake_id(int(arg)))
+    except ValueError:
+        return arg if len(arg) <= 4 else "x" * len(arg)
+
+
+def fake_text(text):
+    # Commands survive (args that look like ids are mapped), everything
+    # else becomes filler of the same length
+    if not text.startswith("/"):
+        return "x" * len(text)
+
+    parts = text.split()
+    return " ".join([parts[0]] + [_fake_arg(arg) for arg in parts[1:]])
+
+
+def fake_data(data):
+    # Callback data like "bst:123456": short prefixes kept, ids mapped
+    return ":".join(_fake_arg(part) for part in data.split(":"))
+
+
+def anonymize(value, key=None):
+    if isinstance(value, dict):
+        return {k: anonymize(v, k) for k, v in value.items() if k != "username"}
+    if isinstance(value, list):
+        return [anonymize(v) for v in value]
+    if key in ID_FIELDS and isinstance(value, int):
+        return fake_id(value)
+    if key in NAME_FIELDS and isinstance(value, str):
+        return "Anon"
+    if key == "invite_link" and isinstance(value, str):
+        return "https://t.me/+anon"
+    if key in TEXT_FIELDS and isinstance(value, str):
+        return fake_text(value)
+    if key == "data" and isinstance(value, str):
+        return fake_data(value)
+    if key in SECRET_FIELDS and isinstance(value, str):
+        return "anon"
+    if key in COORDINATE_FIELDS and isinstance(value, (int, float)):
+        return 0.0
+    return value
+
+
+# ---------------- WRITE ----------------
+
+def _open():
+    global capture_file
+
+    # Appending adds a new gzip member, readers see one stream
+    capture_file = gzip.open(CAPTURE_FILE, "at", encoding="utf-8")
+    capture_file.write(json.dumps({"meta": {
+        "started": time.time(),
+        "owner_id": fake_id(tenants.owner_id())
+    }}) + "\n")
+
+
+def record(data):
+    if not active:
+        return
+
+    if capture_file is None:
+        _open()
+
+    capture_file.write(json.dumps({"t": time.time(), "update": anonymize(data)}) + "\n")
+
+
+def record_update(update):
+    record(update.to_dict())
+
+
+def close():
+    global capture_file
+
+    if capture_file is not None:
+        capture_file.close()
+        capture_file = None
@@ -0,0 +1,154 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+from pymongo import ReplaceOne
+from telegram import Update
+from telegram.ext import ContextTypes
+
+import log_digest
+import metrics
+import mongo_breaker
+import tenants
+from database import users_col, users_archive_col, force_pending_col
+
+# ---------------- CONFIG ----------------
+
+COMPACT_AFTER_DAYS = int(os.getenv("COMPACT_AFTER_DAYS", 30))
+COMPACT_PENDING_DAYS = int(os.getenv("COMPACT_PENDING_DAYS", 7))
+COMPACT_ARCHIVE = os.getenv("COMPACT_ARCHIVE", "0") == "1"
+COMPACT_INTERVAL = float(os.getenv("COMPACT_INTERVAL", 6 * 3600))
+
+# Small batches with a pause in between keep the hot path unaffected
+COMPACT_BATCH = int(os.getenv("COMPACT_BATCH", 500))
+COMPACT_PAUSE = float(os.getenv("COMPACT_PAUSE", 1))
+COMPACT_MAX_BATCHES = int(os.getenv("COMPACT_MAX_BATCHES", 200))
+
+running = False
+
+
+# ---------------- QUERIES ----------------
+
+def stale_user_filter():
+    cutoff = (datetime.utcnow().date() - timedelta(days=COMPACT_AFTER_DAYS)).isoformat()
+
+    # No special status, no extended limit, no live temporary removal
+    # and no activity since the cutoff
+    return {
+        "last_reset": {"$lt": cutoff},
+        "is_special": {"$ne": True},
+        "extended_limit": None,
+        "$or": [
+            {"rem_until": None},
+            {"rem_until": {"$lt": datetime.utcnow().isoformat()}}
+        ]
+    }
+
+
+def compact_users_batch():
+    query = stale_user_filter()
+    docs = list(users_col.find(query).limit(COMPACT_BATCH))
+
+    if not docs:
+        return 0
+
+    if COMPACT_ARCHIVE:
+        # Replace by _id so a batch that failed half way can be retried
+        users_archive_col.bulk_write(
+            [ReplaceOne({"_id": d["_id"]}, {**d, "archived_at": datetime.utcnow()}, upsert=True) for d in docs],
+            ordered=False
+        )
+
+    # Re-check the filter so a user who just became active is kept
+    result = users_col.delete_many({"_id": {"$in": [d["_id"] for d in docs]}, **query})
+    return result.deleted_count
+
+
+def compact_pending_batch():
+    cutoff = datetime.utcnow() - timedelta(days=COMPACT_PENDING_DAYS)
+    ids = [
+        d["_id"] for d in
+        force_pending_col.find({"requested_at": {"$lt": cutoff}}, {"_id": 1}).limit(COMPACT_BATCH)
+    ]
+
+    if not ids:
+        return 0
+
+    return force_pending_col.delete_many({"_id": {"$in": ids}}).deleted_count
+
+
+# ---------------- RUN ----------------
+
+async def _drain(batch_fn):
+    total = 0
+
+    for _ in range(COMPACT_MAX_BATCHES):
+        removed = await asyncio.to_thread(batch_fn)
+        total += removed
+
+        if removed < COMPACT_BATCH:
+            break
+        await asyncio.sleep(COMPACT_PAUSE)
+
+    return total
+
+
+async def compact():
+    global running
+
+    if running:
+        return None
+    running = True
+
+    try:
+        users = await _drain(compact_users_batch)
+        pending = await _drain(compact_pending_batch)
+    finally:
+        running = False
+
+    metrics.inc("compaction_reclaimed", users, collection="users")
+    metrics.inc("compaction_reclaimed", pending, collection="force_pending")
+
+    return users, pending
+
+
+def report_text(users, pending):
+    action = "archived" if COMPACT_ARCHIVE else "removed"
+    return (
+        f"🧹 Compaction finished\n"
+        f"Users {action}: {users} (inactive {COMPACT_AFTER_DAYS}+ days)\n"
+        f"Stale join requests removed: {pending}"
+    )
+
+
+async def compaction_job(context: ContextTypes.DEFAULT_TYPE):
+    if not mongo_breaker.available():
+        return
+
+    try:
+        result = await compact()
+    except Exception as e:
+        print(f"Compaction error: {e}")
+        return
+
+    if result and any(result):
+        log_digest.add(None, report_text(*result))
+
+
+async def compact_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != tenants.owner_id():
+        return
+
+    await update.message.reply_text("Compaction started...")
+
+    try:
+        result = await compact()
+    except Exception as e:
+        await update.message.reply_text(f"Compaction failed: {e}")
+        return
+
+    if result is None:
+        await update.message.reply_text("Compaction is already running.")
+        return
+
+    await update.message.reply_text(report_text(*result))
@@ -0,0 +1,92 @@
+import os
+import time
+
+import metrics
+import mongo_breaker
+import tenants
+from database import groups_col, admins_col, force_config_col, force_channels_col
+
+# ---------------- CONFIG CACHE ----------------
+#
+# Group settings, force-sub config/channels and the stats-admin set are read
+# on every message but change only through owner commands. They are cached
+# here, every write path calls cache_bus.publish() which drops the entry in
+# this process and in every other instance. The TTL is only a safety net.
+# While Mongo is down (mongo_breaker) expired entries keep being served.
+
+CONFIG_CACHE_TTL = float(os.getenv("CONFIG_CACHE_TTL", 300))
+
+# kind -> {key: (expires_at, value)}
+caches = {
+    "group": tenants.local(dict),
+    "force_config": tenants.local(dict),
+    "channels": tenants.local(dict),
+    "admins": tenants.local(dict)
+}
+
+LOADERS = {
+    "group": lambda group_id: groups_col.find_one({"group_id": group_id}),
+    "force_config": lambda group_id: force_config_col.find_one({"group_id": group_id}),
+    "channels": lambda group_id: list(force_channels_col.find({"group_id": group_id, "active": True})),
+    "admins": lambda _: {doc["user_id"] for doc in admins_col.find({}, {"user_id": 1})}
+}
+
+# Answer for a key never loaded before Mongo went down
+OFFLINE_DEFAULTS = {
+    "group": None,
+    "force_config": None,
+    "channels": [],
+    "admins": set()
+}
+
+MISSING = object()
+
+
+def get(kind, key):
+    cache = caches[kind]
+    entry = cache.get(key)
+
+    if entry and (entry[0] > time.monotonic() or not mongo_breaker.available()):
+        metrics.inc("cache_hits", cache=kind)
+        return entry[1]
+
+    metrics.inc("cache_misses", cache=kind)
+    value = mongo_breaker.guarded(LOADERS[kind], key, default=MISSING)
+
+    if value is MISSING:
+        # Stale beats nothing, the entry is refreshed once Mongo is back
+        return entry[1] if entry else OFFLINE_DEFAULTS[kind]
+
+    cache[key] = (time.monotonic() + CONFIG_CACHE_TTL, value)
+    return value
+
+
+def prime(kind, key, value):
+    # Bulk-loaded at startup (startup.warm_up) instead of one miss per key
+    caches[kind][key] = (time.monotonic() + CONFIG_CACHE_TTL, value)
+
+
+def invalidate(kind, key=None):
+    # key=None drops the whole kind
+    if key is None:
+        caches[kind].clear()
+    else:
+        caches[kind].pop(key, None)
+
+
+# ---------------- SHORTCUTS ----------------
+
+def get_group(group_id):
+    return get("group", group_id)
+
+
+def get_force_config(group_id):
+    return get("force_config", group_id)
+
+
+def get_channels(group_id):
+    return get("channels", group_id)
+
+
+def is_admin(user_id):
+    return user_id in get("admins", None)
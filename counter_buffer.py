@@ -0,0 +1,128 @@
+import os
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+import memory
+import metrics
+import mongo_breaker
+import tenants
+from database import users_counter_col
+
+# ---------------- CONFIG ----------------
+
+COUNTER_BUFFER = os.getenv("COUNTER_BUFFER", "0") == "1"
+COUNTER_FLUSH_MS = int(os.getenv("COUNTER_FLUSH_MS", 2000))
+COUNTER_FLUSH_MAX = int(os.getenv("COUNTER_FLUSH_MAX", 500))
+
+# ---------------- STATE ----------------
+
+# (user_id, group_id) -> {"day": iso date, "count": int, "pending": int}
+# "count" is authoritative for limit decisions, "pending" is not yet in Mongo.
+# LRU bounded, entries with unflushed increments are never evicted
+counters = memory.lru("counters", can_evict=lambda entry: not entry["pending"])
+pending_keys = tenants.local(set)
+
+
+def enabled():
+    return COUNTER_BUFFER
+
+
+def get_count(user_id, group_id, today):
+    entry = counters.get((user_id, group_id))
+
+    if entry and entry["day"] == today:
+        metrics.inc("cache_hits", cache="counters")
+        return entry["count"]
+
+    metrics.inc("cache_misses", cache="counters")
+    return None
+
+
+def load(user_id, group_id, today, count):
+    counters[(user_id, group_id)] = {
+        "day": today,
+        "count": count,
+        "pending": 0
+    }
+
+
+def increment(user_id, group_id):
+    key = (user_id, group_id)
+    entry = counters[key]
+
+    entry["count"] += 1
+    entry["pending"] += 1
+    pending_keys.add(key)
+
+    return entry["count"]
+
+
+def reset(group_id, user_id=None):
+    # Called after /renew has written message_count = 0 to Mongo
+    for key, entry in counters.items():
+        if key[1] != group_id:
+            continue
+        if user_id is not None and key[0] != user_id:
+            continue
+
+        entry["count"] = 0
+        entry["pending"] = 0
+
+
+def should_flush():
+    return len(pending_keys) >= COUNTER_FLUSH_MAX
+
+
+# ---------------- FLUSH ----------------
+
+def flush():
+    if not pending_keys:
+        return 0
+
+    ops = []
+    flushed = []
+
+    for key in pending_keys:
+        entry = counters.get(key)
+        if not entry or not entry["pending"]:
+            continue
+
+        # Filter on last_reset so increments from a previous day
+        # never land on a document that was already reset.
+        ops.append(UpdateOne(
+            {"user_id": key[0], "group_id": key[1], "last_reset": entry["day"]},
+            {"$inc": {"message_count": entry["pending"]}}
+        ))
+        flushed.append((entry, entry["pending"]))
+        entry["pending"] = 0
+
+    keys = list(pending_keys)
+    pending_keys.clear()
+
+    if not ops:
+        return 0
+
+    try:
+        users_counter_col.bulk_write(ops, ordered=False)
+    except Exception as e:
+        print(f"Counter flush error: {e}")
+
+        # Put the increments back so the next flush retries them
+        for entry, amount in flushed:
+            entry["pending"] += amount
+        pending_keys.update(keys)
+        return 0
+
+    # Drop entries from previous days, they are no longer needed
+    today = datetime.utcnow().date().isoformat()
+    for key in [k for k, e in counters.items() if e["day"] != today and not e["pending"]]:
+        del counters[key]
+
+    return len(ops)
+
+
+async def flush_counters_job(context):
+    # Increments stay pending while Mongo is down
+    if mongo_breaker.available():
+        flush()
@@ -1,18 +1,137 @@
 import os
+import threading
 from pymongo import MongoClient
 
+import mongo_profiles
+import tenants
+from governor import mongo_listener
+from mongo_profiler import profiler_listener
+
 MONGO_URI = os.getenv("MONGO_URI")
 
-client = MongoClient(MONGO_URI)
+# Short timeouts: an unreachable Mongo should fail fast and trip the
+# breaker (mongo_breaker.py), not hold handlers for the 30s default
+MONGO_SELECT_TIMEOUT_MS = int(os.getenv("MONGO_SELECT_TIMEOUT_MS", 1500))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 5000))
+
+
+class LazyClient:
+    # MongoClient resolves mongodb+srv:// records in its constructor, so it
+    # is built on first use (or by connect() during startup, see
+    # startup.py) rather than when this module is imported
+
+    def __init__(self):
+        self.real = None
+        self.lock = threading.Lock()
+
+    def resolve(self):
+        if self.real is None:
+            with self.lock:
+                if self.real is None:
+                    self.real = MongoClient(
+                        MONGO_URI,
+                        event_listeners=[mongo_listener, profiler_listener],
+                        serverSelectionTimeoutMS=MONGO_SELECT_TIMEOUT_MS,
+                        connectTimeoutMS=MONGO_SELECT_TIMEOUT_MS,
+                        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS
+                    )
+        return self.real
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
+
+    def __getitem__(self, name):
+        return self.resolve()[name]
+
+
+client = LazyClient()
+
+
+def connect():
+    # Builds the client and waits for a usable server
+    client.admin.command("ping")
+
+
+# ---------------- NAMESPACES ----------------
+# db and the *_col names resolve on use: to the current tenant's database
+# in multi-tenant mode (every bot shares this client and its pool), to
+# MONGO_DB otherwise. Nothing here touches the client at import time.
+
+class TenantDatabase:
+    def __getattr__(self, attr):
+        return getattr(client[tenants.db_name()], attr)
+
+    def __getitem__(self, name):
+        return client[tenants.db_name()][name]
+
+
+class TenantCollection:
+    # profile: write concern / read preference set (mongo_profiles.py)
+
+    def __init__(self, name, profile=None):
+        self.collection_name = name
+        self.profile = profile
+        self.by_db = {}
+
+    def resolve(self, db_name=None):
+        # db_name: another tenant's database (breaker replay)
+        db_name = db_name or tenants.db_name()
+        col = self.by_db.get(db_name)
+
+        if col is None:
+            col = client[db_name][self.collection_name]
+            if self.profile:
+                col = col.with_options(**mongo_profiles.options(self.profile))
+            self.by_db[db_name] = col
+        return col
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
+
+
+db = TenantDatabase()
+collection = TenantCollection
+
+groups_col = collection("groups", "config")
+users_col = collection("users")
+admins_col = collection("stats_admins", "config")
+
+# Same collection per operation class: hot counter writes, owner
+# setting changes, lagging reports, reads that follow a counter flush
+users_counter_col = collection("users", "counter")
+users_config_col = collection("users", "config")
+users_report_col = collection("users", "report")
+users_fresh_col = collection("users", "fresh")
+
+force_config_col = collection("force_config", "config")
+force_channels_col = collection("force_channels", "config")
+force_verified_col = collection("force_verified")
+force_pending_col = collection("force_pending")
+force_muted_col = collection("force_muted")
 
-db = client["telegram_limit_bot"]
+capacity_col = collection("capacity_snapshots")
+users_archive_col = collection("users_archive")
+rollups_col = collection("daily_rollups", "counter")
+rollups_fresh_col = collection("daily_rollups", "fresh")
+mute_ledger_col = collection("mute_ledger")
+spill_col = collection("spilled_data")
+reverify_col = collection("reverify_sweeps")
 
-groups_col = db["groups"]
-users_col = db["users"]
-admins_col = db["stats_admins"]
 
-force_config_col = db["force_config"]
-force_channels_col = db["force_channels"]
-force_verified_col = db["force_verified"]
-force_pending_col = db["force_pending"]
-force_muted_col = db["force_muted"]
+def ensure_indexes():
+    # Every hot lookup is by (user_id, group_id); last_reset backs the
+    # active-user count in /capacity
+    users_col.create_index([("user_id", 1), ("group_id", 1)])
+    users_col.create_index([("last_reset", 1)])
+    users_col.create_index([("group_id", 1), ("user_id", 1)])
+    users_col.create_index([("group_id", 1), ("last_reset", 1), ("message_count", -1), ("user_id", 1)])
+    groups_col.create_index([("group_id", 1)])
+    admins_col.create_index([("user_id", 1)])
+    capacity_col.create_index([("day", 1)])
+    force_pending_col.create_index([("requested_at", 1)])
+    rollups_col.create_index([("group_id", 1), ("day", 1)], unique=True)
+    mute_ledger_col.create_index([("group_id", 1)], unique=True)
+    spill_col.create_index([("kind", 1), ("key", 1)], unique=True)
+    spill_col.create_index([("expires", 1)], expireAfterSeconds=0)
+    reverify_col.create_index([("group_id", 1)], unique=True)
+    reverify_col.create_index([("status", 1), ("updated_at", 1)])
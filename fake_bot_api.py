@@ -0,0 +1,331 @@
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from collections import deque
+from urllib.parse import parse_qsl
+
+from tornado.web import Application, RequestHandler
+
+# ---------------- FAKE BOT API ----------------
+#
+# Local stand-in for api.telegram.org used by the benchmarks. Point a bot at
+# it with base_url="http://127.0.0.1:<port>/bot".
+#
+# Latency can follow a distribution, write methods are rate limited per chat
+# and globally with real 429 retry_after answers, and a fraction of calls
+# can be failed on purpose. Every call is logged for loadgen.py (/_events).
+#
+#   python fake_bot_api.py --port 8081 --latency-ms 40
+#   python fake_bot_api.py --latency-ms 40 --latency-dist lognormal \
+#       --chat-rate 1 --global-rate 30 --fail-rate 0.01 --fail-status 500
+
+BOT_USER = {
+    "id": 1000,
+    "is_bot": True,
+    "first_name": "FakeBot",
+    "username": "fake_bot",
+    "can_join_groups": True,
+    "can_read_all_group_messages": True,
+    "supports_inline_queries": False
+}
+
+
+# Methods that count against Telegram's flood limits
+LIMITED_METHODS = {
+    "sendMessage", "restrictChatMember", "deleteMessage", "deleteMessages",
+    "createChatInviteLink", "approveChatJoinRequest", "declineChatJoinRequest"
+}
+
+FAIL_DESCRIPTIONS = {
+    400: "Bad Request: injected failure",
+    403: "Forbidden: bot was kicked from the group chat",
+    500: "Internal Server Error",
+    502: "Bad Gateway"
+}
+
+EVENT_LOG_SIZE = 1_000_000
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        # Returns 0 when allowed, otherwise seconds until the next token
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class FakeState:
+    def __init__(
+        self, latency_ms=0, latency_dist="fixed", latency_sigma=0.5,
+        chat_rate=0, chat_burst=3, global_rate=0, global_burst=30,
+        fail_rate=0, fail_status=500, fail_methods=None,
+        hang_rate=0, hang_seconds=60, not_member_rate=0
+    ):
+        self.latency_ms = latency_ms
+        self.latency_dist = latency_dist
+        self.latency_sigma = latency_sigma
+
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets = {}
+        self.global_bucket = TokenBucket(global_rate, global_burst) if global_rate else None
+
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.fail_methods = fail_methods or LIMITED_METHODS
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.not_member_rate = not_member_rate
+
+        self.calls = {}
+        self.throttled = {}
+        self.failed = {}
+        self.events = deque(maxlen=EVENT_LOG_SIZE)
+        self.message_id = 0
+
+    def latency(self, method):
+        base = self.latency_ms / 1000
+        if not base or self.latency_dist == "fixed":
+            return base
+        if self.latency_dist == "uniform":
+            return random.uniform(0, 2 * base)
+        if self.latency_dist == "exp":
+            return random.expovariate(1 / base)
+        # lognormal: latency_ms is the median, sigma sets the tail
+        return random.lognormvariate(math.log(base), self.latency_sigma)
+
+    def retry_after(self, method, chat_id):
+        if method not in LIMITED_METHODS:
+            return 0
+
+        if self.global_bucket:
+            wait = self.global_bucket.take()
+            if wait:
+                return wait
+
+        if self.chat_rate and chat_id is not None:
+            bucket = self.chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            return bucket.take()
+
+        return 0
+
+    def failure(self, method):
+        if method not in self.fail_methods:
+            return None
+        if self.hang_rate and random.random() < self.hang_rate:
+            return "hang"
+        if self.fail_rate and random.random() < self.fail_rate:
+            return self.fail_status
+        return None
+
+    def log(self, method, params, status):
+        reply = params.get("reply_parameters") or {}
+        self.events.append({
+            "t": time.time(),
+            "method": method,
+            "status": status,
+            "chat_id": params.get("chat_id"),
+            "user_id": params.get("user_id"),
+            "message_id": params.get("message_id") or reply.get("message_id") or params.get("reply_to_message_id"),
+            "message_ids": params.get("message_ids")
+        })
+
+    def result(self, method, params):
+        if method == "getMe":
+            return BOT_USER
+
+        if method == "getChatMember":
+            left = self.not_member_rate and random.random() < self.not_member_rate
+            return {
+                "status": "left" if left else "member",
+                "user": {"id": int(params.get("user_id", 0)), "is_bot": False, "first_name": "User"}
+            }
+
+        if method == "sendMessage":
+            self.message_id += 1
+            return {
+                "message_id": self.message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "supergroup"},
+                "from": BOT_USER,
+                "text": params.get("text", "")
+            }
+
+        if method == "createChatInviteLink":
+            return {
+                "invite_link": f"https://t.me/+fake{self.message_id}",
+                "creator": BOT_USER,
+                "creates_join_request": bool(params.get("creates_join_request")),
+                "is_primary": False,
+                "is_revoked": False
+            }
+
+        if method == "getWebhookInfo":
+            return {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+
+        # restrictChatMember, deleteMessage(s), setWebhook, deleteWebhook, ...
+        return True
+
+
+def parse_params(request):
+    content_type = request.headers.get("Content-Type", "")
+
+    if "application/json" in content_type:
+        return json.loads(request.body or b"{}")
+
+    # PTB sends form fields whose values are JSON encoded
+    params = {}
+    for key, value in parse_qsl(request.body.decode()):
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return params
+
+
+class MethodHandler(RequestHandler):
+    def initialize(self, state):
+        self.state = state
+
+    def error(self, method, params, code, description, parameters=None):
+        self.state.log(method, params, code)
+        self.set_status(code)
+
+        body = {"ok": False, "error_code": code, "description": description}
+        if parameters:
+            body["parameters"] = parameters
+        self.write(body)
+
+    async def post(self, token, method):
+        state = self.state
+        params = parse_params(self.request)
+        state.calls[method] = state.calls.get(method, 0) + 1
+
+        delay = state.latency(method)
+        if delay:
+            await asyncio.sleep(delay)
+
+        wait = state.retry_after(method, params.get("chat_id"))
+        if wait:
+            state.throttled[method] = state.throttled.get(method, 0) + 1
+            retry_after = max(1, math.ceil(wait))
+            self.error(
+                method, params, 429,
+                f"Too Many Requests: retry after {retry_after}",
+                {"retry_after": retry_after}
+            )
+            return
+
+        failure = state.failure(method)
+        if failure == "hang":
+            # Client read timeout fires first
+            await asyncio.sleep(state.hang_seconds)
+            failure = 502
+        if failure:
+            state.failed[method] = state.failed.get(method, 0) + 1
+            self.error(method, params, failure, FAIL_DESCRIPTIONS.get(failure, "Injected failure"))
+            return
+
+        state.log(method, params, 200)
+        self.write({"ok": True, "result": state.result(method, params)})
+
+    get = post
+
+
+class StatsHandler(RequestHandler):
+    def initialize(self, state):
+        self.state = state
+
+    def get(self):
+        self.write({
+            "calls": self.state.calls,
+            "throttled": self.state.throttled,
+            "failed": self.state.failed
+        })
+
+
+class EventsHandler(RequestHandler):
+    def initialize(self, state):
+        self.state = state
+
+    def get(self):
+        since = float(self.get_argument("since", 0))
+        self.write({"events": [e for e in self.state.events if e["t"] >= since]})
+
+    def delete(self):
+        self.state.events.clear()
+        self.state.calls.clear()
+        self.state.throttled.clear()
+        self.state.failed.clear()
+        self.state.chat_buckets.clear()
+
+
+def make_app(state):
+    return Application([
+        (r"/bot([^/]+)/(\w+)", MethodHandler, {"state": state}),
+        (r"/_stats", StatsHandler, {"state": state}),
+        (r"/_events", EventsHandler, {"state": state})
+    ])
+
+
+async def serve(port, state):
+    make_app(state).listen(port, address="127.0.0.1")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake Telegram Bot API")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "exp", "lognormal"], default="fixed")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--chat-rate", type=float, default=0, help="write calls/s per chat, 0 = unlimited")
+    parser.add_argument("--chat-burst", type=float, default=3)
+    parser.add_argument("--global-rate", type=float, default=0, help="write calls/s overall, 0 = unlimited")
+    parser.add_argument("--global-burst", type=float, default=30)
+    parser.add_argument("--fail-rate", type=float, default=0)
+    parser.add_argument("--fail-status", type=int, choices=sorted(FAIL_DESCRIPTIONS), default=500)
+    parser.add_argument("--fail-methods", help="comma separated, default: all write methods")
+    parser.add_argument("--hang-rate", type=float, default=0)
+    parser.add_argument("--hang-seconds", type=float, default=60)
+    parser.add_argument("--not-member-rate", type=float, default=0, help="getChatMember answers 'left'")
+    args = parser.parse_args()
+
+    state = FakeState(
+        latency_ms=args.latency_ms,
+        latency_dist=args.latency_dist,
+        latency_sigma=args.latency_sigma,
+        chat_rate=args.chat_rate,
+        chat_burst=args.chat_burst,
+        global_rate=args.global_rate,
+        global_burst=args.global_burst,
+        fail_rate=args.fail_rate,
+        fail_status=args.fail_status,
+        fail_methods=set(args.fail_methods.split(",")) if args.fail_methods else None,
+        hang_rate=args.hang_rate,
+        hang_seconds=args.hang_seconds,
+        not_member_rate=args.not_member_rate
+    )
+
+    print(f"Fake Bot API on http://127.0.0.1:{args.port}/bot")
+    asyncio.run(serve(args.port, state))
+
+
+if __name__ == "__main__":
+    main()
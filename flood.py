@@ -0,0 +1,162 @@
+import os
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+
+from telegram import Update, ChatPermissions
+from telegram.ext import ContextTypes, ApplicationHandlerStop
+
+import config_cache
+import memory
+import mongo_breaker
+import rollups
+import tenants
+from database import users_col
+
+# ---------------- CONFIG ----------------
+
+# More than FLOOD_MAX_MSGS messages inside FLOOD_WINDOW seconds is a burst
+FLOOD_MAX_MSGS = int(os.getenv("FLOOD_MAX_MSGS", 5))
+FLOOD_WINDOW = float(os.getenv("FLOOD_WINDOW", 3))
+FLOOD_MUTE_SECONDS = int(os.getenv("FLOOD_MUTE_SECONDS", 600))
+FLOOD_DELETE_INTERVAL = float(os.getenv("FLOOD_DELETE_INTERVAL", 2))
+
+# The tracker ring holds FLOOD_MAX_MSGS stamps
+if FLOOD_MAX_MSGS < 1:
+    raise ValueError(f"FLOOD_MAX_MSGS must be at least 1, got {FLOOD_MAX_MSGS}")
+
+# Bot API deleteMessages accepts at most 100 ids per call
+DELETE_BATCH = 100
+
+
+# ---------------- RATE DETECTOR ----------------
+
+class FloodTracker:
+    __slots__ = ("stamps", "head", "flooding", "last", "exempt")
+
+    def __init__(self):
+        # Arrival times of the last FLOOD_MAX_MSGS messages, oldest at head
+        self.stamps = array("d", [0.0] * FLOOD_MAX_MSGS)
+        self.head = 0
+        self.flooding = False
+        self.last = 0.0
+        # Special member, looked up once at the first burst
+        self.exempt = False
+
+    def hit(self, ts):
+        oldest = self.stamps[self.head]
+        self.stamps[self.head] = ts
+        self.head = (self.head + 1) % FLOOD_MAX_MSGS
+        self.last = ts
+
+        # The message FLOOD_MAX_MSGS back is still inside the window
+        return oldest and ts - oldest < FLOOD_WINDOW
+
+
+# (group_id, user_id) -> FloodTracker
+trackers = memory.lru("flood_trackers")
+
+# group_id -> message ids waiting for one deleteMessages call
+pending_deletes = tenants.local(dict)
+
+
+async def flush_deletes(bot, group_id):
+    ids = pending_deletes.pop(group_id, [])
+
+    for i in range(0, len(ids), DELETE_BATCH):
+        try:
+            await bot.delete_messages(group_id, ids[i:i + DELETE_BATCH])
+        except Exception as e:
+            print(f"Flood delete error: {e}")
+
+
+# ---------------- EXEMPTIONS ----------------
+
+def is_exempt(update, group_id):
+    # Owner, bot admins (cached list) and anonymous admins posting as the group
+    user = update.effective_user
+    if user.id == tenants.owner_id() or config_cache.is_admin(user.id):
+        return True
+
+    sender_chat = update.effective_message.sender_chat
+    return bool(sender_chat and sender_chat.id == group_id)
+
+
+def is_special(group_id, user_id):
+    # Last seen flags while Mongo is down
+    return bool(mongo_breaker.guarded(
+        users_col.find_one,
+        {"user_id": user_id, "group_id": group_id, "is_special": True},
+        {"_id": 1},
+        default=mongo_breaker.flags_for(user_id, group_id).get("is_special")
+    ))
+
+
+# ---------------- PRE-FILTER HANDLER ----------------
+
+async def flood_guard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_chat.type not in ["group", "supergroup"]:
+        return
+
+    group_id = update.effective_chat.id
+    user = update.effective_user
+    if not user or is_exempt(update, group_id):
+        return
+
+    key = (group_id, user.id)
+
+    tracker = trackers.get(key)
+    if tracker is None:
+        tracker = trackers[key] = FloodTracker()
+
+    if tracker.exempt:
+        return
+
+    over = tracker.hit(time.monotonic())
+
+    # ---- Burst over: back to the normal pipeline ----
+    if not over:
+        tracker.flooding = False
+        return
+
+    # ---- Burst start: one (cached) config read, one mute ----
+    if not tracker.flooding:
+        if not config_cache.get_group(group_id):
+            return
+
+        if is_special(group_id, user.id):
+            tracker.exempt = True
+            return
+
+        tracker.flooding = True
+        rollups.record(group_id, "flood_mutes")
+
+        try:
+            await context.bot.restrict_chat_member(
+                group_id,
+                user.id,
+                permissions=ChatPermissions(can_send_messages=False),
+                until_date=datetime.now(timezone.utc) + timedelta(seconds=FLOOD_MUTE_SECONDS)
+            )
+        except Exception as e:
+            print(f"Flood mute error: {e}")
+
+    pending_deletes.setdefault(group_id, []).append(update.effective_message.message_id)
+
+    if len(pending_deletes[group_id]) >= DELETE_BATCH:
+        await flush_deletes(context.bot, group_id)
+
+    # Skip check_force / track_messages for this message
+    raise ApplicationHandlerStop
+
+
+# ---------------- JOB ----------------
+
+async def flood_flush_job(context: ContextTypes.DEFAULT_TYPE):
+    for group_id in list(pending_deletes):
+        await flush_deletes(context.bot, group_id)
+
+    # Forget users whose last burst is long over
+    cutoff = time.monotonic() - FLOOD_WINDOW * 10
+    for key in [k for k, t in trackers.items() if t.last < cutoff]:
+        del trackers[key]
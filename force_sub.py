@@ -1,3 +1,5 @@
+import asyncio
+import os
 from datetime import datetime, timedelta
 from telegram import (
     InlineKeyboardButton,
@@ -23,20 +25,33 @@ from database import (
     force_pending_col
 )
 
-import os
 from datetime import datetime, timedelta, timezone
 from telegram import ChatJoinRequest
 
-OWNER_ID = int(os.getenv("OWNER_ID"))
+import cache_bus
+import config_cache
+import governor
+import mongo_breaker
+import reverify
+import rollups
+import tenants
+from pymongo import UpdateOne
 
 # ================= Conversation States =================
 CHOOSING_TYPE, WAITING_CHANNEL_ID = range(2)
 
+# A verification this recent (and newer than the last channel change)
+# lets a message through without asking Telegram again. Off by default:
+# leaving a channel is only seen where the bot receives chat_member
+# updates (handle_member_update), elsewhere a user who left keeps
+# writing until the TTL runs out
+FORCE_VERIFY_TTL = float(os.getenv("FORCE_VERIFY_TTL", 0))
+
 
 # ================= OWNER PANEL =================
 
 async def sub_force(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != OWNER_ID:
+    if update.effective_user.id != tenants.owner_id():
         return
 
     if update.effective_chat.type == "private":
@@ -76,7 +91,7 @@ async def choose_type(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def save_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != OWNER_ID:
+    if update.effective_user.id != tenants.owner_id():
         return ConversationHandler.END
 
     try:
@@ -95,16 +110,27 @@ async def save_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "active": True
     })
 
+    # channels_at makes every earlier verification stale
     force_config_col.update_one(
         {"group_id": group_id},
-        {"$set": {"enabled": True}},
+        {"$set": {"enabled": True, "channels_at": datetime.utcnow()}},
         upsert=True
     )
+    cache_bus.publish("channels", group_id)
+    cache_bus.publish("force_config", group_id)
 
-    await update.message.reply_text(
+    if not reverify.enabled():
+        await update.message.reply_text(
+            "Force channel added.\n\n"
+            "Members are checked again on their next message."
+        )
+        return ConversationHandler.END
+
+    msg = await update.message.reply_text(
         "Force channel added.\n\n"
-        "Tip: Use /clear_req if adding new channels."
+        "Members are being re-verified in the background."
     )
+    await reverify.start(context.bot, group_id, "channel added", msg)
 
     return ConversationHandler.END
 
@@ -112,7 +138,7 @@ async def save_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ================= REMOVE & CONTROL =================
 
 async def remove_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != OWNER_ID:
+    if update.effective_user.id != tenants.owner_id():
         return
 
     if not context.args:
@@ -131,12 +157,18 @@ async def remove_channel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "group_id": group_id,
         "channel_id": channel_id
     })
+    force_config_col.update_one(
+        {"group_id": group_id},
+        {"$set": {"channels_at": datetime.utcnow()}}
+    )
+    cache_bus.publish("channels", group_id)
+    cache_bus.publish("force_config", group_id)
 
     await update.message.reply_text("Channel removed from this group.")
 
 
 async def force_remove(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != OWNER_ID:
+    if update.effective_user.id != tenants.owner_id():
         return
 
     group_id = update.effective_chat.id
@@ -146,18 +178,22 @@ async def force_remove(update: Update, context: ContextTypes.DEFAULT_TYPE):
         {"$set": {"enabled": False}},
         upsert=True
     )
+    cache_bus.publish("force_config", group_id)
 
     await update.message.reply_text("Force Subscribe disabled for this group.")
 
 
 async def clear_req(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != OWNER_ID:
+    if update.effective_user.id != tenants.owner_id():
         return
 
     group_id = update.effective_chat.id
     force_verified_col.delete_many({"group_id": group_id})
     force_pending_col.delete_many({"group_id": group_id})
 
+    # Nothing left for a sweep to refresh, every user is greeted again
+    reverify.stop(group_id)
+
     await update.message.reply_text(
         "Verification cache cleared.\n"
         "Users will be checked again."
@@ -203,7 +239,8 @@ async def force_temp_mute(context, group_id, user_id):
         until_date=unmute_time
     )
 
-    force_muted_col.update_one(
+    # Journaled while Mongo is down, the guard picks it up after replay
+    mongo_breaker.write(force_muted_col, UpdateOne(
         {
             "user_id": user_id,
             "group_id": group_id
@@ -215,20 +252,29 @@ async def force_temp_mute(context, group_id, user_id):
             }
         },
         upsert=True
-    )
+    ))
 
 async def force_unmute_guard(context: ContextTypes.DEFAULT_TYPE):
-    from datetime import datetime, timezone
+    # Telegram lifts the mutes on its own (until_date), rows are swept
+    # once Mongo is back
+    if not mongo_breaker.available():
+        return
+
+    await release_expired(context.bot)
+
 
+async def release_expired(bot, limit=0):
+    # Also run once at startup (startup.warm_up) for mutes that expired
+    # while the bot was down; limit=0 means all
     now = datetime.now(timezone.utc)
 
-    expired_users = list(force_muted_col.find({
+    expired_users = await asyncio.to_thread(lambda: list(force_muted_col.find({
         "unmute_at": {"$lte": now}
-    }))
+    }).limit(limit)))
 
     for user in expired_users:
         try:
-            await context.bot.restrict_chat_member(
+            await bot.restrict_chat_member(
                 chat_id=user["group_id"],
                 user_id=user["user_id"],
                 permissions=ChatPermissions(
@@ -253,10 +299,12 @@ async def force_unmute_guard(context: ContextTypes.DEFAULT_TYPE):
         force_muted_col.delete_one({
             "_id": user["_id"]
         })
-    
+
+    return len(expired_users)
+
 
 async def force_unmute_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != OWNER_ID:
+    if update.effective_user.id != tenants.owner_id():
         return
 
     group_id = update.effective_chat.id
@@ -333,68 +381,42 @@ async def handle_join_request(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def handle_member_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_member = update.chat_member
 
-    user_id = chat_member.from_user.id
+    # from_user is the admin for a kick, the member is new_chat_member.user
+    user_id = chat_member.new_chat_member.user.id
     channel_id = chat_member.chat.id
 
-    # Only check request-type channels
-    channel_data = force_channels_col.find_one({
-        "channel_id": channel_id,
-        "type": "req"
-    })
-
-    if not channel_data:
+    if chat_member.new_chat_member.status not in ["left", "kicked"]:
         return
 
-    # If user left / rejected
-    if chat_member.new_chat_member.status in ["left", "kicked"]:
-        force_pending_col.delete_many({
+    # Every group using this channel as a force channel
+    channels = list(force_channels_col.find({"channel_id": channel_id}))
+
+    for channel_data in channels:
+        # A cached verification must not outlive the membership
+        force_verified_col.delete_one({
             "user_id": user_id,
-            "group_id": channel_data["group_id"],
-            "channel_id": channel_id
+            "group_id": channel_data["group_id"]
         })
 
-# ================= MAIN CHECK =================
-async def check_force(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_chat.type not in ["group", "supergroup"]:
-        return
-
-    group_id = update.effective_chat.id
-    user = update.effective_user
-
-    if user.id == OWNER_ID:
-        return
-
-    # Force enabled?
-    config = force_config_col.find_one({"group_id": group_id})
-    if not config or not config.get("enabled"):
-        return
-
-    # Special member bypass
-    special = users_col.find_one({
-        "user_id": user.id,
-        "group_id": group_id,
-        "is_special": True
-    })
-    if special:
-        return
-
-    channels = list(force_channels_col.find({
-        "group_id": group_id,
-        "active": True
-    }))
-
-    if not channels:
-        return
+        # If user left / rejected a request-type channel
+        if channel_data["type"] == "req":
+            force_pending_col.delete_many({
+                "user_id": user_id,
+                "group_id": channel_data["group_id"],
+                "channel_id": channel_id
+            })
 
+# ================= MAIN CHECK =================
 
-    # ---------------- CHANNEL CHECK ----------------
+async def missing_channels(bot, group_id, user_id, channels):
+    # Channels the user has not joined (shared with reverify.py)
     not_joined = []
 
     for ch in channels:
         try:
-            member = await context.bot.get_chat_member(
+            member = await bot.get_chat_member(
                 ch["channel_id"],
-                user.id
+                user_id
             )
 
             status = member.status
@@ -406,8 +428,8 @@ async def check_force(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # ❌ Everything else means NOT joined
             if ch["type"] == "req":
 
-                pending = force_pending_col.find_one({
-                    "user_id": user.id,
+                pending = mongo_breaker.guarded(force_pending_col.find_one, {
+                    "user_id": user_id,
                     "group_id": group_id,
                     "channel_id": ch["channel_id"]
                 })
@@ -419,19 +441,75 @@ async def check_force(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # If direct channel OR no valid pending → must join
             not_joined.append(ch)
 
-        except:
+        except Exception:
             # If API fails, treat as not joined (safe side)
             not_joined.append(ch)
-    # ------------------------------------------------
+
+    return not_joined
+
+
+def is_fresh(verified, config):
+    # verified is True (not a document) while Mongo is down
+    if not FORCE_VERIFY_TTL or not isinstance(verified, dict):
+        return False
+
+    at = verified.get("verified_at")
+    if not at or at < datetime.utcnow() - timedelta(seconds=FORCE_VERIFY_TTL):
+        return False
+
+    return at >= config.get("channels_at", at)
+
+
+async def check_force(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_chat.type not in ["group", "supergroup"]:
+        return
+
+    group_id = update.effective_chat.id
+    user = update.effective_user
+
+    if user.id == tenants.owner_id():
+        return
+
+    # Force enabled?
+    config = config_cache.get_force_config(group_id)
+    if not config or not config.get("enabled"):
+        return
+
+    # Special member bypass (last seen flags while Mongo is down)
+    special = mongo_breaker.guarded(
+        users_col.find_one,
+        {"user_id": user.id, "group_id": group_id, "is_special": True},
+        default=mongo_breaker.flags_for(user.id, group_id).get("is_special")
+    )
+    if special:
+        return
+
+    channels = config_cache.get_channels(group_id)
+
+    if not channels:
+        return
+
+    # Mongo down: skip the first-time bookkeeping and greeting
+    already_verified = mongo_breaker.guarded(force_verified_col.find_one, {
+        "user_id": user.id,
+        "group_id": group_id
+    }, default=True)
+
+    # Checked recently, here or by the background sweep (reverify.py)
+    if is_fresh(already_verified, config):
+        return
+
+    not_joined = await missing_channels(context.bot, group_id, user.id, channels)
 
 
     # ✅ If user joined all required channels
     if not not_joined:
 
-        already_verified = force_verified_col.find_one({
-            "user_id": user.id,
-            "group_id": group_id
-        })
+        if isinstance(already_verified, dict) and FORCE_VERIFY_TTL:
+            mongo_breaker.write(force_verified_col, UpdateOne(
+                {"user_id": user.id, "group_id": group_id},
+                {"$set": {"verified_at": datetime.utcnow()}}
+            ))
 
         # Only send greeting first time
         if not already_verified:
@@ -447,6 +525,10 @@ async def check_force(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "group_id": group_id
             })
 
+            # Greeting is optional work, skip it under load
+            if not governor.allows("greeting"):
+                return
+
             msg = await context.bot.send_message(
                 chat_id=group_id,
                 text=(
@@ -469,6 +551,8 @@ async def check_force(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
     # ❌ User still not joined → always enforce
+    rollups.record(group_id, "force_blocks")
+
     try:
         await update.message.delete()
     except:
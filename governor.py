@@ -0,0 +1,179 @@
+import os
+import time
+
+from pymongo import monitoring
+
+import tenants
+
+# ---------------- CONFIG ----------------
+
+# Entry thresholds for level 1, 2 and 3 of each signal
+HANDLER_MS = [float(x) for x in os.getenv("GOVERNOR_HANDLER_MS", "500,1500,3000").split(",")]
+MONGO_MS = [float(x) for x in os.getenv("GOVERNOR_MONGO_MS", "50,150,400").split(",")]
+OUTBOUND = [float(x) for x in os.getenv("GOVERNOR_OUTBOUND", "20,50,100").split(",")]
+
+# A level is left only once every signal is below EXIT_RATIO x its entry
+# threshold and has stayed there for COOLDOWN seconds
+EXIT_RATIO = float(os.getenv("GOVERNOR_EXIT_RATIO", 0.6))
+COOLDOWN = float(os.getenv("GOVERNOR_COOLDOWN", 30))
+INTERVAL = float(os.getenv("GOVERNOR_INTERVAL", 1))
+
+ALPHA = 0.2
+
+# ---------------- LEVELS ----------------
+
+LEVEL_NAMES = [
+    "normal",
+    "skip greetings",
+    "skip greetings + limit warnings",
+    "skip greetings + limit warnings, logs deferred"
+]
+
+# One entry threshold per level above normal, for every signal
+for _name, _thresholds in (("GOVERNOR_HANDLER_MS", HANDLER_MS), ("GOVERNOR_MONGO_MS", MONGO_MS), ("GOVERNOR_OUTBOUND", OUTBOUND)):
+    if len(_thresholds) != len(LEVEL_NAMES) - 1:
+        raise ValueError(f"{_name} needs {len(LEVEL_NAMES) - 1} thresholds, got {len(_thresholds)}")
+
+# Minimum level at which a piece of optional work is skipped
+# ("log" holds back the log digest, see log_digest.flush; "reverify"
+# pauses background re-verification sweeps, see reverify.py)
+SKIP_AT = {
+    "greeting": 1,
+    "reverify": 1,
+    "warning": 2,
+    "log": 3
+}
+
+# ---------------- STATE ----------------
+
+level = 0
+calm_since = None
+
+handler_ms = 0.0
+mongo_ms = 0.0
+outbound = 0
+outbound_peak = 0
+
+# Samples seen since the last evaluation, idle signals decay towards zero
+handler_samples = 0
+mongo_samples = 0
+
+
+def allows(kind):
+    return level < SKIP_AT[kind]
+
+
+def _ewma(current, sample):
+    return sample if not current else current + ALPHA * (sample - current)
+
+
+# ---------------- SIGNALS ----------------
+
+def observe_handler(seconds):
+    global handler_ms, handler_samples
+    handler_ms = _ewma(handler_ms, seconds * 1000)
+    handler_samples += 1
+
+
+def observe_mongo(seconds):
+    global mongo_ms, mongo_samples
+    mongo_ms = _ewma(mongo_ms, seconds * 1000)
+    mongo_samples += 1
+
+
+def outbound_started():
+    global outbound, outbound_peak
+    outbound += 1
+    outbound_peak = max(outbound_peak, outbound)
+
+
+def outbound_finished():
+    global outbound
+    outbound -= 1
+
+
+class MongoLatencyListener(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        observe_mongo(event.duration_micros / 1_000_000)
+
+    def failed(self, event):
+        observe_mongo(event.duration_micros / 1_000_000)
+
+
+mongo_listener = MongoLatencyListener()
+
+
+# ---------------- LEVEL SELECTION ----------------
+
+def _target(ratio=1.0):
+    target = 0
+
+    for value, thresholds in (
+        (handler_ms, HANDLER_MS),
+        (mongo_ms, MONGO_MS),
+        (outbound_peak, OUTBOUND)
+    ):
+        exceeded = sum(1 for t in thresholds if value >= t * ratio)
+        target = max(target, exceeded)
+
+    return target
+
+
+def evaluate():
+    global level, calm_since, outbound_peak
+    global handler_ms, mongo_ms, handler_samples, mongo_samples
+
+    if not handler_samples:
+        handler_ms *= 1 - ALPHA
+    if not mongo_samples:
+        mongo_ms *= 1 - ALPHA
+    handler_samples = mongo_samples = 0
+
+    # Step up immediately, step down one level at a time after a cooldown
+    new_level = level
+    target = _target()
+
+    if target > level:
+        new_level = target
+        calm_since = None
+    elif _target(EXIT_RATIO) < level:
+        calm_since = calm_since or time.monotonic()
+        if time.monotonic() - calm_since >= COOLDOWN:
+            new_level = level - 1
+            calm_since = None
+    else:
+        calm_since = None
+
+    outbound_peak = outbound
+    changed = new_level != level
+    level = new_level
+
+    return changed
+
+
+def status_text():
+    return (
+        f"Level {level}: {LEVEL_NAMES[level]}\n"
+        f"Handler: {handler_ms:.0f} ms\n"
+        f"Mongo: {mongo_ms:.1f} ms\n"
+        f"Outbound: {outbound}"
+    )
+
+
+# ---------------- JOB ----------------
+
+async def governor_job(context):
+    changed = evaluate()
+
+    if changed:
+        # Level changes are announced once and never deferred
+        try:
+            await context.bot.send_message(
+                chat_id=tenants.log_chat_id(),
+                text=f"⚙️ Load governor\n{status_text()}"
+            )
+        except Exception as e:
+            print(f"Governor log error: {e}")
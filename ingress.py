@@ -0,0 +1,217 @@
+import asyncio
+import hmac
+import json
+import os
+import queue
+import threading
+import time
+
+from telegram import Update
+
+import metrics
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+try:
+    import uvicorn
+except ImportError:
+    uvicorn = None
+
+# ---------------- ASGI WEBHOOK INGRESS ----------------
+#
+# WEBHOOK_INGRESS=asgi replaces PTB's webhook server in single-process mode
+# (startup.serve). uvicorn runs on its own thread and event loop: handlers
+# make synchronous pymongo calls on the main loop, and the acknowledgement
+# must not wait behind them. The endpoint only checks the secret token,
+# puts the raw body on a bounded (thread-safe) queue and answers 200; it
+# never parses JSON or waits for handlers. INGRESS_WORKERS tasks on the
+# main loop decode (orjson when installed) into Update objects and hand
+# them to application.update_queue, holding back while INGRESS_HANDOFF_MAX
+# updates wait in the lanes (lanes.py) for a worker. PTB drains
+# update_queue into the lanes right away, so its size says nothing about
+# the backlog. A full queue answers 503 so Telegram redelivers later
+# instead of the update being dropped. Needs uvicorn, without it PTB's
+# server is used.
+
+WEBHOOK_INGRESS = os.getenv("WEBHOOK_INGRESS", "ptb")
+INGRESS_QUEUE = int(os.getenv("INGRESS_QUEUE", 10000))
+INGRESS_WORKERS = int(os.getenv("INGRESS_WORKERS", 2))
+INGRESS_HANDOFF_MAX = int(os.getenv("INGRESS_HANDOFF_MAX", 1000))
+INGRESS_MAX_BODY = int(os.getenv("INGRESS_MAX_BODY", 1024 * 1024))
+
+SECRET_HEADER = b"x-telegram-bot-api-secret-token"
+HANDOFF_WAIT = 0.01
+
+# Seconds a worker's executor thread blocks on the queue before it checks
+# for cancellation again
+GET_TIMEOUT = 1
+
+
+def enabled():
+    if WEBHOOK_INGRESS != "asgi":
+        return False
+
+    if uvicorn is None:
+        print("WEBHOOK_INGRESS=asgi needs uvicorn, using the PTB webhook server")
+        return False
+    return True
+
+
+# ---------------- ASGI APP ----------------
+
+class Ingress:
+    def __init__(self, application, path, secret_token=None, maxsize=INGRESS_QUEUE):
+        self.application = application
+        self.path = path
+        self.secret = secret_token.encode() if secret_token else None
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.workers = []
+        self.server = None
+        self.thread = None
+        # Future on the main loop, done once the server thread exits
+        self.task = None
+
+    async def __call__(self, scope, receive, send):
+        # Runs on the ingress thread's loop; lifespan="off", only http
+        # scopes arrive
+        if scope["type"] != "http":
+            return
+
+        started = time.perf_counter()
+        status = self._check(scope)
+
+        if status == 200:
+            body = await self._read(receive)
+
+            if body is None:
+                status = 413
+            else:
+                try:
+                    self.queue.put_nowait(body)
+                except queue.Full:
+                    status = 503
+
+        await send({"type": "http.response.start", "status": status, "headers": [(b"content-length", b"0")]})
+        await send({"type": "http.response.body", "body": b""})
+
+        if status == 200:
+            metrics.inc("ingress_accepted")
+            metrics.observe("ingress_ack_seconds", time.perf_counter() - started)
+        else:
+            metrics.inc("ingress_rejected", status=status)
+
+    def _check(self, scope):
+        if scope["method"] != "POST" or scope["path"] != self.path:
+            return 404
+
+        if self.secret:
+            token = next((v for k, v in scope["headers"] if k == SECRET_HEADER), b"")
+            if not hmac.compare_digest(token, self.secret):
+                return 403
+        return 200
+
+    async def _read(self, receive):
+        # None once the body is over INGRESS_MAX_BODY
+        chunks = []
+        size = 0
+
+        while True:
+            message = await receive()
+            chunk = message.get("body", b"")
+            size += len(chunk)
+
+            if size > INGRESS_MAX_BODY:
+                return None
+            chunks.append(chunk)
+
+            if not message.get("more_body"):
+                return b"".join(chunks)
+
+    # ---------------- WORKERS ----------------
+
+    def _backlog(self):
+        processor = self.application.update_processor
+        if hasattr(processor, "pending"):
+            return processor.pending()
+        return self.application.update_queue.qsize()
+
+    def _next(self):
+        try:
+            return self.queue.get(timeout=GET_TIMEOUT)
+        except queue.Empty:
+            return None
+
+    async def _worker(self):
+        application = self.application
+        loop = asyncio.get_running_loop()
+
+        while True:
+            raw = await loop.run_in_executor(None, self._next)
+            if raw is None:
+                continue
+
+            # Backpressure: raw bytes wait here (bounded) rather than decoded
+            # updates piling up in the lanes, or being shed from the text lane
+            while self._backlog() >= INGRESS_HANDOFF_MAX:
+                await asyncio.sleep(HANDOFF_WAIT)
+
+            try:
+                update = Update.de_json(loads(raw), application.bot)
+                await application.update_queue.put(update)
+            except Exception as e:
+                metrics.inc("ingress_decode_errors")
+                print(f"Ingress decode error: {e}")
+            finally:
+                self.queue.task_done()
+
+    # ---------------- LIFECYCLE ----------------
+
+    def _serve(self, loop):
+        # uvicorn leaves signal handling to the main thread when it runs
+        # in another one
+        try:
+            self.server.run()
+        finally:
+            loop.call_soon_threadsafe(self.task.set_result, None)
+
+    async def start(self, port):
+        loop = asyncio.get_running_loop()
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(INGRESS_WORKERS)]
+
+        config = uvicorn.Config(
+            self,
+            host="0.0.0.0",
+            port=port,
+            lifespan="off",
+            access_log=False,
+            log_level="warning"
+        )
+        self.server = uvicorn.Server(config)
+        self.task = loop.create_future()
+        self.thread = threading.Thread(target=self._serve, args=(loop,), name="ingress", daemon=True)
+        self.thread.start()
+
+        while not self.server.started and not self.task.done():
+            await asyncio.sleep(0.01)
+
+    async def stop(self, timeout=10):
+        if self.server:
+            self.server.should_exit = True
+            await self.task
+
+        # Already acknowledged to Telegram, hand them over before PTB stops
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            await asyncio.sleep(HANDOFF_WAIT)
+
+        if self.queue.unfinished_tasks:
+            print(f"Ingress stopped with {self.queue.unfinished_tasks} updates undelivered")
+
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import time
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+import capture
+import governor
+import tenants
+
+# ---------------- CONFIG ----------------
+
+# Lane 0: owner/admin commands
+# Lane 1: join requests and chat member events
+# Lane 2: everything else (ordinary group text), shed when full
+LANE_SIZES = [int(x) for x in os.getenv("LANE_SIZES", "200,2000,5000").split(",")]
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", 4))
+
+LANE_ADMIN, LANE_MEMBER, LANE_TEXT = range(3)
+
+
+# ---------------- CLASSIFY ----------------
+
+def classify(update, is_priority_user):
+    if update.chat_join_request or update.chat_member or update.my_chat_member:
+        return LANE_MEMBER
+
+    user = update.effective_user
+    if not user:
+        return LANE_TEXT
+
+    if user.id == tenants.owner_id():
+        return LANE_ADMIN
+
+    message = update.effective_message
+    is_command = bool(message and message.text and message.text.startswith("/"))
+
+    # Only commands and button presses pay for the admin lookup,
+    # ordinary text never touches Mongo here
+    if (is_command or update.callback_query) and is_priority_user(user.id):
+        return LANE_ADMIN
+
+    return LANE_TEXT
+
+
+# ---------------- PROCESSOR ----------------
+
+class PriorityUpdateProcessor(BaseUpdateProcessor):
+    # PTB hands every update to do_process_update inside its semaphore, so
+    # the semaphore is sized to hold every queued update and the real
+    # concurrency limit is the number of lane workers.
+
+    def __init__(self, is_priority_user, workers=UPDATE_WORKERS, sizes=LANE_SIZES):
+        super().__init__(sum(sizes) + workers)
+        self.is_priority_user = is_priority_user
+        self.workers = workers
+        self.sizes = sizes
+        self.lanes = []
+        self.tasks = []
+        self.available = None
+        self.shed = 0
+
+    async def initialize(self):
+        self.lanes = [asyncio.Queue(maxsize=size) for size in self.sizes]
+        self.available = asyncio.Semaphore(0)
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def shutdown(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def do_process_update(self, update, coroutine):
+        # Arrival point of every update in single-process mode
+        if capture.enabled() and isinstance(update, Update):
+            capture.record_update(update)
+
+        lane = classify(update, self.is_priority_user) if isinstance(update, Update) else LANE_TEXT
+        queue = self.lanes[lane]
+
+        # ---- Load shedding for the lowest lane ----
+        if lane == LANE_TEXT and queue.full():
+            coroutine.close()
+            self.shed += 1
+            return
+
+        done = asyncio.get_running_loop().create_future()
+        await queue.put((coroutine, done))
+        self.available.release()
+
+        await done
+
+    async def _worker(self):
+        while True:
+            await self.available.acquire()
+
+            # Always drain the highest priority lane first
+            for queue in self.lanes:
+                if not queue.empty():
+                    coroutine, done = queue.get_nowait()
+                    break
+
+            started = time.monotonic()
+            try:
+                await coroutine
+            except Exception as e:
+                # process_update already routes handler errors to the error
+                # handlers, anything reaching here is unexpected
+                print(f"Lane worker error: {e}")
+            finally:
+                governor.observe_handler(time.monotonic() - started)
+                if not done.done():
+                    done.set_result(None)
+
+    def queue_sizes(self):
+        return [queue.qsize() for queue in self.lanes]
+
+    def pending(self):
+        # Updates handed over but not picked up by a worker yet
+        return sum(self.queue_sizes())
@@ -0,0 +1,248 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+import httpx
+
+# ---------------- WEBHOOK LOAD GENERATOR ----------------
+#
+# POSTs synthetic group messages to the bot's /webhook at a fixed rate
+# (open loop, a slow bot does not slow the sender down) and then reads the
+# call log of fake_bot_api.py to see what the bot did with each update:
+# replies, mutes and deletes, with end-to-end latency and the Bot API answer
+# (200 / 429 / injected failure) for every action.
+#
+#   python fake_bot_api.py --latency-ms 40 --chat-rate 1 --global-rate 30
+#   BOT_API_URL=http://127.0.0.1:8081/bot WEBHOOK_SECRET=load python app.py
+#   python loadgen.py --rps 200 --duration 30 --secret load --authorize
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://127.0.0.1:27017")
+MONGO_DB = os.getenv("MONGO_DB", "telegram_limit_bot")
+
+BASE_GROUP_ID = -1009000000000
+BASE_USER_ID = 7000000
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def latency_line(values):
+    if not values:
+        return "-"
+    return (
+        f"p50 {percentile(values, 50) * 1000:.0f} | "
+        f"p90 {percentile(values, 90) * 1000:.0f} | "
+        f"p99 {percentile(values, 99) * 1000:.0f} | "
+        f"max {max(values) * 1000:.0f} ms"
+    )
+
+
+def authorize(group_ids):
+    from pymongo import MongoClient
+
+    groups = MongoClient(MONGO_URI)[MONGO_DB]["groups"]
+    for group_id in group_ids:
+        groups.update_one(
+            {"group_id": group_id},
+            {"$setOnInsert": {
+                "group_id": group_id,
+                "message_limit": 3,
+                "mute_enabled": 1,
+                "mute_time": "5m"
+            }},
+            upsert=True
+        )
+
+
+# ---------------- TRAFFIC ----------------
+
+class Traffic:
+    def __init__(self, groups, users, skew):
+        self.group_ids = [BASE_GROUP_ID - i for i in range(groups)]
+        self.user_ids = [BASE_USER_ID + i for i in range(users)]
+        # A few heavy users hit the limit, most stay under it
+        self.weights = [1 / (i + 1) ** skew for i in range(users)]
+        self.update_id = int(time.time())
+        self.message_id = 0
+
+    def next(self):
+        self.update_id += 1
+        self.message_id += 1
+
+        group_id = random.choice(self.group_ids)
+        user_id = random.choices(self.user_ids, self.weights)[0]
+
+        update = {
+            "update_id": self.update_id,
+            "message": {
+                "message_id": self.message_id,
+                "date": int(time.time()),
+                "chat": {"id": group_id, "type": "supergroup", "title": "Load"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "Load"},
+                "text": f"Movie request {self.message_id}"
+            }
+        }
+        return update, group_id, user_id, self.message_id
+
+
+# ---------------- SEND ----------------
+
+async def send(args, traffic):
+    headers = {"Content-Type": "application/json"}
+    if args.secret:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = args.secret
+
+    sent = {}       # (chat_id, message_id) -> t0
+    by_user = {}    # (chat_id, user_id) -> [(t0, message_id)]
+    acks = []
+    statuses = {}
+    skipped = 0
+
+    gate = asyncio.Semaphore(args.max_in_flight)
+    limits = httpx.Limits(max_connections=args.max_in_flight)
+
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        async def post(body, t0):
+            try:
+                response = await client.post(args.url, content=body, headers=headers)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            finally:
+                gate.release()
+
+            acks.append(time.time() - t0)
+            statuses[status] = statuses.get(status, 0) + 1
+
+        tasks = []
+        total = int(args.rps * args.duration)
+        started = time.monotonic()
+
+        for i in range(total):
+            delay = started + i / args.rps - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            # Open loop: never queue behind a stuck bot, count it instead
+            if gate.locked():
+                skipped += 1
+                continue
+            await gate.acquire()
+
+            update, group_id, user_id, message_id = traffic.next()
+            t0 = time.time()
+            sent[(group_id, message_id)] = t0
+            by_user.setdefault((group_id, user_id), []).append(t0)
+
+            tasks.append(asyncio.create_task(post(json.dumps(update), t0)))
+
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+
+    return sent, by_user, acks, statuses, skipped, elapsed
+
+
+# ---------------- OUTCOMES ----------------
+
+def match(events, sent, by_user):
+    # (method, status) -> count, kind -> [latency]
+    outcomes = {}
+    latencies = {}
+
+    for event in events:
+        chat_id = event.get("chat_id")
+        if chat_id is None:
+            continue
+
+        key = (event["method"], event["status"])
+        outcomes[key] = outcomes.get(key, 0) + 1
+
+        if event["status"] != 200:
+            continue
+
+        t0 = None
+        if event["method"] == "sendMessage" and event.get("message_id"):
+            t0 = sent.get((chat_id, event["message_id"]))
+            kind = "reply"
+        elif event["method"] == "restrictChatMember":
+            # Latest message of that user sent before the mute
+            times = [t for t in by_user.get((chat_id, event.get("user_id")), []) if t <= event["t"]]
+            t0 = times[-1] if times else None
+            kind = "mute"
+        elif event["method"] in ("deleteMessage", "deleteMessages"):
+            ids = event.get("message_ids") or [event.get("message_id")]
+            times = [sent[(chat_id, m)] for m in ids if (chat_id, m) in sent]
+            t0 = min(times) if times else None
+            kind = "delete"
+
+        if t0 is not None:
+            latencies.setdefault(kind, []).append(event["t"] - t0)
+
+    return outcomes, latencies
+
+
+async def fetch(args, since):
+    async with httpx.AsyncClient(timeout=60) as client:
+        events = (await client.get(f"{args.api}/_events", params={"since": since})).json()["events"]
+        stats = (await client.get(f"{args.api}/_stats")).json()
+    return events, stats
+
+
+async def run(args):
+    traffic = Traffic(args.groups, args.users, args.skew)
+
+    if args.authorize:
+        authorize(traffic.group_ids)
+
+    since = time.time()
+    sent, by_user, acks, statuses, skipped, elapsed = await send(args, traffic)
+
+    # Let the bot finish in-flight work before reading the call log
+    await asyncio.sleep(args.drain)
+    events, stats = await fetch(args, since)
+    outcomes, latencies = match(events, sent, by_user)
+
+    print(f"Sent:        {len(sent)} in {elapsed:.1f} s ({len(sent) / elapsed:.0f}/s), skipped {skipped}")
+    print("Webhook:     " + ", ".join(f"{s}: {n}" for s, n in sorted(statuses.items(), key=str)))
+    print(f"Ack latency: {latency_line(acks)}")
+
+    for kind in ("reply", "mute", "delete"):
+        print(f"{kind.capitalize() + ':':<12} {len(latencies.get(kind, [])):>6}  {latency_line(latencies.get(kind, []))}")
+
+    print(f"\n{'method':<24} {'status':>6} {'calls':>8}")
+    for (method, status), count in sorted(outcomes.items(), key=str):
+        print(f"{method:<24} {status:>6} {count:>8}")
+
+    if stats.get("throttled") or stats.get("failed"):
+        print(f"\nThrottled: {stats.get('throttled')}")
+        print(f"Failed:    {stats.get('failed')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Webhook load generator")
+    parser.add_argument("--url", default="http://127.0.0.1:10000/webhook")
+    parser.add_argument("--api", default="http://127.0.0.1:8081", help="fake_bot_api.py base URL")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET"))
+    parser.add_argument("--rps", type=float, default=100)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--groups", type=int, default=10)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--skew", type=float, default=1.0, help="0 = every user equally active")
+    parser.add_argument("--max-in-flight", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--drain", type=float, default=5, help="seconds to wait for late actions")
+    parser.add_argument("--authorize", action="store_true", help="insert the synthetic groups into Mongo")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import os
+
+import governor
+import tenants
+
+# ---------------- CONFIG ----------------
+
+LOG_DIGEST_INTERVAL = float(os.getenv("LOG_DIGEST_INTERVAL", 60))
+LOG_DIGEST_MAX = int(os.getenv("LOG_DIGEST_MAX", 50))
+
+# How many individual lines are listed under a collapsed event
+SAMPLE_SIZE = 5
+
+# Telegram rejects messages longer than 4096 characters
+MESSAGE_LIMIT = 4000
+
+DIGEST_LABELS = {
+    "start": "👤 {count} users started the bot",
+    "bot_added": "➕ Bot added to {count} groups"
+}
+
+# ---------------- BUFFER ----------------
+
+# kind (or the raw text for uncategorized logs) -> {"text", "count", "samples"}
+events = tenants.local(dict)
+buffered = tenants.local(lambda: {"count": 0})
+
+
+def _key(kind, text):
+    return kind or text
+
+
+def add(kind, text, sample=None):
+    # Returns True once the buffer reached LOG_DIGEST_MAX events
+    key = _key(kind, text)
+    entry = events.get(key)
+
+    if entry is None:
+        entry = events[key] = {"kind": kind, "text": text, "count": 0, "samples": []}
+
+    entry["count"] += 1
+    if sample and len(entry["samples"]) < SAMPLE_SIZE:
+        entry["samples"].append(sample)
+
+    buffered["count"] += 1
+    return buffered["count"] >= LOG_DIGEST_MAX
+
+
+def _render(entry):
+    # A single event keeps its original wording
+    if entry["count"] == 1:
+        return entry["text"]
+
+    if entry["kind"] in DIGEST_LABELS:
+        lines = [DIGEST_LABELS[entry["kind"]].format(count=entry["count"])]
+        lines += [f"• {s}" for s in entry["samples"]]
+
+        more = entry["count"] - len(entry["samples"])
+        if entry["samples"] and more > 0:
+            lines.append(f"… and {more} more")
+        return "\n".join(lines)
+
+    return f"{entry['text']}\n(×{entry['count']})"
+
+
+def _chunks(entries):
+    # (message text, entries it carries)
+    chunk = ""
+    members = []
+
+    for entry in entries:
+        block = _render(entry)[:MESSAGE_LIMIT]
+        if chunk and len(chunk) + len(block) + 2 > MESSAGE_LIMIT:
+            yield chunk, members
+            chunk = ""
+            members = []
+        chunk = f"{chunk}\n\n{block}" if chunk else block
+        members.append(entry)
+
+    if chunk:
+        yield chunk, members
+
+
+def _restore(entries):
+    # Unsent entries go back into the buffer, merged with anything logged
+    # since. Not counted towards LOG_DIGEST_MAX, so a failing send is
+    # retried by the job instead of on every new event
+    for entry in entries:
+        key = _key(entry["kind"], entry["text"])
+        current = events.get(key)
+
+        if current is None:
+            events[key] = entry
+            continue
+
+        current["count"] += entry["count"]
+        current["samples"] = (entry["samples"] + current["samples"])[:SAMPLE_SIZE]
+
+
+# ---------------- FLUSH ----------------
+
+async def flush(bot, force=False):
+    if not events:
+        return
+
+    # Under heavy load the digest keeps collapsing instead of sending
+    if not force and not governor.allows("log"):
+        return
+
+    pending = list(events.values())
+    events.clear()
+    buffered["count"] = 0
+
+    chunks = list(_chunks(pending))
+    for i, (text, _) in enumerate(chunks):
+        try:
+            await bot.send_message(chat_id=tenants.log_chat_id(), text=text)
+        except Exception as e:
+            print(f"Log digest error: {e}")
+            _restore(entry for _, members in chunks[i:] for entry in members)
+            return
+
+
+async def send_now(bot, text):
+    # Urgent events (restart, breaker, authorizations) skip the digest
+    try:
+        await bot.send_message(chat_id=tenants.log_chat_id(), text=text)
+    except Exception as e:
+        print(f"Log send error: {e}")
+
+
+async def log_digest_job(context):
+    await flush(context.bot)
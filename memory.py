@@ -0,0 +1,296 @@
+import os
+import resource
+import sys
+import time
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from itertools import islice
+
+import bson
+from bson.errors import InvalidDocument
+from pymongo import DeleteOne, UpdateOne
+from telegram import Update
+from telegram.ext import ContextTypes
+
+import metrics
+import mongo_breaker
+import tenants
+from database import spill_col
+
+# ---------------- BOUNDED MEMORY ----------------
+#
+# Every per-user / per-chat structure in the process has a ceiling:
+# module-level maps are LRUDicts (MEM_MAX_USERS), PTB's user_data /
+# chat_data are swept by memory_job (idle for MEM_DATA_TTL or over
+# MEM_MAX_DATA entries are dropped, optionally spilled to Mongo and loaded
+# back on the user's next update). /mem reports sizes per structure.
+
+MEM_MAX_USERS = int(os.getenv("MEM_MAX_USERS", 100000))
+MEM_MAX_DATA = int(os.getenv("MEM_MAX_DATA", 20000))
+MEM_DATA_TTL = float(os.getenv("MEM_DATA_TTL", 3600))
+MEM_SPILL = os.getenv("MEM_SPILL", "0") == "1"
+MEM_SPILL_TTL_DAYS = int(os.getenv("MEM_SPILL_TTL_DAYS", 7))
+MEM_SWEEP_INTERVAL = float(os.getenv("MEM_SWEEP_INTERVAL", 60))
+
+# Entries looked at when estimating bytes per entry
+SIZE_SAMPLE = 200
+
+
+# ---------------- LRU ----------------
+
+class LRUDict(OrderedDict):
+    # get() and assignment mark an entry as recently used. Over max_items
+    # the oldest entries go first, unless can_evict says they must stay
+    # (e.g. counters not yet flushed to Mongo).
+
+    def __init__(self, name, max_items=MEM_MAX_USERS, can_evict=None):
+        super().__init__()
+        self.name = name
+        self.max_items = max_items
+        self.can_evict = can_evict
+
+    def get(self, key, default=None):
+        if key in self:
+            self.move_to_end(key)
+            return self[key]
+        return default
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+
+        if len(self) > self.max_items:
+            self.evict()
+
+    def evict(self):
+        over = len(self) - self.max_items
+        # Bounded scan so pinned entries can't make this O(n) per insert
+        for key in list(islice(self.keys(), over + 32)):
+            if over <= 0:
+                break
+            if self.can_evict and not self.can_evict(self[key]):
+                continue
+
+            del self[key]
+            over -= 1
+            metrics.inc("mem_evicted", structure=self.name)
+
+
+# ---------------- REGISTRY ----------------
+
+# name -> mapping, for /mem
+structures = {}
+
+
+def register(name, mapping):
+    structures[name] = mapping
+    return mapping
+
+
+def lru(name, max_items=MEM_MAX_USERS, can_evict=None):
+    # Per-tenant LRUDict, registered for /mem
+    return register(name, tenants.local(lambda: LRUDict(name, max_items, can_evict)))
+
+
+# ---------------- PTB DATA ----------------
+
+# kind -> {user/chat id: last update time}, only for ids that have data
+last_seen = tenants.local(lambda: {"user": {}, "chat": {}})
+
+# (kind, id) of entries spilled to Mongo
+spilled = lru("spilled_index")
+
+
+def _data(application, kind):
+    return application.user_data if kind == "user" else application.chat_data
+
+
+async def touch(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Runs first for every update (group -2)
+    now = time.monotonic()
+    application = context.application
+
+    for kind, key in (("user", update.effective_user and update.effective_user.id),
+                      ("chat", update.effective_chat and update.effective_chat.id)):
+        if key is None:
+            continue
+
+        if key in _data(application, kind):
+            last_seen[kind][key] = now
+        elif MEM_SPILL and (kind, key) in spilled:
+            restore(context, kind, key)
+
+
+def restore(context, kind, key):
+    del spilled[(kind, key)]
+
+    doc = mongo_breaker.guarded(spill_col.find_one, {"kind": kind, "key": key})
+    if not doc:
+        return
+
+    target = context.user_data if kind == "user" else context.chat_data
+    for field, value in doc.get("data", {}).items():
+        target.setdefault(field, value)
+
+    last_seen[kind][key] = time.monotonic()
+    mongo_breaker.write(spill_col, DeleteOne({"_id": doc["_id"]}))
+    metrics.inc("mem_restored", structure=f"{kind}_data")
+
+
+def spill(kind, key, data):
+    # False when the data can't be stored, the caller then keeps it
+    data = dict(data)
+
+    try:
+        # Checked up front, a bad document must not reach the journal
+        bson.encode({"data": data})
+    except (InvalidDocument, TypeError) as e:
+        print(f"Spill skipped for {kind} {key}: {e}")
+        metrics.inc("mem_spill_failed", structure=f"{kind}_data")
+        return False
+
+    # "expires" carries a TTL index, old spills vanish on their own
+    mongo_breaker.write(spill_col, UpdateOne(
+        {"kind": kind, "key": key},
+        {"$set": {"data": data, "expires": datetime.utcnow() + timedelta(days=MEM_SPILL_TTL_DAYS)}},
+        upsert=True
+    ))
+    spilled[(kind, key)] = True
+    return True
+
+
+def sweep(application, kind):
+    data = _data(application, kind)
+    seen = last_seen[kind]
+    now = time.monotonic()
+
+    drop = []
+    for key in list(data):
+        # Empty dicts are what PTB leaves behind after a plain lookup
+        if not data[key]:
+            drop.append(key)
+            continue
+
+        if key not in seen:
+            seen[key] = now
+        elif now - seen[key] > MEM_DATA_TTL:
+            drop.append(key)
+
+    # Still over the cap: least recently seen first
+    keep = len(data) - len(drop)
+    if keep > MEM_MAX_DATA:
+        dropping = set(drop)
+        oldest = sorted((k for k in data if k not in dropping), key=lambda k: seen[k])
+        drop += oldest[:keep - MEM_MAX_DATA]
+
+    dropped = 0
+    for key in drop:
+        if MEM_SPILL and data[key] and not spill(kind, key, data[key]):
+            continue
+
+        dropped += 1
+        if kind == "user":
+            application.drop_user_data(key)
+        else:
+            application.drop_chat_data(key)
+        seen.pop(key, None)
+
+    # Forget ids whose data PTB no longer has
+    for key in [k for k in seen if k not in data]:
+        del seen[key]
+
+    if dropped:
+        metrics.inc("mem_evicted", value=dropped, structure=f"{kind}_data")
+    return dropped
+
+
+async def memory_job(context: ContextTypes.DEFAULT_TYPE):
+    sweep(context.application, "user")
+    sweep(context.application, "chat")
+
+
+# ---------------- SIZE ESTIMATE ----------------
+
+def deep_size(obj, seen=None):
+    seen = seen if seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(v, seen) for v in obj)
+    elif isinstance(obj, (str, bytes, int, float, array)):
+        pass
+    elif hasattr(obj, "__slots__"):
+        size += sum(deep_size(getattr(obj, s), seen) for s in obj.__slots__ if hasattr(obj, s))
+    elif hasattr(obj, "__dict__"):
+        size += deep_size(vars(obj), seen)
+
+    return size
+
+
+def estimate(mapping):
+    # (entries, bytes per entry) from a sample
+    count = len(mapping)
+    if not count:
+        return 0, 0
+
+    sample = list(islice(mapping.items(), SIZE_SAMPLE))
+    per_entry = sum(deep_size(k) + deep_size(v) for k, v in sample) / len(sample)
+    return count, per_entry
+
+
+def rss_mb():
+    # Current RSS from /proc, peak RSS elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _format_bytes(value):
+    for unit in ["B", "KB", "MB"]:
+        if value < 1024:
+            return f"{value:.0f} {unit}"
+        value /= 1024
+    return f"{value:.1f} GB"
+
+
+# ---------------- COMMAND ----------------
+
+async def mem(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != tenants.owner_id():
+        return
+
+    application = context.application
+    rows = [
+        ("user_data", application.user_data, MEM_MAX_DATA),
+        ("chat_data", application.chat_data, MEM_MAX_DATA)
+    ]
+    rows += [(name, mapping, getattr(mapping, "max_items", None)) for name, mapping in structures.items()]
+
+    lines = [
+        "🧠 Memory\n",
+        f"RSS: {rss_mb():.0f} MB (peak {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB)",
+        f"Data TTL: {MEM_DATA_TTL:.0f}s | Spill: {'on' if MEM_SPILL else 'off'}\n"
+    ]
+
+    total = 0
+    for name, mapping, limit in rows:
+        count, per_entry = estimate(mapping)
+        total += count * per_entry
+
+        cap = f"/{limit}" if limit else ""
+        lines.append(
+            f"• {name}: {count}{cap} × ~{per_entry:.0f} B = {_format_bytes(count * per_entry)}"
+        )
+
+    lines.append(f"\nTracked total: ~{_format_bytes(total)}")
+
+    await update.message.reply_text("\n".join(lines))
@@ -0,0 +1,77 @@
+import tenants
+
+# ---------------- IN-PROCESS METRICS ----------------
+#
+# Tiny registry for counters, gauges and latency summaries. Everything is
+# kept in plain dicts keyed by (name, labels) and rendered as text for the
+# owner-only /metrics command. In multi-tenant mode every series also gets
+# a tenant label and /metrics only shows the caller's own.
+
+counters = {}
+gauges = {}
+summaries = {}
+
+
+def _key(name, labels):
+    if tenants.multi():
+        labels = {**labels, "tenant": tenants.current().name}
+    return (name, tuple(sorted(labels.items())))
+
+
+def visible(labels):
+    return not tenants.multi() or ("tenant", tenants.current().name) in labels
+
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    counters[key] = counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    gauges[_key(name, labels)] = value
+
+
+def observe(name, value, **labels):
+    key = _key(name, labels)
+    summary = summaries.get(key)
+
+    if summary is None:
+        summary = summaries[key] = {"count": 0, "sum": 0.0, "max": 0.0}
+
+    summary["count"] += 1
+    summary["sum"] += value
+    summary["max"] = max(summary["max"], value)
+
+
+def get_summary(name, **labels):
+    return summaries.get(_key(name, labels), {"count": 0, "sum": 0.0, "max": 0.0})
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def render(prefix=None):
+    lines = []
+
+    for (name, labels), value in sorted(counters.items()):
+        if visible(labels) and (not prefix or name.startswith(prefix)):
+            lines.append(f"{name}{_label_text(labels)} {value}")
+
+    for (name, labels), value in sorted(gauges.items()):
+        if visible(labels) and (not prefix or name.startswith(prefix)):
+            lines.append(f"{name}{_label_text(labels)} {value}")
+
+    for (name, labels), summary in sorted(summaries.items()):
+        if not visible(labels) or (prefix and not name.startswith(prefix)):
+            continue
+
+        avg = summary["sum"] / summary["count"] if summary["count"] else 0
+        label_text = _label_text(labels)
+        lines.append(f"{name}_count{label_text} {summary['count']}")
+        lines.append(f"{name}_avg{label_text} {avg:.4f}")
+        lines.append(f"{name}_max{label_text} {summary['max']:.4f}")
+
+    return "\n".join(lines)
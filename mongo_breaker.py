@@ -0,0 +1,292 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from collections import OrderedDict, deque
+
+from pymongo import UpdateOne
+from pymongo.errors import ConnectionFailure
+
+import log_digest
+import metrics
+import tenants
+from database import client, users_counter_col, TenantCollection
+
+# ---------------- MONGO CIRCUIT BREAKER ----------------
+#
+# After MONGO_BREAKER_FAILURES connection errors in a row the breaker opens:
+# handlers stop calling Mongo (no more stacked server-selection timeouts),
+# limits are enforced from cached config and local counters, and writes
+# go to a bounded journal. breaker_job probes Mongo off the event loop and,
+# once it answers, replays the journal in bulk and closes the breaker.
+
+MONGO_BREAKER_FAILURES = int(os.getenv("MONGO_BREAKER_FAILURES", 3))
+MONGO_BREAKER_COOLDOWN = float(os.getenv("MONGO_BREAKER_COOLDOWN", 5))
+MONGO_JOURNAL_MAX = int(os.getenv("MONGO_JOURNAL_MAX", 20000))
+MONGO_FALLBACK_USERS = int(os.getenv("MONGO_FALLBACK_USERS", 50000))
+
+BREAKER_INTERVAL = 1
+REPLAY_BATCH = 1000
+
+# Errors that mean "Mongo is unreachable", not "this query is wrong"
+MONGO_DOWN_ERRORS = (ConnectionFailure,)
+
+# ---------------- STATE ----------------
+
+state = "closed"
+failures = 0
+opened_at = 0.0
+announce = None
+
+# The breaker is per process (one client), the journal and local counters
+# remember which tenant database each write belongs to
+
+# (resolved collection, write op), oldest dropped first when full. The
+# collection keeps its tenant database and profile write concern
+journal = deque()
+dropped = 0
+
+# (database name, user_id, group_id) -> {"day", "count", "pending"} counted while open
+local_counts = {}
+
+# (user_id, group_id) -> last seen user flags, LRU bounded
+user_flags = tenants.local(OrderedDict)
+
+
+def available():
+    return state == "closed"
+
+
+def success():
+    global failures
+    failures = 0
+
+
+def failure(error):
+    global failures, state, opened_at, announce
+
+    failures += 1
+    metrics.inc("mongo_breaker_failures")
+
+    if state == "closed" and failures >= MONGO_BREAKER_FAILURES:
+        state = "open"
+        opened_at = time.monotonic()
+        announce = f"🔴 Mongo unreachable, enforcing from memory\n{type(error).__name__}: {str(error)[:200]}"
+        metrics.inc("mongo_breaker_trips")
+        metrics.set_gauge("mongo_breaker_open", 1)
+        print(f"Mongo breaker open: {error}")
+
+
+def guarded(fn, *args, default=None, **kwargs):
+    # Runs a read through the breaker, default when Mongo is down
+    if state != "closed":
+        return default
+
+    try:
+        result = fn(*args, **kwargs)
+    except MONGO_DOWN_ERRORS as e:
+        failure(e)
+        return default
+
+    success()
+    return result
+
+
+def write(col, op):
+    # Single write op, journaled instead of raising when Mongo is down
+    if state == "closed":
+        try:
+            col.bulk_write([op])
+            success()
+            return
+        except MONGO_DOWN_ERRORS as e:
+            failure(e)
+
+    journal_op(col, op)
+
+
+def journal_op(col, op):
+    global dropped
+
+    if len(journal) >= MONGO_JOURNAL_MAX:
+        journal.popleft()
+        dropped += 1
+        metrics.inc("mongo_journal_dropped")
+
+    if isinstance(col, TenantCollection):
+        col = col.resolve()
+
+    journal.append((col, op))
+    metrics.set_gauge("mongo_journal_size", len(journal))
+
+
+# ---------------- FALLBACK STATE ----------------
+
+def remember(user_id, group_id, flags):
+    key = (user_id, group_id)
+    user_flags[key] = flags
+    user_flags.move_to_end(key)
+
+    if len(user_flags) > MONGO_FALLBACK_USERS:
+        user_flags.popitem(last=False)
+
+
+def flags_for(user_id, group_id):
+    return user_flags.get((user_id, group_id), {})
+
+
+def count_local(user_id, group_id, today):
+    key = (tenants.db_name(), user_id, group_id)
+    entry = local_counts.get(key)
+
+    if not entry or entry["day"] != today:
+        flags = flags_for(user_id, group_id)
+        seen = flags.get("count", 0) if flags.get("day") == today else 0
+        entry = local_counts[key] = {"day": today, "count": seen, "pending": 0}
+
+    entry["count"] += 1
+    entry["pending"] += 1
+    return entry["count"]
+
+
+def counter_ops(user_id, group_id, day, amount, current=True):
+    # One reset + one $inc per user instead of one op per message.
+    # current=False for a day that is already over: added only while the
+    # document is still on that day, a newer count is never reset
+    if not current:
+        return [UpdateOne(
+            {"user_id": user_id, "group_id": group_id, "last_reset": day},
+            {"$inc": {"message_count": amount}}
+        )]
+
+    return [
+        UpdateOne(
+            {"user_id": user_id, "group_id": group_id, "last_reset": {"$ne": day}},
+            {"$set": {"message_count": 0, "last_reset": day}}
+        ),
+        UpdateOne(
+            {"user_id": user_id, "group_id": group_id},
+            {
+                "$setOnInsert": {
+                    "user_id": user_id,
+                    "group_id": group_id,
+                    "extended_limit": None,
+                    "is_special": False,
+                    "rem_until": None,
+                    "last_reset": day
+                },
+                "$inc": {"message_count": amount}
+            },
+            upsert=True
+        )
+    ]
+
+
+# ---------------- RECOVERY ----------------
+
+def probe():
+    try:
+        client.admin.command("ping")
+        return True
+    except MONGO_DOWN_ERRORS:
+        return False
+
+
+def drain_counters(today):
+    # Handlers may still count while this runs in a thread, so only the
+    # amounts actually written are taken off "pending" (of the entry that
+    # was read: count_local replaces it when the day changes)
+    applied = 0
+    entries = [(k, e) for k, e in list(local_counts.items()) if e["pending"]]
+
+    for i in range(0, len(entries), REPLAY_BATCH):
+        chunk = [(k, e, e["pending"]) for k, e in entries[i:i + REPLAY_BATCH]]
+        by_db = {}
+        for (db_name, user_id, group_id), entry, amount in chunk:
+            by_db.setdefault(db_name, []).extend(
+                counter_ops(user_id, group_id, entry["day"], amount, current=entry["day"] == today)
+            )
+
+        for db_name, ops in by_db.items():
+            users_counter_col.resolve(db_name).bulk_write(ops, ordered=True)
+
+        for _, entry, amount in chunk:
+            entry["pending"] -= amount
+        applied += len(chunk)
+
+    return applied
+
+
+def forget_replayed():
+    # Entries still pending (a replay that failed) stay for the next one
+    for key in [k for k, e in local_counts.items() if not e["pending"]]:
+        del local_counts[key]
+
+
+def replay(today):
+    # Runs in a worker thread. Counters first, then the journal in order,
+    # consecutive ops on the same collection go out as one bulk_write.
+    applied = drain_counters(today)
+
+    while journal:
+        target = journal[0][0]
+        batch = []
+        while journal and journal[0][0] is target and len(batch) < REPLAY_BATCH:
+            batch.append(journal.popleft()[1])
+
+        try:
+            target.bulk_write(batch, ordered=True)
+        except MONGO_DOWN_ERRORS:
+            # Put the batch back, the breaker stays open
+            journal.extendleft(reversed([(target, op) for op in batch]))
+            raise
+
+        applied += len(batch)
+
+    metrics.set_gauge("mongo_journal_size", len(journal))
+    return applied
+
+
+async def breaker_job(context):
+    global state, failures, announce, dropped
+
+    if announce:
+        text, announce = announce, None
+        await log_digest.send_now(context.bot, text)
+
+    if state == "closed" or time.monotonic() - opened_at < MONGO_BREAKER_COOLDOWN:
+        return
+
+    if not await asyncio.to_thread(probe):
+        return
+
+    today = datetime.utcnow().date().isoformat()
+
+    try:
+        applied = await asyncio.to_thread(replay, today)
+    except Exception as e:
+        print(f"Journal replay error: {e}")
+        return
+
+    outage = time.monotonic() - opened_at
+    lost = dropped
+
+    state = "closed"
+    failures = 0
+    dropped = 0
+    metrics.set_gauge("mongo_breaker_open", 0)
+    metrics.observe("mongo_outage_seconds", outage)
+
+    # Anything counted while the replay thread ran, handlers are back on
+    # Mongo from here on
+    try:
+        applied += replay(today)
+        forget_replayed()
+    except MONGO_DOWN_ERRORS as e:
+        failure(e)
+
+    text = f"🟢 Mongo back after {outage:.0f}s, replayed {applied} writes"
+    if lost:
+        text += f" ({lost} dropped, journal full)"
+
+    await log_digest.send_now(context.bot, text)
@@ -0,0 +1,223 @@
+import asyncio
+import json
+import os
+
+from pymongo import monitoring
+from telegram import Update
+from telegram.ext import ContextTypes
+
+import metrics
+import mongo_profiles
+import tenants
+
+# ---------------- CONFIG ----------------
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 50))
+EXPLAIN_INTERVAL = float(os.getenv("EXPLAIN_INTERVAL", 30))
+MAX_SHAPES = 500
+
+IGNORED_COMMANDS = {
+    "explain", "getMore", "killCursors", "endSessions", "hello", "isMaster",
+    "ismaster", "ping", "buildInfo", "saslStart", "saslContinue"
+}
+
+# ---------------- STATE ----------------
+
+# (collection, op, shape) -> {"count", "total_ms", "max_ms", "plan", "collscan"}
+shapes = {}
+
+# request_id -> (key, database, command, profile) while a command is in flight
+in_flight = {}
+
+# shapes over SLOW_QUERY_MS waiting for explain() in the background
+explain_queue = {}
+
+
+# ---------------- QUERY SHAPE ----------------
+
+def shape_of(value):
+    # Keep field names and operators, replace every value with its type
+    if isinstance(value, dict):
+        return {k: shape_of(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [shape_of(value[0])] if value else []
+    return type(value).__name__
+
+
+def query_of(name, command):
+    if name == "find":
+        return {"filter": command.get("filter", {}), "sort": command.get("sort")}
+    if name in ("update", "delete"):
+        items = command.get("updates" if name == "update" else "deletes") or [{}]
+        return {"filter": items[0].get("q", {})}
+    if name == "findAndModify":
+        return {"filter": command.get("query", {}), "sort": command.get("sort")}
+    if name == "count":
+        return {"filter": command.get("query", {})}
+    if name == "aggregate":
+        match = [s["$match"] for s in command.get("pipeline", []) if "$match" in s]
+        return {"filter": match[0] if match else {}}
+    return {}
+
+
+# Not accepted inside explain: session fields, and the write / read
+# concern and ordering options of the original command
+EXPLAIN_DROPPED = {"lsid", "txnNumber", "writeConcern", "readConcern", "ordered"}
+
+
+def explainable(name, command):
+    # Explain only needs the command itself
+    clean = {k: v for k, v in command.items() if not k.startswith("$") and k not in EXPLAIN_DROPPED}
+
+    if name == "update":
+        clean["updates"] = clean.get("updates", [])[:1]
+    if name == "delete":
+        clean["deletes"] = clean.get("deletes", [])[:1]
+    return clean
+
+
+# ---------------- LISTENER ----------------
+
+class ProfilerListener(monitoring.CommandListener):
+    def started(self, event):
+        name = event.command_name
+        if name in IGNORED_COMMANDS:
+            return
+
+        collection = event.command.get(name)
+        if not isinstance(collection, str):
+            return
+
+        shape = json.dumps(shape_of(query_of(name, event.command)), sort_keys=True)
+        in_flight[event.request_id] = (
+            (collection, name, shape),
+            event.database_name,
+            event.command if name in ("find", "update", "delete", "findAndModify", "count", "aggregate") else None,
+            mongo_profiles.profile_of(event.command)
+        )
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+    def _finish(self, event):
+        info = in_flight.pop(event.request_id, None)
+        if not info:
+            return
+
+        key, database, command, profile = info
+        ms = event.duration_micros / 1000
+
+        metrics.observe("mongo_profile_seconds", ms / 1000, profile=profile)
+
+        stats = shapes.get(key)
+        if stats is None:
+            if len(shapes) >= MAX_SHAPES:
+                return
+            stats = shapes[key] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "plan": None, "collscan": False}
+
+        stats["count"] += 1
+        stats["total_ms"] += ms
+        stats["max_ms"] = max(stats["max_ms"], ms)
+
+        metrics.observe("mongo_command_seconds", ms / 1000, collection=key[0], op=key[1])
+
+        if ms >= SLOW_QUERY_MS and command is not None and stats["plan"] is None and key not in explain_queue:
+            explain_queue[key] = (database, key[1], command)
+
+
+profiler_listener = ProfilerListener()
+
+
+# ---------------- EXPLAIN ----------------
+
+def plan_stages(plan):
+    # Depth-first list like ["FETCH", "IXSCAN(group_id_1)"]
+    stages = []
+
+    def walk(node):
+        if isinstance(node, dict):
+            if "stage" in node:
+                index = node.get("indexName")
+                stages.append(f"{node['stage']}({index})" if index else node["stage"])
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(plan)
+    return stages
+
+
+def run_explain(database, name, command):
+    from database import client
+
+    result = client[database].command({
+        "explain": explainable(name, command),
+        "verbosity": "queryPlanner"
+    })
+    return plan_stages(result.get("queryPlanner", {}).get("winningPlan", {}))
+
+
+async def explain_job(context: ContextTypes.DEFAULT_TYPE):
+    while explain_queue:
+        key, (database, name, command) = explain_queue.popitem()
+
+        try:
+            stages = await asyncio.to_thread(run_explain, database, name, command)
+        except Exception as e:
+            print(f"Explain error: {e}")
+            stages = ["EXPLAIN_FAILED"]
+
+        stats = shapes.get(key)
+        if stats is None:
+            continue
+
+        stats["plan"] = " > ".join(stages) or "?"
+        stats["collscan"] = any(s.startswith("COLLSCAN") for s in stages)
+
+    metrics.set_gauge("mongo_collscan_shapes", sum(1 for s in shapes.values() if s["collscan"]))
+
+
+# ---------------- REPORT ----------------
+
+def slowest(n):
+    ranked = sorted(
+        shapes.items(),
+        key=lambda item: item[1]["total_ms"] / item[1]["count"],
+        reverse=True
+    )
+    return ranked[:n]
+
+
+async def slow_queries(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != tenants.owner_id():
+        return
+
+    try:
+        n = int(context.args[0]) if context.args else 5
+    except:
+        await update.message.reply_text("Usage: /slow_q [n]")
+        return
+
+    top = slowest(n)
+    if not top:
+        await update.message.reply_text("No queries recorded yet.")
+        return
+
+    lines = ["🐢 Slowest query shapes\n"]
+
+    for (collection, op, shape), stats in top:
+        avg = stats["total_ms"] / stats["count"]
+        flag = " ⚠️ COLLSCAN" if stats["collscan"] else ""
+        lines.append(
+            f"{collection}.{op}{flag}\n"
+            f"{shape}\n"
+            f"avg {avg:.1f} ms | max {stats['max_ms']:.1f} ms | n={stats['count']}\n"
+            f"plan: {stats['plan'] or 'pending'}\n"
+        )
+
+    await update.message.reply_text("\n".join(lines)[:4000])
@@ -0,0 +1,100 @@
+import json
+import os
+
+from pymongo import ReadPreference
+from pymongo.write_concern import WriteConcern
+
+import metrics
+
+# ---------------- DURABILITY / LATENCY PROFILES ----------------
+#
+# Collections are opened per operation class (database.collection(name,
+# profile)) with these options instead of the client defaults:
+#   counter - message counters and rollups: w=1 without waiting for the
+#             journal. MONGO_COUNTER_W=0 makes them unacknowledged, write
+#             errors are then not seen at all
+#   config  - owner commands changing settings: w=majority
+#   report  - reads that may lag (/capacity): secondaryPreferred
+#   fresh   - reads right after counter_buffer.flush() / rollups.flush()
+#             (/stats, /top, /usage, exports): primaryPreferred, so the
+#             just-flushed counts are seen while a primary is up
+# Operations without a profile keep the client defaults.
+
+MONGO_COUNTER_W = os.getenv("MONGO_COUNTER_W", "1")
+MONGO_COUNTER_J = os.getenv("MONGO_COUNTER_J", "0") == "1"
+MONGO_CONFIG_W = os.getenv("MONGO_CONFIG_W", "majority")
+MONGO_CONFIG_WTIMEOUT_MS = int(os.getenv("MONGO_CONFIG_WTIMEOUT_MS", 5000))
+MONGO_REPORT_READ = os.getenv("MONGO_REPORT_READ", "secondaryPreferred")
+MONGO_FRESH_READ = os.getenv("MONGO_FRESH_READ", "primaryPreferred")
+
+READ_MODES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST
+}
+
+
+def _w(value):
+    return int(value) if value.isdigit() else value
+
+
+def _write_concern(w, j=None, wtimeout=None):
+    # j / wtimeout are not allowed with w=0
+    if w == 0:
+        return WriteConcern(w=0)
+    return WriteConcern(w=w, j=j, wtimeout=wtimeout)
+
+
+PROFILES = {
+    "counter": {"write_concern": _write_concern(_w(MONGO_COUNTER_W), j=MONGO_COUNTER_J)},
+    "config": {"write_concern": _write_concern(_w(MONGO_CONFIG_W), wtimeout=MONGO_CONFIG_WTIMEOUT_MS)},
+    "report": {"read_preference": READ_MODES[MONGO_REPORT_READ]},
+    "fresh": {"read_preference": READ_MODES[MONGO_FRESH_READ]}
+}
+
+
+def options(profile):
+    return PROFILES[profile]
+
+
+# ---------------- METRICS ----------------
+
+def _signature(document):
+    return json.dumps(document, sort_keys=True, default=str)
+
+
+# Command writeConcern / $readPreference document -> profile name
+_by_write_concern = {
+    _signature(p["write_concern"].document): name
+    for name, p in PROFILES.items() if "write_concern" in p
+}
+_by_read_mode = {
+    p["read_preference"].mongos_mode: name
+    for name, p in PROFILES.items() if "read_preference" in p
+}
+
+
+def profile_of(command):
+    # Used by the command listener (mongo_profiler) to label latencies
+    write_concern = command.get("writeConcern")
+    if write_concern is not None:
+        return _by_write_concern.get(_signature(write_concern), "other")
+
+    read_preference = command.get("$readPreference")
+    if read_preference is not None:
+        return _by_read_mode.get(read_preference.get("mode"), "other")
+
+    return "default"
+
+
+def publish():
+    # One info gauge per profile, so /metrics shows what is in effect
+    for name, p in PROFILES.items():
+        if "write_concern" in p:
+            metrics.set_gauge("mongo_profile", 1, profile=name, **{
+                k: str(v).lower() for k, v in p["write_concern"].document.items()
+            })
+        else:
+            metrics.set_gauge("mongo_profile", 1, profile=name, read=p["read_preference"].mongos_mode)
@@ -0,0 +1,170 @@
+import asyncio
+import json
+import os
+import resource
+import signal
+
+from telegram import Update
+from telegram.ext import JobQueue
+from tornado.web import Application, RequestHandler
+
+import tenants
+from bot_request import build_requests
+
+# ---------------- MULTI-TENANT MODE ----------------
+#
+# TENANTS_FILE=tenants.json makes app.py host one Application per tenant in
+# this process. All of them share the MongoClient (each tenant has its own
+# database), the Bot API connection pools and one job scheduler. Telegram
+# posts to /webhook/<tenant name>; every update is handled in its tenant's
+# context (tenants.current_tenant), set once before each Application starts
+# so all of its tasks inherit it.
+
+PORT = int(os.environ.get("PORT", 10000))
+RENDER_EXTERNAL_URL = os.getenv("RENDER_EXTERNAL_URL")
+
+
+class TenantJobQueue(JobQueue):
+    # Jobs run from the shared scheduler's own task, not from the tenant's
+    # tasks, so the tenant is set again for every run. Application.stop()
+    # must not shut the shared scheduler down, the runner does it once
+    # with close()
+
+    def __init__(self, tenant, scheduler=None):
+        super().__init__()
+        self.tenant = tenant
+        if scheduler is not None:
+            self.scheduler = scheduler
+
+    @staticmethod
+    async def job_callback(job_queue, job):
+        tenants.activate(job_queue.tenant)
+        await job.run(job_queue.application)
+
+    async def stop(self, wait=True):
+        return
+
+    async def close(self, wait=True):
+        await super().stop(wait)
+
+
+class TenantWebhookHandler(RequestHandler):
+    def initialize(self, applications):
+        self.applications = applications
+
+    async def post(self, name):
+        entry = self.applications.get(name)
+        if entry is None:
+            self.set_status(404)
+            return
+
+        tenant, application = entry
+        if tenant.webhook_secret and self.request.headers.get("X-Telegram-Bot-Api-Secret-Token") != tenant.webhook_secret:
+            self.set_status(403)
+            return
+
+        try:
+            data = json.loads(self.request.body)
+        except ValueError:
+            self.set_status(400)
+            return
+
+        await application.update_queue.put(Update.de_json(data, application.bot))
+        self.set_status(200)
+
+
+def rss_mb():
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# ---------------- LIFECYCLE ----------------
+
+async def _serve(items):
+    import app
+
+    requests = build_requests(shared=True)
+    scheduler = None
+    applications = {}
+    base_rss = rss_mb()
+
+    # Build everything before the shared scheduler starts, it can't be
+    # reconfigured once running
+    for index, tenant in enumerate(items):
+        reset = tenants.activate(tenant)
+        try:
+            job_queue = TenantJobQueue(tenant, scheduler)
+            scheduler = job_queue.scheduler
+
+            applications[tenant.name] = (tenant, app.build_application(
+                process_jobs=index == 0,
+                requests=requests,
+                job_queue=job_queue
+            ))
+        finally:
+            tenants.current_tenant.reset(reset)
+
+    for tenant, application in applications.values():
+        reset = tenants.activate(tenant)
+        try:
+            await application.initialize()
+            await app.post_init(application)
+            await application.start()
+
+            await application.bot.set_webhook(
+                url=f"{RENDER_EXTERNAL_URL}/webhook/{tenant.name}",
+                secret_token=tenant.webhook_secret,
+                drop_pending_updates=True
+            )
+        finally:
+            tenants.current_tenant.reset(reset)
+
+    Application([
+        (r"/webhook/([\w-]+)", TenantWebhookHandler, {"applications": applications})
+    ]).listen(PORT, address="0.0.0.0")
+
+    print(
+        f"{len(applications)} tenants on port {PORT}, "
+        f"RSS {rss_mb():.0f} MB ({(rss_mb() - base_rss) / len(applications):.1f} MB per tenant)"
+    )
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    await stop.wait()
+
+    # Shared scheduler first, so no job runs for a tenant that is already
+    # stopped
+    await job_queue.close()
+
+    # Every tenant stops (and sends its last digest) before the shared
+    # HTTP pools are closed below
+    for tenant, application in applications.values():
+        reset = tenants.activate(tenant)
+        try:
+            await application.stop()
+            await app.post_stop(application)
+        finally:
+            tenants.current_tenant.reset(reset)
+
+    for tenant, application in applications.values():
+        reset = tenants.activate(tenant)
+        try:
+            await application.shutdown()
+            await app.post_shutdown(application)
+        finally:
+            tenants.current_tenant.reset(reset)
+
+    await requests[0].close()
+
+
+def run():
+    items = tenants.load()
+    names = [t.name for t in items]
+
+    if len(set(names)) != len(names):
+        raise ValueError("Tenant names must be unique")
+
+    asyncio.run(_serve(items))
@@ -0,0 +1,153 @@
+import sys
+import time
+from array import array
+from datetime import datetime, timedelta
+
+from bson import Binary
+from pymongo import UpdateOne
+
+import metrics
+import mongo_breaker
+import tenants
+from database import mute_ledger_col
+
+# ---------------- MUTE LEDGER ----------------
+#
+# Remembers which over-limit users were already told and muted, so further
+# messages before the mute ends (or before the day rolls over) don't cause
+# another reply + restrict_chat_member. One Mongo doc per group holds the
+# ledger as packed int64 pairs [user_id, expires_at, ...].
+
+MUTE_LEDGER_FLUSH = 10
+
+# group_id -> {user_id: expires_at (epoch seconds)}
+ledgers = tenants.local(dict)
+dirty = tenants.local(set)
+
+
+def next_midnight():
+    tomorrow = datetime.utcnow().date() + timedelta(days=1)
+    return int((datetime(tomorrow.year, tomorrow.month, tomorrow.day) - datetime(1970, 1, 1)).total_seconds())
+
+
+# ---------------- STORAGE ----------------
+
+def pack(entries):
+    packed = array("q")
+    for user_id, expires in entries.items():
+        packed.append(user_id)
+        packed.append(expires)
+    if sys.byteorder == "big":
+        packed.byteswap()
+
+    return Binary(packed.tobytes())
+
+
+def unpack(data):
+    packed = array("q")
+    packed.frombytes(bytes(data))
+    if sys.byteorder == "big":
+        packed.byteswap()
+
+    return dict(zip(packed[0::2], packed[1::2]))
+
+
+def ledger_for(group_id):
+    # Loaded once per process on first use
+    ledger = ledgers.get(group_id)
+    if ledger is not None:
+        return ledger
+
+    doc = mongo_breaker.guarded(mute_ledger_col.find_one, {"group_id": group_id})
+    ledger = unpack(doc["entries"]) if doc and doc.get("entries") else {}
+
+    # Not cached while Mongo is down, the persisted ledger is read later
+    if doc is not None or mongo_breaker.available():
+        ledgers[group_id] = ledger
+    return ledger
+
+
+# ---------------- LOOKUP ----------------
+
+def active(group_id, user_id):
+    ledger = ledger_for(group_id)
+    expires = ledger.get(user_id)
+
+    if expires is None:
+        return False
+
+    if expires <= time.time():
+        del ledger[user_id]
+        dirty.add(group_id)
+        return False
+
+    metrics.inc("mute_ledger_suppressed")
+    return True
+
+
+def record(group_id, user_id, until=None, wait=None):
+    # until: end of the Telegram mute (datetime, UTC), wait: seconds until
+    # a rolling-window quota frees up. The entry never outlives the day.
+    expires = next_midnight()
+
+    if until is not None:
+        expires = min(expires, int((until - datetime(1970, 1, 1)).total_seconds()))
+    if wait:
+        expires = min(expires, int(time.time()) + wait)
+
+    ledgers.setdefault(group_id, ledger_for(group_id))[user_id] = expires
+    dirty.add(group_id)
+
+
+def clear(group_id, user_id=None):
+    # Limit changed / renewed: next over-limit message is handled fresh
+    ledger = ledger_for(group_id)
+
+    if user_id is None:
+        ledger.clear()
+    else:
+        ledger.pop(user_id, None)
+
+    dirty.add(group_id)
+
+
+# ---------------- PERSIST ----------------
+
+def flush():
+    if not dirty:
+        return 0
+
+    now_ts = time.time()
+    ops = []
+
+    for group_id in list(dirty):
+        ledger = ledgers.get(group_id, {})
+
+        for user_id in [u for u, e in ledger.items() if e <= now_ts]:
+            del ledger[user_id]
+
+        ops.append(UpdateOne(
+            {"group_id": group_id},
+            {"$set": {"entries": pack(ledger), "updated_at": datetime.utcnow()}},
+            upsert=True
+        ))
+
+    dirty.clear()
+
+    if mongo_breaker.available():
+        try:
+            mute_ledger_col.bulk_write(ops, ordered=False)
+            mongo_breaker.success()
+            return len(ops)
+        except mongo_breaker.MONGO_DOWN_ERRORS as e:
+            mongo_breaker.failure(e)
+
+    # Whole-ledger $set, replaying an old one is harmless
+    for op in ops:
+        mongo_breaker.journal_op(mute_ledger_col, op)
+
+    return 0
+
+
+async def mute_ledger_job(context):
+    flush()
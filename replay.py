@@ -0,0 +1,208 @@
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import urlparse
+
+# ---------------- TRAFFIC REPLAY ----------------
+#
+# Feeds a file written by capture.py through the full handler stack
+# (flood filter -> check_force -> track_messages, commands, ...) against a
+# local mongod and fake_bot_api.py, then reports throughput, latency
+# percentiles and Mongo / Bot API calls per update.
+#
+#   python replay.py traffic.jsonl.gz --speed 1
+#   python replay.py traffic.jsonl.gz --speed 0 --fresh --authorize-all
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LOCAL_HOSTS = {"127.0.0.1", "localhost", "::1"}
+
+
+def load(path):
+    meta = {}
+    records = []
+
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            item = json.loads(line)
+            if "meta" in item:
+                meta = item["meta"]
+            else:
+                records.append((item["t"], item["update"]))
+
+    records.sort(key=lambda r: r[0])
+    return meta, records
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Fake Bot API did not start on port {port}")
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def chat_ids(records):
+    ids = set()
+    for _, data in records:
+        for value in data.values():
+            if isinstance(value, dict) and value.get("chat", {}).get("type") in ("group", "supergroup"):
+                ids.add(value["chat"]["id"])
+    return ids
+
+
+def call_counts(name):
+    import metrics
+
+    counts = {}
+    for (metric, labels), summary in metrics.summaries.items():
+        if metric == name:
+            label = "/".join(str(v) for _, v in labels)
+            counts[label] = summary["count"]
+    return counts
+
+
+# ---------------- REPLAY ----------------
+
+async def replay(args, records):
+    import app
+    from database import db, groups_col
+    from telegram import Update
+
+    if args.fresh:
+        for name in db.list_collection_names():
+            if not name.startswith("system."):
+                db[name].drop()
+
+    application = app.build_application()
+    await application.initialize()
+    await app.post_init(application)
+    await application.start()
+
+    if args.authorize_all:
+        for group_id in chat_ids(records):
+            groups_col.update_one(
+                {"group_id": group_id},
+                {"$setOnInsert": {
+                    "group_id": group_id,
+                    "message_limit": 3,
+                    "mute_enabled": 1,
+                    "mute_time": "5m"
+                }},
+                upsert=True
+            )
+
+    mongo_before = sum(call_counts("mongo_command_seconds").values())
+    bot_before = call_counts("bot_api_seconds")
+
+    latencies = []
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async def one(update):
+        async with gate:
+            started = time.perf_counter()
+            await application.process_update(update)
+            latencies.append(time.perf_counter() - started)
+
+    tasks = []
+    first = records[0][0]
+    started = time.monotonic()
+
+    for t, data in records:
+        # --speed 0 = as fast as possible, otherwise keep the captured gaps
+        if args.speed:
+            delay = (t - first) / args.speed - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        tasks.append(asyncio.create_task(one(Update.de_json(data, application.bot))))
+
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - started
+
+    mongo_calls = sum(call_counts("mongo_command_seconds").values()) - mongo_before
+    bot_after = call_counts("bot_api_seconds")
+    bot_calls = {m: n - bot_before.get(m, 0) for m, n in bot_after.items() if n - bot_before.get(m, 0)}
+
+    await application.stop()
+    await app.post_stop(application)
+    await application.shutdown()
+    await app.post_shutdown(application)
+
+    total = len(records)
+    print(f"Updates:     {total}")
+    print(f"Elapsed:     {elapsed:.2f} s")
+    print(f"Throughput:  {total / elapsed:.1f} updates/s")
+    print(
+        "Latency ms:  "
+        f"p50 {percentile(latencies, 50) * 1000:.1f} | "
+        f"p90 {percentile(latencies, 90) * 1000:.1f} | "
+        f"p99 {percentile(latencies, 99) * 1000:.1f} | "
+        f"max {max(latencies) * 1000:.1f}"
+    )
+    print(f"Mongo/update: {mongo_calls / total:.2f}")
+    print(f"Bot API/update: {sum(bot_calls.values()) / total:.2f}")
+    for method, count in sorted(bot_calls.items()):
+        print(f"  {method}: {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured updates through the bot")
+    parser.add_argument("file")
+    parser.add_argument("--speed", type=float, default=1, help="1 = real time, 0 = as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--fresh", action="store_true", help="drop the replay database first")
+    parser.add_argument("--authorize-all", action="store_true", help="authorize every group in the capture")
+    args = parser.parse_args()
+
+    meta, records = load(args.file)
+    if not records:
+        print("Capture file has no updates.")
+        return
+
+    os.environ.setdefault("MONGO_URI", "mongodb://127.0.0.1:27017")
+    os.environ.setdefault("MONGO_DB", "telegram_limit_bot_replay")
+    os.environ["BOT_TOKEN"] = "123:fake"
+    os.environ["OWNER_ID"] = str(meta.get("owner_id", 1))
+    os.environ.setdefault("LOG_CHAT_ID", "1")
+    os.environ["BOT_API_URL"] = f"http://127.0.0.1:{args.api_port}/bot"
+    os.environ.pop("CAPTURE_FILE", None)
+
+    # Never replay into a remote database
+    host = urlparse(os.environ["MONGO_URI"]).hostname
+    if host not in LOCAL_HOSTS:
+        print(f"Refusing to replay against non-local Mongo host {host}")
+        return
+
+    api = subprocess.Popen([
+        sys.executable, os.path.join(HERE, "fake_bot_api.py"),
+        "--port", str(args.api_port),
+        "--latency-ms", str(args.latency_ms)
+    ])
+
+    try:
+        wait_for_port(args.api_port)
+        asyncio.run(replay(args, records))
+    finally:
+        api.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import DeleteOne, UpdateOne
+from telegram import Update
+from telegram.ext import ContextTypes
+
+import config_cache
+import force_sub
+import governor
+import log_digest
+import metrics
+import mongo_breaker
+import tenants
+from database import users_col, force_verified_col, reverify_col
+
+# ---------------- RE-VERIFICATION SWEEP ----------------
+#
+# After /clear_req or a new force channel every active member would be
+# checked on their next message, all at once. With FORCE_VERIFY_TTL set a
+# background sweep walks the group's members in users_col (active in the
+# last REVERIFY_ACTIVE_DAYS, by user_id) and verifies them ahead of time:
+# joined users that already have a force_verified row get it refreshed
+# (check_force then skips the Bot API, see force_sub.is_fresh), the rest
+# lose theirs. Users without a row are left alone, check_force greets
+# them on their first message. Without a TTL nothing reads verified_at
+# and no sweep runs.
+#
+# get_chat_member calls are paced to REVERIFY_RATE per second over
+# REVERIFY_CONCURRENCY workers and the sweep pauses while Mongo is down or
+# the governor sheds optional work. Progress is checkpointed in
+# reverify_sweeps after every page, so a restart resumes where it stopped
+# (reverify_job), and shown by editing the command's reply.
+
+REVERIFY_RATE = float(os.getenv("REVERIFY_RATE", 10))
+REVERIFY_CONCURRENCY = int(os.getenv("REVERIFY_CONCURRENCY", 4))
+REVERIFY_ACTIVE_DAYS = int(os.getenv("REVERIFY_ACTIVE_DAYS", 7))
+REVERIFY_RESUME_INTERVAL = float(os.getenv("REVERIFY_RESUME_INTERVAL", 60))
+
+# Users per page (one checkpoint each)
+PAGE_SIZE = 200
+
+# A sweep not checkpointed for this long is considered dead and resumed
+LEASE_SECONDS = 120
+
+REPORT_INTERVAL = 15
+PAUSE_SECONDS = 5
+
+# group_id -> running asyncio task
+running = tenants.local(dict)
+
+
+class Pacer:
+    # Spaces calls 1/rate apart, shared by all workers of a sweep
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate > 0 else 0
+        self.next_at = 0.0
+
+    async def wait(self, calls=1):
+        now = time.monotonic()
+        start = max(now, self.next_at)
+        self.next_at = start + calls * self.interval
+
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+# ---------------- CONTROL ----------------
+
+def enabled():
+    return force_sub.FORCE_VERIFY_TTL > 0
+
+
+def stop(group_id):
+    # A new run id makes a sweep running in any process stop at its next
+    # checkpoint
+    task = running.pop(group_id, None)
+    if task:
+        task.cancel()
+
+    reverify_col.update_one(
+        {"group_id": group_id, "status": "running"},
+        {"$set": {"run": uuid.uuid4().hex, "status": "cancelled", "updated_at": datetime.utcnow()}}
+    )
+
+
+async def start(bot, group_id, reason, message=None):
+    # Restarts from scratch; a sweep already running for the group stops
+    # at its next checkpoint (different run id)
+    task = running.pop(group_id, None)
+    if task:
+        task.cancel()
+
+    now = datetime.utcnow()
+    reverify_col.update_one(
+        {"group_id": group_id},
+        {"$set": {
+            "run": uuid.uuid4().hex,
+            "status": "running",
+            "reason": reason,
+            "after": None,
+            "checked": 0,
+            "verified": 0,
+            "missing": 0,
+            "started_at": now,
+            "updated_at": now,
+            "report": {"chat_id": message.chat_id, "message_id": message.message_id} if message else None
+        }},
+        upsert=True
+    )
+
+    _spawn(bot, group_id)
+
+
+def _spawn(bot, group_id):
+    task = running[group_id] = asyncio.create_task(sweep(bot, group_id))
+
+    def done(finished):
+        if running.get(group_id) is finished:
+            del running[group_id]
+
+    task.add_done_callback(done)
+
+
+async def reverify_job(context: ContextTypes.DEFAULT_TYPE):
+    # Picks up sweeps whose process died or restarted
+    if not mongo_breaker.available():
+        return
+
+    stale = datetime.utcnow() - timedelta(seconds=LEASE_SECONDS)
+    for state in reverify_col.find({"status": "running", "updated_at": {"$lt": stale}}):
+        if state["group_id"] not in running:
+            print(f"Resuming re-verification for {state['group_id']}")
+            _spawn(context.bot, state["group_id"])
+
+
+# ---------------- SWEEP ----------------
+
+async def _wait_until_allowed(state):
+    while not mongo_breaker.available() or not governor.allows("reverify"):
+        metrics.set_gauge("reverify_paused", 1)
+        await asyncio.sleep(PAUSE_SECONDS)
+
+        # Keeps the lease while paused
+        if mongo_breaker.available():
+            _checkpoint(state)
+
+    metrics.set_gauge("reverify_paused", 0)
+
+
+def _checkpoint(state, **fields):
+    # False once a newer run owns the group
+    result = reverify_col.update_one(
+        {"group_id": state["group_id"], "run": state["run"]},
+        {"$set": {
+            "after": state["after"],
+            "checked": state["checked"],
+            "verified": state["verified"],
+            "missing": state["missing"],
+            "updated_at": datetime.utcnow(),
+            **fields
+        }}
+    )
+    return result.matched_count == 1
+
+
+def _page(group_id, after, since):
+    query = {
+        "group_id": group_id,
+        "last_reset": {"$gte": since},
+        "is_special": {"$ne": True}
+    }
+    if after is not None:
+        query["user_id"] = {"$gt": after}
+
+    return [
+        doc["user_id"]
+        for doc in users_col.find(query, {"user_id": 1}).sort("user_id", 1).limit(PAGE_SIZE)
+    ]
+
+
+async def _check(bot, group_id, user_ids, channels, pacer):
+    # user_id -> True when every channel is joined
+    gate = asyncio.Semaphore(REVERIFY_CONCURRENCY)
+    results = {}
+
+    async def check(user_id):
+        async with gate:
+            await pacer.wait(len(channels))
+            missing = await force_sub.missing_channels(bot, group_id, user_id, channels)
+            results[user_id] = not missing
+
+    await asyncio.gather(*(check(user_id) for user_id in user_ids))
+    return results
+
+
+def _apply(group_id, results):
+    now = datetime.utcnow()
+    ops = [
+        # No upsert: a new row would skip the first-join greeting
+        UpdateOne(
+            {"user_id": user_id, "group_id": group_id},
+            {"$set": {"verified_at": now}}
+        ) if joined else DeleteOne({"user_id": user_id, "group_id": group_id})
+        for user_id, joined in results.items()
+    ]
+
+    if ops:
+        force_verified_col.bulk_write(ops, ordered=False)
+
+
+def _progress_text(state, done=False):
+    head = "✅ Re-verification finished" if done else "🔄 Re-verifying members…"
+    return (
+        f"{head}\n\n"
+        f"Checked: {state['checked']}\n"
+        f"Joined all channels: {state['verified']}\n"
+        f"Not joined: {state['missing']}"
+    )
+
+
+async def _report(bot, state, done=False):
+    report = state.get("report")
+    if not report:
+        return
+
+    try:
+        await bot.edit_message_text(
+            chat_id=report["chat_id"],
+            message_id=report["message_id"],
+            text=_progress_text(state, done)
+        )
+    except Exception as e:
+        print(f"Re-verification report error: {e}")
+
+
+async def sweep(bot, group_id):
+    try:
+        await _run(bot, group_id)
+    except mongo_breaker.MONGO_DOWN_ERRORS as e:
+        # Checkpoint stays "running", reverify_job resumes it
+        mongo_breaker.failure(e)
+        print(f"Re-verification for {group_id} interrupted: {e}")
+
+
+async def _run(bot, group_id):
+    state = reverify_col.find_one({"group_id": group_id})
+    if not state or state["status"] != "running":
+        return
+
+    since = (datetime.utcnow().date() - timedelta(days=REVERIFY_ACTIVE_DAYS)).isoformat()
+    pacer = Pacer(REVERIFY_RATE)
+    reported = time.monotonic()
+
+    while True:
+        await _wait_until_allowed(state)
+
+        config = config_cache.get_force_config(group_id)
+        channels = config_cache.get_channels(group_id)
+        if not config or not config.get("enabled") or not channels:
+            break
+
+        user_ids = await asyncio.to_thread(_page, group_id, state["after"], since)
+        if not user_ids:
+            break
+
+        owner = tenants.owner_id()
+        results = await _check(bot, group_id, [u for u in user_ids if u != owner], channels, pacer)
+        await asyncio.to_thread(_apply, group_id, results)
+
+        verified = sum(results.values())
+        state["after"] = user_ids[-1]
+        state["checked"] += len(results)
+        state["verified"] += verified
+        state["missing"] += len(results) - verified
+        metrics.inc("reverify_checked", value=len(results))
+
+        if not _checkpoint(state):
+            return
+
+        if time.monotonic() - reported >= REPORT_INTERVAL:
+            reported = time.monotonic()
+            await _report(bot, state)
+
+    if not _checkpoint(state, status="done", finished_at=datetime.utcnow()):
+        return
+
+    await _report(bot, state, done=True)
+    log_digest.add(
+        None,
+        f"🔄 Re-verification for {group_id} ({state['reason']}): "
+        f"{state['checked']} checked, {state['verified']} joined, {state['missing']} not joined"
+    )
+
+
+# ---------------- COMMAND ----------------
+
+async def reverify_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != tenants.owner_id():
+        return
+
+    if update.effective_chat.type == "private":
+        await update.message.reply_text("Use this command inside a group.")
+        return
+
+    if not enabled():
+        await update.message.reply_text(
+            "Background re-verification needs FORCE_VERIFY_TTL.\n"
+            "Members are checked on their next message."
+        )
+        return
+
+    msg = await update.message.reply_text("🔄 Re-verifying members…")
+    await start(context.bot, update.effective_chat.id, "/reverify", msg)
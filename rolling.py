@@ -0,0 +1,98 @@
+import sys
+from array import array
+
+from bson import Binary
+
+# ---------------- ROLLING WINDOW QUOTA ----------------
+#
+# Every user keeps the timestamps (epoch seconds) of their last N counted
+# requests in a fixed-size ring, N being their limit. The slot at `head`
+# always holds the oldest timestamp, so "is the quota used up" is a single
+# comparison. Stored in Mongo as packed uint32 values: [head, slot0, ...].
+
+LIMIT_MODES = ["daily", "rolling"]
+DEFAULT_WINDOW = "24h"
+
+
+class TimestampRing:
+    def __init__(self, size, slots=None, head=0):
+        self.size = max(size, 1)
+        self.slots = slots if slots is not None else array("I", [0] * self.size)
+        self.head = head
+
+    # ---------------- STORAGE ----------------
+
+    @classmethod
+    def load(cls, data, size):
+        if not data:
+            return cls(size)
+
+        packed = array("I")
+        packed.frombytes(bytes(data))
+        if sys.byteorder == "big":
+            packed.byteswap()
+
+        ring = cls(len(packed) - 1, packed[1:], packed[0] % max(len(packed) - 1, 1))
+
+        if ring.size != max(size, 1):
+            ring = ring.resized(size)
+
+        return ring
+
+    def dump(self):
+        packed = array("I", [self.head])
+        packed.extend(self.slots)
+        if sys.byteorder == "big":
+            packed.byteswap()
+
+        return Binary(packed.tobytes())
+
+    def resized(self, size):
+        # Keep the most recent timestamps, oldest first
+        ordered = [t for t in self.timestamps() if t]
+        size = max(size, 1)
+        ordered = ordered[-size:]
+
+        slots = array("I", ordered + [0] * (size - len(ordered)))
+        return TimestampRing(size, slots, len(ordered) % size)
+
+    # ---------------- QUERIES ----------------
+
+    def timestamps(self):
+        return [self.slots[(self.head + i) % self.size] for i in range(self.size)]
+
+    def count(self, now_ts, window):
+        return sum(1 for t in self.slots if t and now_ts - t < window)
+
+    def next_free(self, now_ts, window):
+        oldest = self.slots[self.head]
+        if not oldest or now_ts - oldest >= window:
+            return 0
+        return oldest + window - now_ts
+
+    # ---------------- UPDATE ----------------
+
+    def hit(self, now_ts, window):
+        # Returns "over" (not recorded), "last" (recorded, quota now full)
+        # or "ok" (recorded, quota left)
+        if self.next_free(now_ts, window):
+            return "over"
+
+        self.slots[self.head] = now_ts
+        self.head = (self.head + 1) % self.size
+
+        if self.next_free(now_ts, window):
+            return "last"
+        return "ok"
+
+
+def format_wait(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes = rest // 60
+
+    if hours:
+        return f"{hours}h {minutes}m"
+    if minutes:
+        return f"{minutes}m"
+    return f"{seconds}s"
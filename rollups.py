@@ -0,0 +1,143 @@
+import os
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+from telegram import Update
+from telegram.ext import ContextTypes
+
+import mongo_breaker
+import mongo_profiles
+import tenants
+from database import db, rollups_col, rollups_fresh_col
+
+# ---------------- CONFIG ----------------
+
+ROLLUP_FLUSH_INTERVAL = float(os.getenv("ROLLUP_FLUSH_INTERVAL", 60))
+ROLLUP_TIMESERIES = os.getenv("ROLLUP_TIMESERIES", "0") == "1"
+TIMESERIES_NAME = "usage_ts"
+
+FIELDS = ["requests", "unique_users", "limit_hits", "mutes", "force_blocks", "flood_mutes"]
+
+# ---------------- STATE ----------------
+
+# (group_id, day) -> {field: increment}
+pending = tenants.local(dict)
+
+
+def record(group_id, field, amount=1):
+    key = (group_id, datetime.utcnow().date().isoformat())
+    counts = pending.get(key)
+
+    if counts is None:
+        counts = pending[key] = {}
+
+    counts[field] = counts.get(field, 0) + amount
+
+
+# ---------------- FLUSH ----------------
+
+def ensure_timeseries():
+    if not ROLLUP_TIMESERIES or TIMESERIES_NAME in db.list_collection_names():
+        return
+
+    db.create_collection(
+        TIMESERIES_NAME,
+        timeseries={"timeField": "ts", "metaField": "group_id", "granularity": "hours"}
+    )
+
+
+def flush():
+    if not pending:
+        return 0
+
+    batch = dict(pending)
+    pending.clear()
+
+    ops = [
+        UpdateOne(
+            {"group_id": group_id, "day": day},
+            {"$inc": counts},
+            upsert=True
+        )
+        for (group_id, day), counts in batch.items()
+    ]
+
+    try:
+        rollups_col.bulk_write(ops, ordered=False)
+    except Exception as e:
+        print(f"Rollup flush error: {e}")
+
+        # Merge back so the next flush retries
+        for key, counts in batch.items():
+            for field, amount in counts.items():
+                target = pending.setdefault(key, {})
+                target[field] = target.get(field, 0) + amount
+        return 0
+
+    if ROLLUP_TIMESERIES:
+        ts = datetime.utcnow()
+        try:
+            db[TIMESERIES_NAME].with_options(**mongo_profiles.options("counter")).insert_many([
+                {"ts": ts, "group_id": group_id, "day": day, **counts}
+                for (group_id, day), counts in batch.items()
+            ], ordered=False)
+        except Exception as e:
+            print(f"Rollup time-series error: {e}")
+
+    return len(ops)
+
+
+async def rollup_flush_job(context: ContextTypes.DEFAULT_TYPE):
+    # Counts stay pending while Mongo is down
+    if mongo_breaker.available():
+        flush()
+
+
+# ---------------- REPORT ----------------
+
+async def usage(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != tenants.owner_id():
+        return
+
+    try:
+        days = int(context.args[0]) if context.args else 7
+    except:
+        await update.message.reply_text("Usage: /usage [days]")
+        return
+
+    days = min(max(days, 1), 365)
+    group_id = update.effective_chat.id
+    since = (datetime.utcnow().date() - timedelta(days=days - 1)).isoformat()
+
+    # Pending increments belong in the report too
+    flush()
+
+    docs = list(rollups_fresh_col.find(
+        {"group_id": group_id, "day": {"$gte": since}},
+        {"_id": 0}
+    ).sort("day", 1))
+
+    if not docs:
+        await update.message.reply_text("No usage recorded for this group yet.")
+        return
+
+    totals = {field: sum(d.get(field, 0) for d in docs) for field in FIELDS}
+
+    lines = [
+        f"📈 Usage – last {days} days\n",
+        f"Requests: {totals['requests']}",
+        f"Unique requesters (sum of daily): {totals['unique_users']}",
+        f"Limit reached: {totals['limit_hits']}",
+        f"Mutes: {totals['mutes']} (+{totals['flood_mutes']} flood)",
+        f"Force-sub blocks: {totals['force_blocks']}\n",
+        "day | req | users | mutes | blocks"
+    ]
+
+    # Newest days only, the totals above cover the whole range
+    for d in docs[-14:]:
+        lines.append(
+            f"{d['day']} | {d.get('requests', 0)} | {d.get('unique_users', 0)} | "
+            f"{d.get('mutes', 0)} | {d.get('force_blocks', 0)}"
+        )
+
+    await update.message.reply_text("\n".join(lines))
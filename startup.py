@@ -0,0 +1,253 @@
+import asyncio
+import os
+import signal
+import time
+from contextlib import asynccontextmanager
+
+import cache_bus
+import config_cache
+import ingress
+import log_digest
+import metrics
+import mongo_breaker
+import mongo_profiles
+import rollups
+from database import connect, ensure_indexes, groups_col, force_config_col, force_channels_col
+from force_sub import release_expired
+
+# ---------------- COLD START ----------------
+#
+# Single-process startup pipeline (app.main), instead of run_webhook's
+# initialize -> post_init -> set_webhook -> start chain:
+#   * Mongo connects and builds its indexes in threads while PTB sets up
+#     its HTTP client and registers the webhook;
+#   * the webhook listens as soon as it is registered (with
+#     WEBHOOK_INGRESS=asgi before anything else, see ingress.py), updates
+#     wait in application.update_queue until the Application starts;
+#   * config caches (groups, force config/channels, admins) and force-sub
+#     mutes that expired while the bot was down are warmed concurrently;
+#   * every phase is timed: printed, startup_ms{phase=...} in /metrics;
+#   * when Mongo is down at start, indexes, the cache bus and the warm-up
+#     are retried every STARTUP_MONGO_RETRY seconds until they succeed.
+
+STARTUP_WARM_MAX = int(os.getenv("STARTUP_WARM_MAX", 5000))
+STARTUP_WARM_TIMEOUT = float(os.getenv("STARTUP_WARM_TIMEOUT", 15))
+STARTUP_MONGO_RETRY = float(os.getenv("STARTUP_MONGO_RETRY", 30))
+
+# phase -> ms
+timings = {}
+
+
+@asynccontextmanager
+async def phase(name):
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        record(name, (time.monotonic() - started) * 1000)
+
+
+def record(name, ms):
+    timings[name] = ms
+    metrics.set_gauge("startup_ms", round(ms, 1), phase=name)
+    print(f"Startup {name}: {ms:.0f} ms")
+
+
+def process_age():
+    # Seconds since the process started: interpreter, imports, build_application
+    try:
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        with open("/proc/self/stat") as f:
+            started = int(f.read().rsplit(")", 1)[1].split()[19])
+        return uptime - started / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# ---------------- MONGO ----------------
+
+async def prepare_mongo():
+    # False when Mongo is unreachable: the bot still starts, the breaker
+    # serves from memory and the warm-ups are skipped
+    mongo_profiles.publish()
+
+    try:
+        async with phase("mongo_connect"):
+            await asyncio.to_thread(connect)
+
+        async with phase("mongo_indexes"):
+            await asyncio.gather(
+                asyncio.to_thread(ensure_indexes),
+                asyncio.to_thread(rollups.ensure_timeseries)
+            )
+
+        cache_bus.start()
+        return True
+    except mongo_breaker.MONGO_DOWN_ERRORS as e:
+        mongo_breaker.failure(e)
+        print(f"Startup: Mongo unavailable, warm-up skipped: {e}")
+    except Exception as e:
+        print(f"Startup Mongo error: {e}")
+
+    return False
+
+
+async def mongo_retry_job(context):
+    # Scheduled by retry_mongo, removes itself once Mongo is prepared
+    if not await prepare_mongo():
+        return
+
+    context.job.schedule_removal()
+    print("Startup: Mongo reachable again, indexes and caches ready")
+    await warm_up(context.bot, unmutes=context.job.data["unmutes"])
+
+
+def retry_mongo(application, unmutes=True):
+    application.job_queue.run_repeating(
+        mongo_retry_job,
+        interval=STARTUP_MONGO_RETRY,
+        first=STARTUP_MONGO_RETRY,
+        name="mongo_retry",
+        data={"unmutes": unmutes}
+    )
+
+
+# ---------------- WARM-UP ----------------
+
+def _warm_groups():
+    docs = list(groups_col.find({}).limit(STARTUP_WARM_MAX))
+    for doc in docs:
+        config_cache.prime("group", doc["group_id"], doc)
+    return len(docs)
+
+
+def _warm_force():
+    configs = list(force_config_col.find({}).limit(STARTUP_WARM_MAX))
+
+    channels = {}
+    for doc in force_channels_col.find({"active": True}).limit(STARTUP_WARM_MAX):
+        channels.setdefault(doc["group_id"], []).append(doc)
+
+    for doc in configs:
+        config_cache.prime("force_config", doc["group_id"], doc)
+        # A configured group without channels is cached as such too
+        config_cache.prime("channels", doc["group_id"], channels.pop(doc["group_id"], []))
+
+    for group_id, docs in channels.items():
+        config_cache.prime("channels", group_id, docs)
+    return len(configs)
+
+
+def _warm_admins():
+    return len(config_cache.get("admins", None))
+
+
+async def _warm(name, coroutine):
+    try:
+        async with phase(f"warm_{name}"):
+            count = await coroutine
+        metrics.set_gauge("startup_warmed", count, kind=name)
+    except Exception as e:
+        print(f"Startup warm-up {name} failed: {e}")
+
+
+async def warm_up(bot, unmutes=True):
+    items = {
+        "groups": asyncio.to_thread(_warm_groups),
+        "force": asyncio.to_thread(_warm_force),
+        "admins": asyncio.to_thread(_warm_admins)
+    }
+    if unmutes:
+        items["unmutes"] = release_expired(bot, limit=STARTUP_WARM_MAX)
+
+    async with phase("warm_up"):
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(_warm(name, c) for name, c in items.items())),
+                STARTUP_WARM_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            # Whatever is left is loaded lazily on first use
+            print(f"Startup warm-up cut off after {STARTUP_WARM_TIMEOUT:.0f}s")
+
+
+async def announce(bot):
+    text = "🚀 Bot restarted successfully."
+    if "ready" in timings:
+        text += f"\nReady in {timings['ready'] / 1000:.1f}s"
+
+    await log_digest.send_now(bot, text)
+
+
+# ---------------- SERVE ----------------
+
+async def serve(application, port, url_path, webhook_url, secret_token):
+    age = process_age()
+    if age is not None:
+        record("boot", age * 1000)
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    started = time.monotonic()
+    mongo = asyncio.create_task(prepare_mongo())
+
+    # The ASGI ingress needs nothing from PTB or Mongo, it listens first
+    front = None
+    if ingress.enabled():
+        async with phase("ingress"):
+            front = ingress.Ingress(application, f"/{url_path}", secret_token)
+            await front.start(port)
+
+    async with phase("bot_initialize"):
+        await application.initialize()
+
+    async with phase("webhook"):
+        if front:
+            await application.bot.set_webhook(
+                url=webhook_url,
+                secret_token=secret_token,
+                drop_pending_updates=True
+            )
+        else:
+            await application.updater.start_webhook(
+                listen="0.0.0.0",
+                port=port,
+                url_path=url_path,
+                webhook_url=webhook_url,
+                secret_token=secret_token,
+                drop_pending_updates=True
+            )
+
+    if await mongo:
+        await warm_up(application.bot)
+    else:
+        retry_mongo(application)
+
+    # Updates received so far are processed from here on
+    async with phase("application_start"):
+        await application.start()
+
+    record("ready", (time.monotonic() - started) * 1000)
+    await announce(application.bot)
+
+    # SIGTERM / SIGINT stay with this loop (the ingress serves on its own
+    # thread); the ingress exiting on its own stops the bot too
+    stopping = asyncio.create_task(stop.wait())
+    await asyncio.wait([stopping] + ([front.task] if front else []), return_when=asyncio.FIRST_COMPLETED)
+    stopping.cancel()
+
+    if front:
+        await front.stop()
+    if application.updater.running:
+        await application.updater.stop()
+    await application.stop()
+    if application.post_stop:
+        await application.post_stop(application)
+
+    await application.shutdown()
+    if application.post_shutdown:
+        await application.post_shutdown(application)
@@ -0,0 +1,136 @@
+import contextvars
+import json
+import os
+
+# ---------------- TENANTS ----------------
+#
+# One process can host several bots (TENANTS_FILE, see multi_tenant.py).
+# The tenant of the running handler / job lives in a contextvar: database
+# collections resolve to its database, OWNER_ID / LOG_CHAT_ID come from
+# it, and in-memory state wrapped in TenantLocal is kept per tenant.
+# Without TENANTS_FILE there is one "default" tenant built from the env.
+#
+# Tenants file (JSON list):
+#   [{"name": "movies", "bot_token": "...", "owner_id": 1, "log_chat_id": -100...,
+#     "mongo_db": "limit_movies", "webhook_secret": "..."}, ...]
+
+TENANTS_FILE = os.getenv("TENANTS_FILE")
+
+
+class Tenant:
+    def __init__(self, name, bot_token, owner_id, log_chat_id, mongo_db, webhook_secret=None):
+        self.name = name
+        self.bot_token = bot_token
+        self.owner_id = int(owner_id)
+        self.log_chat_id = int(log_chat_id)
+        self.mongo_db = mongo_db
+        self.webhook_secret = webhook_secret
+
+
+def _env_int(name):
+    value = os.getenv(name)
+    return int(value) if value else 0
+
+
+DEFAULT = Tenant(
+    "default",
+    os.getenv("BOT_TOKEN"),
+    _env_int("OWNER_ID"),
+    _env_int("LOG_CHAT_ID"),
+    os.getenv("MONGO_DB", "telegram_limit_bot"),
+    os.getenv("WEBHOOK_SECRET")
+)
+
+current_tenant = contextvars.ContextVar("tenant", default=DEFAULT)
+
+
+def load(path=TENANTS_FILE):
+    with open(path, encoding="utf-8") as f:
+        items = json.load(f)
+
+    return [
+        Tenant(
+            item["name"],
+            item["bot_token"],
+            item["owner_id"],
+            item["log_chat_id"],
+            item.get("mongo_db") or f"telegram_limit_bot_{item['name']}",
+            item.get("webhook_secret")
+        )
+        for item in items
+    ]
+
+
+def multi():
+    return bool(TENANTS_FILE)
+
+
+# ---------------- CURRENT ----------------
+
+def current():
+    return current_tenant.get()
+
+
+def activate(tenant):
+    # Tasks created after this inherit the tenant
+    return current_tenant.set(tenant)
+
+
+def owner_id():
+    return current_tenant.get().owner_id
+
+
+def log_chat_id():
+    return current_tenant.get().log_chat_id
+
+
+def db_name():
+    return current_tenant.get().mongo_db
+
+
+# ---------------- PER-TENANT STATE ----------------
+
+class TenantLocal:
+    # Stands in for a module-level dict / set / deque and forwards to the
+    # current tenant's own instance, so call sites stay unchanged
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.values = {}
+
+    def value(self):
+        name = current_tenant.get().name
+        value = self.values.get(name)
+
+        if value is None:
+            value = self.values[name] = self.factory()
+        return value
+
+    def __getattr__(self, attr):
+        return getattr(self.value(), attr)
+
+    def __getitem__(self, key):
+        return self.value()[key]
+
+    def __setitem__(self, key, item):
+        self.value()[key] = item
+
+    def __delitem__(self, key):
+        del self.value()[key]
+
+    def __contains__(self, key):
+        return key in self.value()
+
+    def __iter__(self):
+        return iter(self.value())
+
+    def __len__(self):
+        return len(self.value())
+
+    def __bool__(self):
+        return bool(self.value())
+
+
+def local(factory):
+    # Plain object for a single bot, per-tenant proxy otherwise
+    return TenantLocal(factory) if multi() else factory()
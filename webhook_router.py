@@ -0,0 +1,189 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import signal
+
+from tornado.web import Application, RequestHandler
+
+import capture
+
+# ---------------- MULTI-PROCESS WEBHOOK ----------------
+#
+# WEBHOOK_WORKERS=N makes app.py start this router instead of run_webhook.
+# The router owns the public /webhook endpoint and hands every raw update to
+# one of N worker processes, chosen by chat id. Each worker runs its own
+# Application, so per-group in-memory state (counters, flood trackers,
+# rollups) stays in a single process and keeps arrival order.
+
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+PORT = int(os.environ.get("PORT", 10000))
+RENDER_EXTERNAL_URL = os.getenv("RENDER_EXTERNAL_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+BOT_API_URL = os.getenv("BOT_API_URL")
+
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", 10000))
+
+CHAT_FIELDS = [
+    "message", "edited_message", "channel_post", "edited_channel_post",
+    "my_chat_member", "chat_member", "chat_join_request"
+]
+
+
+# ---------------- ROUTING ----------------
+
+def route_key(data):
+    for field in CHAT_FIELDS:
+        obj = data.get(field)
+        if obj and "chat" in obj:
+            return obj["chat"]["id"]
+
+    callback = data.get("callback_query")
+    if callback:
+        message = callback.get("message")
+        if message and "chat" in message:
+            return message["chat"]["id"]
+        return callback["from"]["id"]
+
+    # Inline queries, polls, ... fall back to the sender
+    for value in data.values():
+        if isinstance(value, dict) and "from" in value:
+            return value["from"]["id"]
+
+    return data.get("update_id", 0)
+
+
+def worker_for(data, workers):
+    return route_key(data) % workers
+
+
+class WebhookHandler(RequestHandler):
+    def initialize(self, queues):
+        self.queues = queues
+
+    def post(self):
+        if WEBHOOK_SECRET and self.request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            self.set_status(403)
+            return
+
+        try:
+            data = json.loads(self.request.body)
+        except ValueError:
+            self.set_status(400)
+            return
+
+        capture.record(data)
+
+        try:
+            self.queues[worker_for(data, len(self.queues))].put_nowait(self.request.body)
+        except queue.Full:
+            # Telegram redelivers on non-2xx answers
+            self.set_status(503)
+            return
+
+        self.set_status(200)
+
+
+# ---------------- WORKER ----------------
+
+def worker_main(index, updates):
+    asyncio.run(_worker(index, updates))
+
+
+async def _worker(index, updates):
+    import app
+    from telegram import Update
+
+    # The router already captured the raw update
+    capture.disable()
+
+    application = app.build_application(global_jobs=index == 0)
+
+    await application.initialize()
+    if index == 0:
+        await app.post_init(application)
+    else:
+        # Config writes in one worker must reach the caches of the others
+        # (cache bus), retried like worker 0 while Mongo is down; expired
+        # mutes are released by worker 0 only
+        if await app.startup.prepare_mongo():
+            await app.startup.warm_up(application.bot, unmutes=False)
+        else:
+            app.startup.retry_mongo(application, unmutes=False)
+    await application.start()
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    def next_update():
+        # Short timeout so the executor thread notices shutdown
+        try:
+            return updates.get(timeout=1)
+        except queue.Empty:
+            return b""
+
+    while not stop.is_set():
+        raw = await loop.run_in_executor(None, next_update)
+
+        if raw is None:
+            break
+        if not raw:
+            continue
+
+        await application.update_queue.put(Update.de_json(json.loads(raw), application.bot))
+
+    await application.stop()
+    await app.post_stop(application)
+    await application.shutdown()
+    await app.post_shutdown(application)
+
+
+# ---------------- FRONT-END ----------------
+
+async def _front(queues):
+    from telegram import Bot
+
+    kwargs = {"base_url": BOT_API_URL} if BOT_API_URL else {}
+    async with Bot(BOT_TOKEN, **kwargs) as bot:
+        await bot.set_webhook(
+            url=f"{RENDER_EXTERNAL_URL}/webhook",
+            secret_token=WEBHOOK_SECRET,
+            drop_pending_updates=True
+        )
+
+    Application([(r"/webhook", WebhookHandler, {"queues": queues})]).listen(PORT, address="0.0.0.0")
+    print(f"Webhook router on port {PORT} with {len(queues)} workers")
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    await stop.wait()
+
+
+def run(workers):
+    # spawn: every worker builds its own MongoClient and HTTP pools
+    ctx = multiprocessing.get_context("spawn")
+    queues = [ctx.Queue(WORKER_QUEUE_SIZE) for _ in range(workers)]
+    processes = [
+        ctx.Process(target=worker_main, args=(i, queues[i]), name=f"worker-{i}")
+        for i in range(workers)
+    ]
+
+    for process in processes:
+        process.start()
+
+    try:
+        asyncio.run(_front(queues))
+    finally:
+        capture.close()
+        for q in queues:
+            q.put(None)
+        for process in processes:
+            process.join(timeout=15)
+            if process.is_alive():
+                process.terminate()